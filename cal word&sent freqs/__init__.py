@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The confcall package: word & sent freqs of the conf call transcripts, and
+the stages that aggregate them to panel data (raw2panel). The cross data
+folder is its subpackage confcall.cross. Install with pip install -e .
+from the project root, then run a module as python -m confcall.<module>.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
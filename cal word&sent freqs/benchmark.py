@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Benchmark the stages of the project on synthetic inputs (synthetic_corpus)
+at several corpus sizes and job counts. Every stage runs in a fresh process,
+so its peak RSS is its own; the peak RSS of the joblib workers is reported
+separately. The results are appended to a CSV under a version label, so two
+versions can be compared.
+
+Stages: wf (WordFreq), sf (SentFreq), wsf (WordSentFreq), raw2panel
+(Raw2Panel.reshape) and panel2cross (panel2cross.exe). The job counts only
+apply to wf, sf and wsf.
+
+Run as a script:
+    python benchmark.py run <work_path> [--sizes 200 1000] [--jobs 1 4] [--stages wf sf] [--label v1] [--results benchmark_results.csv]
+    python benchmark.py compare <results_csv> <base_label> <new_label>
+
+CONTENT
+-------
+- <FUNC> run_stage
+- <FUNC> run_benchmark
+- <FUNC> save_results
+- <FUNC> compare_results
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import sys
+import time
+import resource
+import argparse
+import subprocess
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from confcall.synthetic_corpus import make_all
+from confcall.transcript_catalog import TranscriptCatalog
+
+COUNT_STAGES = ["wf", "sf", "wsf"]
+PANEL_STAGES = ["raw2panel", "panel2cross"]
+
+RESULT_COLUMNS = ["label", "timestamp", "stage", "size", "num_job", "seconds", "transcripts", "transcripts_per_sec",
+                  "sentences", "sentences_per_sec", "peak_rss_mb", "peak_worker_rss_mb"]
+
+def _peak_rss_mb(who):
+    # ru_maxrss is in KiB on linux, in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+def run_stage(stage: str, paths: dict, num_job: int = 1):
+    '''
+    A func to run and time one stage in the current process
+
+    Parameters
+    ----------
+    stage: str
+        One of COUNT_STAGES + PANEL_STAGES
+    paths: dict
+        Output of synthetic_corpus.make_all
+    num_job: int
+        Number of worker processes of the count stages
+
+    Returns
+    -------
+    result: dict
+        seconds, transcripts, sentences (None for wf and the panel stages),
+        peak_rss_mb and peak_worker_rss_mb
+
+    '''
+    sentences = None
+    start = time.perf_counter()
+    if stage in COUNT_STAGES:
+        if stage == "wf":
+            from confcall.cal_wf import WordFreq
+            engine = WordFreq(paths["panel_data_path"], paths["processed_all_year_path"], paths["moral_dict_path"],
+                              os.path.dirname(paths["panel_data_path"]))
+        elif stage == "sf":
+            from confcall.cal_sf import SentFreq
+            engine = SentFreq(paths["panel_data_path"], paths["processed_all_year_path"], paths["moral_dict_path"])
+        else:
+            from confcall.cal_wsf import WordSentFreq
+            engine = WordSentFreq(paths["panel_data_path"], paths["processed_all_year_path"], paths["moral_dict_path"])
+        out_df = engine.threading(num_job)
+        transcripts = len(out_df)
+        if "all_sentence_number" in out_df.columns:
+            sentences = int(out_df["all_sentence_number"].sum())
+    elif stage == "raw2panel":
+        from confcall.raw2panel import Raw2Panel
+        out_df = Raw2Panel(paths["panel_data_path"], paths["lookup_df_path"], paths["moral_dict_path"]).reshape()
+        transcripts = out_df["transcript_ID"].nunique()
+    elif stage == "panel2cross":
+        from confcall.cross.Panel2Cross import panel2cross
+        engine = panel2cross(paths["panel_data_path"], paths["lookup_df_path"], paths["moral_dict_path"])
+        engine.exe()
+        transcripts = len(engine.panel_df)
+    else:
+        raise ValueError("unknown stage: " + stage)
+    seconds = time.perf_counter() - start
+
+    # shut the joblib workers down, so their peak RSS shows up in RUSAGE_CHILDREN
+    from joblib.externals.loky import get_reusable_executor
+    get_reusable_executor().shutdown(wait = True)
+    return {"seconds": seconds, "transcripts": transcripts, "sentences": sentences,
+            "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+            "peak_worker_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN)}
+
+def run_benchmark(work_path: str, sizes: list = (200, 1000), num_jobs: list = (1, 4),
+                  stages: list = COUNT_STAGES + PANEL_STAGES, label: str = None, seed: int = 0, verbose: bool = True):
+    '''
+    A func to run every stage at every corpus size and job count
+
+    Parameters
+    ----------
+    work_path: str
+        The synthetic inputs of size n go to work_path/size_<n>, and are
+        reused if already there
+    sizes: list
+        Numbers of transcripts
+    num_jobs: list
+        Job counts of the count stages
+    stages: list
+        The stages to run
+    label: str
+        Version label of the results; defaults to git describe
+
+    Returns
+    -------
+    results_df: pd.DataFrame
+        One row per (stage, size, num_job), with the columns RESULT_COLUMNS
+
+    '''
+    if label is None:
+        label = version_label()
+    timestamp = pd.Timestamp.now().isoformat(timespec = 'seconds')
+    records = []
+    for size in sizes:
+        size_path = work_path + '/size_%d' % size
+        paths = make_all(size_path, size, seed) if not os.path.exists(size_path + '/panel.csv') else \
+                {"moral_dict_path": size_path + '/moral foundations dictionary.txt',
+                 "processed_all_year_path": size_path + '/all_year_processed_data',
+                 "panel_data_path": size_path + '/panel.csv',
+                 "lookup_df_path": size_path + '/lookup.csv'}
+        # build the transcript catalog once, outside the timings
+        TranscriptCatalog(paths["processed_all_year_path"]).refresh()
+
+        for stage in stages:
+            for num_job in (num_jobs if stage in COUNT_STAGES else [1]):
+                # a fresh process per run, so the peak RSS is that of the run
+                with ProcessPoolExecutor(max_workers = 1, mp_context = multiprocessing.get_context('spawn')) as executor:
+                    result = executor.submit(run_stage, stage, paths, num_job).result()
+                record = {"label": label, "timestamp": timestamp, "stage": stage, "size": size, "num_job": num_job}
+                record.update(result)
+                record["transcripts_per_sec"] = result["transcripts"] / result["seconds"]
+                record["sentences_per_sec"] = None if result["sentences"] is None else result["sentences"] / result["seconds"]
+                records.append(record)
+                if verbose:
+                    print("%-12s size %6d jobs %2d: %8.2fs %10.1f transcripts/s, peak RSS %.0f MB (workers %.0f MB)"
+                          % (stage, size, num_job, result["seconds"], record["transcripts_per_sec"],
+                             result["peak_rss_mb"], result["peak_worker_rss_mb"]))
+    return pd.DataFrame(records, columns = RESULT_COLUMNS)
+
+def version_label():
+    # git describe of this folder, "unknown" outside of a git checkout
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd = os.path.dirname(os.path.abspath(__file__)),
+                              capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def save_results(results_df: pd.DataFrame, results_path: str):
+    '''
+    Append results to a CSV, writing the header if the file is new
+    '''
+    results_df.to_csv(results_path, mode = 'a', index = False, header = not os.path.exists(results_path))
+
+def compare_results(results_path: str, base_label: str, new_label: str):
+    '''
+    A func to compare the saved results of two versions
+
+    Returns
+    -------
+    compare_df: pd.DataFrame
+        One row per (stage, size, num_job) run by both versions, with the
+        seconds and peak RSS of each and speedup = base seconds / new seconds;
+        the latest run of a label counts
+
+    '''
+    results_df = pd.read_csv(results_path)
+    results_df = results_df.sort_values("timestamp").drop_duplicates(["label", "stage", "size", "num_job"], keep = 'last')
+    keys = ["stage", "size", "num_job"]
+    base_df = results_df[results_df["label"] == base_label].set_index(keys)[["seconds", "peak_rss_mb"]]
+    new_df = results_df[results_df["label"] == new_label].set_index(keys)[["seconds", "peak_rss_mb"]]
+    compare_df = base_df.join(new_df, how = 'inner', lsuffix = '_base', rsuffix = '_new')
+    compare_df["speedup"] = compare_df["seconds_base"] / compare_df["seconds_new"]
+    return compare_df.reset_index()
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the stages on synthetic inputs")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("work_path")
+    run_parser.add_argument("--sizes", type = int, nargs = '+', default = [200, 1000])
+    run_parser.add_argument("--jobs", type = int, nargs = '+', default = [1, 4])
+    run_parser.add_argument("--stages", nargs = '+', default = COUNT_STAGES + PANEL_STAGES)
+    run_parser.add_argument("--label", default = None)
+    run_parser.add_argument("--results", default = "benchmark_results.csv")
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("base_label")
+    compare_parser.add_argument("new_label")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results_df = run_benchmark(args.work_path, args.sizes, args.jobs, args.stages, args.label)
+        save_results(results_df, args.results)
+        print("results appended to " + args.results)
+    else:
+        print(compare_results(args.results, args.base_label, args.new_label).to_string(index = False, float_format = lambda x: "%.2f" % x))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,13 +11,22 @@ CONTENT
 
 VERSION
 -------
-Last update: R4/8/26(Kin)
+Last update: R8/10/18(Kin)
 
 '''
 import pandas as pd
+import numpy as np
 import os
-from moral_sent_classifier import SentenceMoralClassifier, cut_sentence
-from joblib import Parallel, delayed
+import sys
+from confcall.moral_sent_classifier import SentenceMoralClassifier, iter_sentence_spans
+from confcall.scheduler import count_transcripts, worker_state
+from confcall.packed_corpus import open_transcript_source
+from confcall.result_cache import ResultCache, file_digest, code_version
+from confcall.result_sink import read_results
+from confcall.telemetry import TELEMETRY
+from confcall.result_schema import ResultSchema, GROUPS
+from confcall import moral_dict, moral_sent_classifier, talk_slices, result_schema, transcript_reader, packed_corpus
+from confcall.talk_slices import transcript_id_from_path
 
 def file_list(path):
     f_list = os.listdir(path)
@@ -29,7 +38,13 @@ class SentFreq:
     def __init__(self, 
                 panel_data_path: str, 
                 processed_all_year_path: str,
-                moral_dict_path: str):
+                moral_dict_path: str,
+                catalog_path: str = None,
+                cache_path: str = None,
+                packed_corpus_path: str = None,
+                reader_backend: str = "pandas",
+                prefetch_depth: int = 4,
+                io_threads: int = 2):
         
         self.panel_data_path = panel_data_path
         self.processed_all_year_path = processed_all_year_path
@@ -37,146 +52,108 @@ class SentFreq:
         self.panel_df = pd.read_csv(panel_data_path).set_index("transcript_ID", drop=False)
         self.trans_id_list = list(self.panel_df["transcript_ID"])
         
-        # generate a year-file list
-        self.full_path_list = []
-        year_trans_list = [self.processed_all_year_path + '/' + year for year in file_list(self.processed_all_year_path) if 'processed' in year]
-        for yl in year_trans_list:
-            sub_path_list = [yl + '/' + trans_id for trans_id in file_list(yl)]                            
-            self.full_path_list += sub_path_list
-                
-        # load the classifier
+        self.trans_id_set = set(self.trans_id_list)
+        
+        # generate a year-file list from the transcript catalog, scanning only changed year folders
+        # (or from the packed corpus, which then also serves the talk rows);
+        # the talk rows are read by reader_backend (see transcript_reader), up to prefetch_depth
+        # transcripts ahead, in io_threads threads
+        self.catalog, self.read_talk_rows = open_transcript_source(processed_all_year_path, catalog_path, packed_corpus_path,
+                                                                    prefetch_depth, io_threads, reader_backend)
+        self.full_path_list = self.catalog.paths()
+            
+        # load the classifier; a list of dictionaries is combined into one (see moral_dict.load_moral_dict)
         self.sent_moral_classifier = SentenceMoralClassifier(dict_path = moral_dict_path)
+        self.schema = ResultSchema(self.sent_moral_classifier.sub_dict_name, self.sent_moral_classifier.matcher.categories,
+                                   word_freq = False)
+
+        # cache of per-transcript results, keyed on the talk files, the dictionary and the counting code
+        self.result_cache = ResultCache(cache_path) if cache_path is not None else None
+        self.cache_salt = 'SentFreq#' + '#'.join([file_digest(path) for path in moral_dict.dict_path_list(moral_dict_path)]) + '#' + code_version(sys.modules[__name__], moral_dict, moral_sent_classifier, talk_slices, result_schema, transcript_reader, packed_corpus)
+        if packed_corpus_path is not None:
+            self.cache_salt += '#' + self.catalog.pack_id
     
     def sent_count_by_dict(self, talk_df):
         out_sent_count = dict([(key, 0) for key in self.sent_moral_classifier.word_dicts.keys()])
-        out_num_sent = 0
-        if len(talk_df) == 0: return out_sent_count, out_num_sent
-        for talk_content in talk_df:
-            if isinstance(talk_content, str):
-                talk_sentences = cut_sentence(talk_content)
-                for talk_sentence in talk_sentences:
-                    out_num_sent += 1
-                    temp_word_count = self.sent_moral_classifier.word_count_by_dict(talk_sentence)
-                    for key, value in temp_word_count.items():
-                        out_sent_count[key] += value
+        talk_words = []
+        sentence_spans = []
+        with TELEMETRY.timer("cut_sentence"):
+            for talk_content in talk_df:
+                if isinstance(talk_content, str):
+                    row_words = talk_content.split()
+                    sentence_spans += iter_sentence_spans(row_words, len(talk_words))
+                    talk_words += row_words
+        out_num_sent = len(sentence_spans)
+        TELEMETRY.count("sentences", out_num_sent)
+        if out_num_sent == 0: return out_sent_count, out_num_sent
+
+        # classify all sents in one batch
+        with TELEMETRY.timer("match_sentences"):
+            sent_count = self.sent_moral_classifier.word_count_by_spans(talk_words, sentence_spans).sum(axis = 0)
+        for key_i, key in enumerate(self.sent_moral_classifier.matcher.categories):
+            out_sent_count[key] = int(sent_count[key_i])
                         
         return out_sent_count, out_num_sent
         
+    def __getstate__(self):
+        # the workers get the engine without the panel and the catalog
+        return worker_state(self)
+
+    def result_columns(self):
+        # the output columns of count_single_transcript, in order
+        return self.schema.columns
+
     def count_single_transcript(self, trans_path: str):
-        ceo_df = pd.read_csv(trans_path + "/ceo_talk.csv")
-        cfo_df = pd.read_csv(trans_path + "/cfo_talk.csv")
-        others_df = pd.read_csv(trans_path + "/others_talk.csv")
-        
-        ## load the contents of talk
-        # ceo
-        ceo_talk_all = ceo_df['talk_content'].dropna()
-        ceo_talk_exQA = ceo_df["talk_content"][pd.isna(ceo_df["question"])].dropna()
-        ceo_talk_QA = ceo_df["talk_content"][~pd.isna(ceo_df["question"])].dropna()
-        
-        # cfo
-        cfo_talk_all = cfo_df['talk_content'].dropna()
-        cfo_talk_exQA = cfo_df["talk_content"][pd.isna(cfo_df["question"])].dropna()
-        cfo_talk_QA = cfo_df["talk_content"][~pd.isna(cfo_df["question"])].dropna()
-        
-        # others
-        others_talk_all = others_df['talk_content'].dropna()
-        others_talk_exQA = others_df["talk_content"][pd.isna(others_df["question"])].dropna()
-        others_talk_QA = others_df["talk_content"][~pd.isna(others_df["question"])].dropna()
-        
-        # all
-        all_talk_exQA = pd.concat([ceo_talk_exQA, cfo_talk_exQA, others_talk_exQA], axis = 0)
-        all_talk_QA = pd.concat([ceo_talk_QA, cfo_talk_QA, others_talk_QA], axis = 0)
-        all_talk_all = pd.concat([ceo_talk_all, cfo_talk_all, others_talk_all], axis = 0)
-        
-        ## sentence count
-        # ceo
-        ceo_sent_count_all,ceo_num_sent_all = self.sent_count_by_dict(ceo_talk_all)
-        ceo_sent_count_exQA,ceo_num_sent_exQA = self.sent_count_by_dict(ceo_talk_exQA)
-        ceo_sent_count_QA,ceo_num_sent_QA = self.sent_count_by_dict(ceo_talk_QA)
-        
-        # cfo
-        cfo_sent_count_all,cfo_num_sent_all = self.sent_count_by_dict(cfo_talk_all)
-        cfo_sent_count_exQA,cfo_num_sent_exQA = self.sent_count_by_dict(cfo_talk_exQA)
-        cfo_sent_count_QA,cfo_num_sent_QA = self.sent_count_by_dict(cfo_talk_QA)
-        
-        # all
-        all_sent_count_all,all_num_sent_all = self.sent_count_by_dict(all_talk_all)
-        all_sent_count_exQA,all_num_sent_exQA = self.sent_count_by_dict(all_talk_exQA)
-        all_sent_count_QA,all_num_sent_QA = self.sent_count_by_dict(all_talk_QA)          
-        
-        ## combine the result as a dataframe
-        transcript_id = trans_path.split('-')[-2]
-        single_trans = pd.DataFrame()
-        
-        # sentence number 
-        single_trans.loc[transcript_id, "all_sentence_number"] = all_num_sent_all
-        single_trans.loc[transcript_id, "ceo_sentence_number"] = ceo_num_sent_all
-        single_trans.loc[transcript_id, "cfo_sentence_number"] = cfo_num_sent_all
-
-        # sent count
-        for key, value in all_sent_count_all.items():                    
-            single_trans.loc[transcript_id, self.sent_moral_classifier.sub_dict_name[key] + "_sentence_number" + '_all'] = value
-        # ceo-all
-        for key, value in ceo_sent_count_all.items():                    
-            single_trans.loc[transcript_id, self.sent_moral_classifier.sub_dict_name[key] + "_sentence_number" + '_ceo'] = value
-        # cfo-all
-        for key, value in cfo_sent_count_all.items():                    
-            single_trans.loc[transcript_id, self.sent_moral_classifier.sub_dict_name[key] + "_sentence_number" + '_cfo'] = value
-        
-        # all-excludeQA
-        for key, value in all_sent_count_exQA.items():
-            single_trans.loc[transcript_id, 'exclude_QA_' + self.sent_moral_classifier.sub_dict_name[key] + '_sentence_number_all'] = value
-        # ceo-excludeQA
-        for key, value in ceo_sent_count_exQA.items():
-            single_trans.loc[transcript_id, 'exclude_QA_' + self.sent_moral_classifier.sub_dict_name[key] + '_sentence_number_ceo'] = value
-        # cfo-excludeQA
-        for key, value in cfo_sent_count_exQA.items():
-            single_trans.loc[transcript_id, 'exclude_QA_' + self.sent_moral_classifier.sub_dict_name[key] + '_sentence_number_cfo'] = value
-
-        # all-QA
-        for key, value in all_sent_count_QA.items():
-            single_trans.loc[transcript_id, 'QA_' + self.sent_moral_classifier.sub_dict_name[key] + '_sentence_number_all'] = value
-        # ceo-QA
-        for key, value in ceo_sent_count_QA.items():
-            single_trans.loc[transcript_id, 'QA_' + self.sent_moral_classifier.sub_dict_name[key] + '_sentence_number_ceo'] = value
-        # cfo-QA
-        for key, value in cfo_sent_count_QA.items():
-            single_trans.loc[transcript_id, 'QA_' + self.sent_moral_classifier.sub_dict_name[key] + '_sentence_number_cfo'] = value
-        
-        return single_trans
-
-    def threading(self, num_job: int):
-        path_list = self.full_path_list
-        files_per_job = int(len(path_list) / num_job)
-        cut_list = []
-        for i in range(num_job):
-            if i != num_job - 1:
-                cut_list.append(path_list[i * files_per_job: (i + 1) * files_per_job])
-            else:
-                cut_list.append(path_list[i * files_per_job:])
-
-        def run(trans_list):
-            out_df = pd.DataFrame()
-            for path in trans_list:
-                temp_id = int(path.split('-')[-2])
-                temp_df = pd.DataFrame()
-                if temp_id not in self.trans_id_list: continue
-            
-                temp_df = self.count_single_transcript(path)
-                out_df = pd.concat([out_df, temp_df], axis = 0)
-            
-            out_df.reset_index(drop = True, replace = True)
-            return out_df
-        
-        # deploy the treading
-        final_dfs = Parallel(n_jobs=num_job, verbose=1)(delayed(run)(sub_list) for sub_list in cut_list)
+        # the counts of a transcript as a one-row dataframe
+        return self.schema.to_frame(self.count_row(trans_path)[np.newaxis], [transcript_id_from_path(trans_path)])
 
-        # combine all count results in  the treading processing return value together as a dataframe
-        final_df = pd.DataFrame()
-        for df in final_dfs:
-            final_df = pd.concat([final_df, df], axis = 0)
-        
-        final_df.reset_index(drop = True, inplace = True)
+    def count_row(self, trans_path: str):
+        # return the cached row of the transcript if it is still valid
+        if self.result_cache is None:
+            return self.compute_row(trans_path)
+        return self.result_cache.fetch(trans_path, self.cache_salt, 'SentFreq',
+                                       transcript_id_from_path(trans_path), self.compute_row)
+
+    def compute_row(self, trans_path: str):
+        # cut every talk row once into spans over the words of the transcript,
+        # and label each sent with its (speaker, is_QA) group
+        with TELEMETRY.timer("read_talk_rows"):
+            talk_rows = self.read_talk_rows(trans_path)
+        talk_words = []
+        sentence_spans = []
+        sent_group_idx = []
+        with TELEMETRY.timer("cut_sentence"):
+            for speaker, is_QA, talk_content in talk_rows:
+                if not isinstance(talk_content, str):
+                    continue
+                row_words = talk_content.split()
+                row_spans = list(iter_sentence_spans(row_words, len(talk_words)))
+                talk_words += row_words
+                sentence_spans += row_spans
+                sent_group_idx += [self.schema.group_index(speaker, is_QA)] * len(row_spans)
+        TELEMETRY.count("talk_rows", len(talk_rows))
+        TELEMETRY.count("sentences", len(sentence_spans))
+
+        # classify all sents of the transcript in one batch, sum up by group
+        with TELEMETRY.timer("match_sentences"):
+            sent_count = self.sent_moral_classifier.word_count_by_spans(talk_words, sentence_spans)
+
+        # sum up by group, then into the nine slices of the row
+        with TELEMETRY.timer("assemble"):
+            group_counts = np.zeros((len(GROUPS), sent_count.shape[1]), dtype = np.int64)
+            np.add.at(group_counts, np.asarray(sent_group_idx, dtype = np.int64), sent_count)
+            group_sent_num = np.bincount(np.asarray(sent_group_idx, dtype = np.int64), minlength = len(GROUPS))
+            row = self.schema.new_row()
+            self.schema.fill_sent_freq(row, group_counts, group_sent_num)
+        return row
+
+    def threading(self, num_job: int, store_path: str = None, batch_size: int = 16, telemetry_path: str = None):
+        # keep the transcripts in the panel only, then hand them out largest first
+        final_df, self.worker_report, self.telemetry = count_transcripts(self.count_row, self.schema,
+                                                                         self.catalog.paths(self.trans_id_set),
+                                                                         self.catalog.sizes(self.trans_id_set),
+                                                                         num_job, store_path, batch_size, 'sf',
+                                                                         telemetry_path, self.read_talk_rows)
         return final_df
 
 if __name__ == '__main__':
@@ -189,6 +166,7 @@ if __name__ == '__main__':
                 processed_all_year_path,
                 moral_dict_path)
 
-    sf_results = sf.threading(16)
+    # stream the results to parquet parts, then read them back in one go
+    sf_results = read_results(sf.threading(16, store_path = store_path + '/sf_results'))
 
 
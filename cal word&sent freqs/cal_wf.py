@@ -7,18 +7,29 @@ Use threading to calculate word freq.
 CONTENT
 -------
 - <FUNC> file_list
-- <FUNC> load_moral_dict
+- <FUNC> load_moral_dict (from moral_dict)
 - <CLASS> WordFreq
 
 VERSION
 -------
-Last update: R4/8/26(Kin)
+Last update: R8/10/18(Kin)
 
 '''
 import pandas as pd
+import numpy as np
 import os
+import sys
 from collections import Counter
-from joblib import Parallel, delayed
+from confcall.moral_dict import load_moral_dict, MoralDictMatcher
+from confcall.scheduler import count_transcripts, worker_state
+from confcall.packed_corpus import open_transcript_source
+from confcall.result_cache import ResultCache, file_digest, code_version
+from confcall.result_sink import read_results
+from confcall.telemetry import TELEMETRY
+from confcall.result_schema import ResultSchema, GROUPS
+from confcall.hit_index import HitRecorder, build_hit_index
+from confcall import moral_dict, talk_slices, result_schema, transcript_reader, packed_corpus
+from confcall.talk_slices import transcript_id_from_path, word_freq_tokens
 
 def file_list(path):
     f_list = os.listdir(path)
@@ -26,47 +37,19 @@ def file_list(path):
         f_list.remove(".DS_Store")
     return sorted(f_list)
 
-# load the dictionary, return a dict of sub dictionaries
-def load_moral_dict(dict_path):
-    with open(dict_path, 'r') as file:
-        moral_dict_ct = file.read()
-    temp_dict = moral_dict_ct.splitlines()
-    
-    for line_i in range(len(temp_dict)):
-        temp_dict[line_i] = temp_dict[line_i].replace('\t', ' ')
-
-    sub_dict_keys = temp_dict[1:12]
-    for line_i in range(len(sub_dict_keys)):
-        sub_dict_keys[line_i] = sub_dict_keys[line_i].split()
-    
-    temp_sub_dicts = temp_dict[14:]
-    sub_dicts = {}
-    sub_dict_name = {}
-    for item in sub_dict_keys:
-        sub_dicts[item[0]] = []
-        sub_dict_name[item[0]] = item[1]
-        
-    for line in temp_sub_dicts:
-        if len(line.replace(' ', '')) == 0:
-            continue
-        temp_item = line.split()
-        if len(temp_item) > 2:
-            for key in temp_item[1:]:
-                sub_dicts[key].append(temp_item[0])
-        else:
-            sub_dicts[temp_item[1]].append(temp_item[0])
-            
-    # sub_dicts = pd.DataFrame(sub_dicts.values()).transpose()
-    # sub_dicts.to_csv('Sub-dictionary.csv',encoding='utf-8')
-    
-    return sub_dict_name, sub_dicts
-
 class WordFreq:
     def __init__(self, 
                 panel_data_path:str, 
                 processed_all_year_path:str, 
                 moral_dict_path:str, 
-                store_path: str):
+                store_path: str,
+                catalog_path: str = None,
+                cache_path: str = None,
+                packed_corpus_path: str = None,
+                reader_backend: str = "pandas",
+                prefetch_depth: int = 4,
+                io_threads: int = 2,
+                hit_index_path: str = None):
 
         self.panel_data_path = panel_data_path
         self.processed_all_year_path = processed_all_year_path
@@ -74,165 +57,117 @@ class WordFreq:
         self.panel_df = pd.read_csv(panel_data_path).set_index("transcript_ID", drop=False)
         self.trans_id_list = list(self.panel_df["transcript_ID"])
         
-        # (1) generate a year-file list
-        self.full_path_list = []
-        year_trans_list = [self.processed_all_year_path + '/' + year for year in file_list(self.processed_all_year_path) if 'processed' in year]
-        for yl in year_trans_list:
-            sub_path_list = [yl + '/' + trans_id for trans_id in file_list(yl)]                            
-            self.full_path_list += sub_path_list
+        self.trans_id_set = set(self.trans_id_list)
+        
+        # (1) generate a year-file list from the transcript catalog, scanning only changed year folders
+        # (or from the packed corpus, which then also serves the talk rows);
+        # the talk rows are read by reader_backend (see transcript_reader), up to prefetch_depth
+        # transcripts ahead, in io_threads threads
+        self.catalog, self.read_talk_rows = open_transcript_source(processed_all_year_path, catalog_path, packed_corpus_path,
+                                                                    prefetch_depth, io_threads, reader_backend)
+        self.full_path_list = self.catalog.paths()
             
-        # load the moral foudnations dictionary
+        # load the moral foudnations dictionary; a list of dictionaries is combined into one
+        # matcher with namespaced categories (see moral_dict.load_moral_dict), counted in one pass
         self.word_dicts = {}
         self.sub_dict_name, sub_dicts = load_moral_dict(moral_dict_path)
         for key,value in sub_dicts.items():
             # every item in the new dict is a sub-dict from moral foundations dict
             self.word_dicts[key] = value
+        self.matcher = MoralDictMatcher(sub_dicts)
+        self.schema = ResultSchema(self.sub_dict_name, list(self.word_dicts.keys()), sent_freq = False)
+
+        # cache of per-transcript results, keyed on the talk files, the dictionary and the counting code
+        self.result_cache = ResultCache(cache_path) if cache_path is not None else None
+        self.cache_salt = 'WordFreq#' + '#'.join([file_digest(path) for path in moral_dict.dict_path_list(moral_dict_path)]) + '#' + code_version(sys.modules[__name__], moral_dict, talk_slices, result_schema, transcript_reader, packed_corpus)
+        if packed_corpus_path is not None:
+            self.cache_salt += '#' + self.catalog.pack_id
+
+        # if given, threading also writes an inverted index of every dictionary hit there (see hit_index)
+        self.hit_index_path = hit_index_path
+        self.hit_recorder = HitRecorder(hit_index_path + '/parts') if hit_index_path is not None else None
     
-    def word_count_by_dict(self, talk_words: list):
-        talk_count_result = {}
-        talk_words_counter = dict(Counter(talk_words))
-        counter_keys = list(talk_words_counter.keys())
-        for word_dict_name, keyword_list in self.word_dicts.items():
-            dict_count = 0
-            for kw in keyword_list:
-                if "*" not in kw:
-                    if kw in counter_keys:
-                        dict_count += talk_words_counter[kw]
-                else:
-                    kw = kw.split("*")[0]
-                    for key in counter_keys:
-                        if key[:len(kw)] == kw:
-                            dict_count += talk_words_counter[key]
-            talk_count_result[word_dict_name] = dict_count
-        return talk_count_result
-
-    def count_single_transcript(self, trans_path:str):
-        # read the csv file
-        ceo_df = pd.read_csv(trans_path + '/' + 'ceo_talk.csv')
-        ceo_talk_all = " ".join([str(content) for content in list(ceo_df["talk_content"].dropna())])
-        ceo_talk_exQA = " ".join([str(content) for content in list(ceo_df["talk_content"][pd.isna(ceo_df["question"])].dropna())])
-        ceo_talk_QA = " ".join([str(content) for content in list(ceo_df["talk_content"][~pd.isna(ceo_df["question"])].dropna())])
-         
-        cfo_df = pd.read_csv(trans_path + '/' + 'cfo_talk.csv')
-        cfo_talk_all = " ".join([str(content) for content in list(cfo_df["talk_content"].dropna())])
-        cfo_talk_exQA = " ".join([str(content) for content in list(cfo_df["talk_content"][pd.isna(cfo_df["question"])].dropna())])
-        cfo_talk_QA = " ".join([str(content) for content in list(cfo_df["talk_content"][~pd.isna(cfo_df["question"])].dropna())])
-         
-        others_df = pd.read_csv(trans_path + '/' + 'others_talk.csv')
-        others_talk_all = " ".join([str(content) for content in list(others_df["talk_content"].dropna())])
-        others_talk_exQA = " ".join([str(content) for content in list(others_df["talk_content"][pd.isna(others_df["question"])].dropna())])
-        others_talk_QA = " ".join([str(content) for content in list(others_df["talk_content"][~pd.isna(others_df["question"])].dropna())])
-         
-        all_talk_all = ceo_talk_all + cfo_talk_all + others_talk_all
-        all_talk_exQA = ceo_talk_exQA + cfo_talk_exQA + others_talk_exQA
-        all_talk_QA = ceo_talk_QA + cfo_talk_QA + others_talk_QA
-        
-        # eliminate all punctuations
-        symbols = [",", ".", "!", "?"]
-        for symbol in symbols:
-            ceo_talk_all = ceo_talk_all.replace(symbol, "").lower()
-            cfo_talk_all = cfo_talk_all.replace(symbol, "").lower()
-            all_talk_all = all_talk_all.replace(symbol, "").lower()
-            
-            ceo_talk_exQA = ceo_talk_exQA.replace(symbol, "").lower()
-            cfo_talk_exQA = cfo_talk_exQA.replace(symbol, "").lower()
-            all_talk_exQA = all_talk_exQA.replace(symbol, "").lower()
-            
-            ceo_talk_QA = ceo_talk_QA.replace(symbol, "").lower()
-            cfo_talk_QA = cfo_talk_QA.replace(symbol, "").lower()
-            all_talk_QA = all_talk_QA.replace(symbol, "").lower()
-        
-        # crush a single text into words
-        ceo_talk_exQA_words = ceo_talk_exQA.split()
-        cfo_talk_exQA_words = cfo_talk_exQA.split()
-        all_talk_exQA_words = all_talk_exQA.split()
-        
-        ceo_talk_QA_words = ceo_talk_QA.split()
-        cfo_talk_QA_words = cfo_talk_QA.split()
-        all_talk_QA_words = all_talk_QA.split()
-        
-        ceo_talk_all_words = ceo_talk_all.split()
-        cfo_talk_all_words = cfo_talk_all.split()
-        all_talk_all_words = all_talk_all.split()
-        
-        # get the word count
-        ceo_talk_exQA_result = self.word_count_by_dict(ceo_talk_exQA_words)
-        cfo_talk_exQA_result = self.word_count_by_dict(cfo_talk_exQA_words)
-        all_talk_exQA_result = self.word_count_by_dict(all_talk_exQA_words)
-        
-        ceo_talk_QA_result = self.word_count_by_dict(ceo_talk_QA_words)
-        cfo_talk_QA_result = self.word_count_by_dict(cfo_talk_QA_words)
-        all_talk_QA_result = self.word_count_by_dict(all_talk_QA_words)
-        
-        ceo_talk_all_result = self.word_count_by_dict(ceo_talk_all_words)
-        cfo_talk_all_result = self.word_count_by_dict(cfo_talk_all_words)
-        all_talk_all_result = self.word_count_by_dict(all_talk_all_words)
-        
-        ## combine the result as a dataframe
-        transcript_id = trans_path.split('-')[-2]
-        single_trans = pd.DataFrame()
-        
-        # all
-        for word_dict_name, word_count in ceo_talk_all_result.items():
-            single_trans.loc[transcript_id, self.sub_dict_name[word_dict_name] + "_ceo"] = word_count
-        for word_dict_name, word_count in cfo_talk_all_result.items():
-            single_trans.loc[transcript_id, self.sub_dict_name[word_dict_name] + "_cfo"] = word_count
-        for word_dict_name, word_count in all_talk_all_result.items():
-            single_trans.loc[transcript_id, self.sub_dict_name[word_dict_name] + "_all"] = word_count
-        
-        # exclude QA
-        for word_dict_name, word_count in ceo_talk_exQA_result.items():
-            single_trans.loc[transcript_id, 'exclude_QA_' + self.sub_dict_name[word_dict_name] + "_ceo"] = word_count
-        for word_dict_name, word_count in cfo_talk_exQA_result.items():
-            single_trans.loc[transcript_id, 'exclude_QA_' + self.sub_dict_name[word_dict_name] + "_cfo"] = word_count
-        for word_dict_name, word_count in all_talk_exQA_result.items():
-            single_trans.loc[transcript_id, 'exclude_QA_' + self.sub_dict_name[word_dict_name] + "_all"] = word_count
-        
-        # QA
-        for word_dict_name, word_count in ceo_talk_QA_result.items():
-            single_trans.loc[transcript_id, 'QA_' + self.sub_dict_name[word_dict_name] + "_ceo"] = word_count
-        for word_dict_name, word_count in cfo_talk_QA_result.items():
-            single_trans.loc[transcript_id, 'QA_' + self.sub_dict_name[word_dict_name] + "_cfo"] = word_count
-        for word_dict_name, word_count in all_talk_QA_result.items():
-            single_trans.loc[transcript_id, 'QA_' + self.sub_dict_name[word_dict_name] + "_all"] = word_count
-        
-        return single_trans
-    
-    def threading(self, num_job: int):
-        path_list = self.full_path_list
-        
-        # calculate files per job
-        files_per_job = int(len(path_list) / num_job)
-        cut_list = []
-        for i in range(num_job):
-            if i != num_job - 1:
-                cut_list.append(path_list[i * files_per_job: (i + 1) * files_per_job])
-            else:
-                cut_list.append(path_list[i * files_per_job:])
-
-        # define a function to process a list of trans, return a dataframe
-        def run(trans_list):
-            out_df = pd.DataFrame()
-            for path in trans_list:
-                temp_id = int(path.split('-')[-2])
-                temp_df = pd.DataFrame()
-                if temp_id not in self.trans_id_list: continue
-                
-                temp_df = self.count_single_transcript(path)
-                out_df = pd.concat([out_df, temp_df], axis = 0)
-            
-            out_df.reset_index(drop = True, inplace = True)
-            return out_df
+    def word_count_by_dict(self, talk_words):
+        # every word type is resolved to its categories once by the compiled matcher
+        return self.matcher.count(talk_words)
+
+    def __getstate__(self):
+        # the workers get the engine without the panel and the catalog
+        return worker_state(self)
+
+    def result_columns(self):
+        # the output columns of count_single_transcript, in order
+        return self.schema.columns
+
+    def count_single_transcript(self, trans_path: str):
+        # the counts of a transcript as a one-row dataframe
+        return self.schema.to_frame(self.count_row(trans_path)[np.newaxis], [transcript_id_from_path(trans_path)])
+
+    def count_row(self, trans_path: str):
+        # return the cached row of the transcript if it is still valid;
+        # the hit index needs the text, so it bypasses the cache
+        if self.result_cache is None or self.hit_recorder is not None:
+            return self.compute_row(trans_path)
+        return self.result_cache.fetch(trans_path, self.cache_salt, 'WordFreq',
+                                       transcript_id_from_path(trans_path), self.compute_row)
+
+    def compute_row(self, trans_path:str):
+        # tokenize every talk row once, and collect the words by (speaker, is_QA)
+        with TELEMETRY.timer("read_talk_rows"):
+            talk_rows = self.read_talk_rows(trans_path)
+        group_words = {}
+        row_tokens = []
+        with TELEMETRY.timer("tokenize"):
+            for speaker, is_QA, talk_content in talk_rows:
+                tokens = word_freq_tokens(str(talk_content).split())
+                group_words.setdefault((speaker, is_QA), Counter()).update(tokens)
+                if self.hit_recorder is not None:
+                    row_tokens.append((speaker, is_QA, tokens))
+        TELEMETRY.count("talk_rows", len(talk_rows))
+        if self.hit_recorder is not None:
+            with TELEMETRY.timer("record_hits"):
+                self.record_hits(trans_path, row_tokens)
+
+        # match each group once
+        with TELEMETRY.timer("match_words"):
+            group_counts = np.zeros((len(GROUPS), len(self.schema.dict_keys)), dtype = np.int64)
+            for (speaker, is_QA), words in group_words.items():
+                counts = self.word_count_by_dict(words)
+                group_counts[self.schema.group_index(speaker, is_QA)] = [counts[key] for key in self.schema.dict_keys]
+
+        # add the groups up into the nine slices of the row
+        with TELEMETRY.timer("assemble"):
+            row = self.schema.new_row()
+            self.schema.fill_word_freq(row, group_counts)
+        return row
     
-        # deploy the treading
-        sub_dfs = Parallel(n_jobs = num_job, verbose=1)(delayed(run)(sub_list) for sub_list in cut_list)
-
-        # combine all count results in  the treading processing return value together as a dataframe
-        final_df = pd.DataFrame()
-        for df in sub_dfs:
-            final_df = pd.concat([final_df, df], axis = 0)
-
-        final_df.reset_index(drop = True, inplace = True)
+    def record_hits(self, trans_path: str, row_tokens: list):
+        # every (row, token offset, entry) hit of a transcript, for the hit index;
+        # rows are numbered per speaker, as the non-empty rows of the speaker's talk file
+        transcript_id = int(transcript_id_from_path(trans_path))
+        row_numbers = Counter()
+        for speaker, is_QA, tokens in row_tokens:
+            offsets, entries = [], []
+            for offset, token in enumerate(tokens):
+                for entry_i in self.matcher.match_entries(token):
+                    offsets.append(offset)
+                    entries.append(entry_i)
+            self.hit_recorder.add(transcript_id, self.schema.group_index(speaker, is_QA), row_numbers[speaker], offsets, entries)
+            row_numbers[speaker] += 1
+
+    def threading(self, num_job: int, store_path: str = None, batch_size: int = 16, telemetry_path: str = None):
+        if self.hit_recorder is not None:
+            self.hit_recorder.clear()
+        # keep the transcripts in the panel only, then hand them out largest first
+        final_df, self.worker_report, self.telemetry = count_transcripts(self.count_row, self.schema,
+                                                                         self.catalog.paths(self.trans_id_set),
+                                                                         self.catalog.sizes(self.trans_id_set),
+                                                                         num_job, store_path, batch_size, 'wf',
+                                                                         telemetry_path, self.read_talk_rows,
+                                                                         self.hit_recorder)
+        if self.hit_recorder is not None:
+            with TELEMETRY.timer("build_hit_index"):
+                build_hit_index(self.hit_recorder.part_path, self.hit_index_path, self.matcher, self.sub_dict_name)
         return final_df
 
 if __name__ == '__main__':
@@ -243,9 +178,11 @@ if __name__ == '__main__':
 
     wf = WordFreq(panel_data_path,
                       processed_all_year_path,
-                      moral_dict_path)
+                      moral_dict_path,
+                      store_path)
 
-    wf_results = wf.threading(16)
+    # stream the results to parquet parts, then read them back in one go
+    wf_results = read_results(wf.threading(16, store_path = store_path + '/wf_results'))
 
 
 
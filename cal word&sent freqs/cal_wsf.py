@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Use threading to calculate word freq and sent freq in one pass: every
+transcript is read and split into words once, the words feed both the word
+count and the sentence cut, and the moral dictionary is loaded once. The
+output has the columns of cal_wf followed by those of cal_sf.
+
+CONTENT
+-------
+- <CLASS> WordSentFreq
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import pandas as pd
+import numpy as np
+import sys
+import time
+from collections import Counter
+from confcall.moral_sent_classifier import SentenceMoralClassifier, iter_sentence_spans
+from confcall.scheduler import count_transcripts, worker_state
+from confcall.packed_corpus import open_transcript_source
+from confcall.result_cache import ResultCache, file_digest, code_version
+from confcall.result_sink import read_results
+from confcall.telemetry import TELEMETRY
+from confcall.result_schema import ResultSchema, GROUPS
+from confcall import moral_dict, moral_sent_classifier, talk_slices, result_schema, transcript_reader, packed_corpus
+from confcall.talk_slices import transcript_id_from_path, word_freq_tokens
+
+class WordSentFreq:
+    def __init__(self,
+                panel_data_path: str,
+                processed_all_year_path: str,
+                moral_dict_path: str,
+                catalog_path: str = None,
+                cache_path: str = None,
+                packed_corpus_path: str = None,
+                reader_backend: str = "pandas",
+                prefetch_depth: int = 4,
+                io_threads: int = 2):
+
+        self.panel_data_path = panel_data_path
+        self.processed_all_year_path = processed_all_year_path
+
+        self.panel_df = pd.read_csv(panel_data_path).set_index("transcript_ID", drop=False)
+        self.trans_id_list = list(self.panel_df["transcript_ID"])
+        self.trans_id_set = set(self.trans_id_list)
+
+        # generate a year-file list from the transcript catalog, scanning only changed year folders
+        # (or from the packed corpus, which then also serves the talk rows);
+        # the talk rows are read by reader_backend (see transcript_reader), up to prefetch_depth
+        # transcripts ahead, in io_threads threads
+        self.catalog, self.read_talk_rows = open_transcript_source(processed_all_year_path, catalog_path, packed_corpus_path,
+                                                                    prefetch_depth, io_threads, reader_backend)
+        self.full_path_list = self.catalog.paths()
+
+        # load the dictionary once, or the list of dictionaries combined into one (see moral_dict.load_moral_dict);
+        # the word count shares the classifier's matcher
+        self.sent_moral_classifier = SentenceMoralClassifier(dict_path = moral_dict_path)
+        self.matcher = self.sent_moral_classifier.matcher
+        self.sub_dict_name = self.sent_moral_classifier.sub_dict_name
+        self.dict_keys = self.matcher.categories
+        self.schema = ResultSchema(self.sub_dict_name, self.dict_keys)
+
+        # cache of per-transcript results, keyed on the talk files, the dictionary and the counting code
+        self.result_cache = ResultCache(cache_path) if cache_path is not None else None
+        self.cache_salt = 'WordSentFreq#' + '#'.join([file_digest(path) for path in moral_dict.dict_path_list(moral_dict_path)]) + '#' + code_version(sys.modules[__name__], moral_dict, moral_sent_classifier, talk_slices, result_schema, transcript_reader, packed_corpus)
+        if packed_corpus_path is not None:
+            self.cache_salt += '#' + self.catalog.pack_id
+
+    def __getstate__(self):
+        # the workers get the engine without the panel and the catalog
+        return worker_state(self)
+
+    def result_columns(self):
+        # the output columns of count_single_transcript, in order
+        return self.schema.columns
+
+    def count_single_transcript(self, trans_path: str):
+        # the counts of a transcript as a one-row dataframe
+        return self.schema.to_frame(self.count_row(trans_path)[np.newaxis], [transcript_id_from_path(trans_path)])
+
+    def count_row(self, trans_path: str):
+        # return the cached row of the transcript if it is still valid
+        if self.result_cache is None:
+            return self.compute_row(trans_path)
+        return self.result_cache.fetch(trans_path, self.cache_salt, 'WordSentFreq',
+                                       transcript_id_from_path(trans_path), self.compute_row)
+
+    def compute_row(self, trans_path: str):
+        # split every talk row into words once; the words feed both the word count and the sentence cut
+        with TELEMETRY.timer("read_talk_rows"):
+            talk_rows = self.read_talk_rows(trans_path)
+        group_words = {}
+        sent_words = []
+        sentence_spans = []
+        sent_group_idx = []
+        tokenize_seconds = 0.0
+        cut_seconds = 0.0
+        for speaker, is_QA, talk_content in talk_rows:
+            start = time.perf_counter()
+            talk_words = str(talk_content).split()
+            group_words.setdefault((speaker, is_QA), Counter()).update(word_freq_tokens(talk_words))
+            tokenize_seconds += time.perf_counter() - start
+
+            # like cal_sf, only text rows are cut into sentences
+            if not isinstance(talk_content, str):
+                continue
+            start = time.perf_counter()
+            row_spans = list(iter_sentence_spans(talk_words, len(sent_words)))
+            sent_words += talk_words
+            sentence_spans += row_spans
+            sent_group_idx += [self.schema.group_index(speaker, is_QA)] * len(row_spans)
+            cut_seconds += time.perf_counter() - start
+        TELEMETRY.add_time("tokenize", tokenize_seconds)
+        TELEMETRY.add_time("cut_sentence", cut_seconds)
+        TELEMETRY.count("talk_rows", len(talk_rows))
+        TELEMETRY.count("sentences", len(sentence_spans))
+
+        # word freq: match each group once
+        with TELEMETRY.timer("match_words"):
+            word_group_counts = np.zeros((len(GROUPS), len(self.dict_keys)), dtype = np.int64)
+            for (speaker, is_QA), words in group_words.items():
+                counts = self.matcher.count(words)
+                word_group_counts[self.schema.group_index(speaker, is_QA)] = [counts[key] for key in self.dict_keys]
+
+        # sent freq: classify all sents in one batch
+        with TELEMETRY.timer("match_sentences"):
+            sent_count = self.sent_moral_classifier.word_count_by_spans(sent_words, sentence_spans)
+
+        # sum up the sents by group, then add the groups up into the nine slices of the row
+        with TELEMETRY.timer("assemble"):
+            sent_group_counts = np.zeros((len(GROUPS), len(self.dict_keys)), dtype = np.int64)
+            np.add.at(sent_group_counts, np.asarray(sent_group_idx, dtype = np.int64), sent_count)
+            group_sent_num = np.bincount(np.asarray(sent_group_idx, dtype = np.int64), minlength = len(GROUPS))
+            row = self.schema.new_row()
+            self.schema.fill_word_freq(row, word_group_counts)
+            self.schema.fill_sent_freq(row, sent_group_counts, group_sent_num)
+        return row
+
+    def threading(self, num_job: int, store_path: str = None, batch_size: int = 16, telemetry_path: str = None):
+        # keep the transcripts in the panel only, then hand them out largest first
+        final_df, self.worker_report, self.telemetry = count_transcripts(self.count_row, self.schema,
+                                                                         self.catalog.paths(self.trans_id_set),
+                                                                         self.catalog.sizes(self.trans_id_set),
+                                                                         num_job, store_path, batch_size, 'wsf',
+                                                                         telemetry_path, self.read_talk_rows)
+        return final_df
+
+if __name__ == '__main__':
+    moral_dict_path = "./ConfCall/moral foundations dictionary.txt"
+    panel_data_path = "./ConfCall/task1threading/factset_conf_call_panel_data_v4.csv"
+    processed_all_year_path = "./ConfCall/all_year_processed_data"
+    store_path = "./ConfCall/task1threading"
+
+    wsf = WordSentFreq(panel_data_path,
+                       processed_all_year_path,
+                       moral_dict_path)
+
+    # stream the results to parquet parts, then read them back in one go
+    wsf_results = read_results(wsf.threading(16, store_path = store_path + '/wsf_results'))
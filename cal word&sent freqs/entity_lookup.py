@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Resolve factset_entity_id to the company name and CUSIP of the lookup table.
+The table is indexed by entity ID once, and whole columns of IDs are resolved
+in one join. A cell may hold several comma-separated IDs; it resolves to the
+first of them that is in the table. Used by raw2panel and Panel2Cross.
+
+CONTENT
+-------
+- <FUNC> read_lookup
+- <CLASS> EntityLookup
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import pandas as pd
+
+# text columns of the lookup table; a CUSIP read as a number loses its leading zeros
+LOOKUP_DTYPES = {"factset_entity_id": str, "proper_name": str, "cusip": str}
+
+def read_lookup(lookup_df_path: str):
+    return pd.read_csv(lookup_df_path, dtype = LOOKUP_DTYPES)
+
+class EntityLookup:
+    def __init__(self, lookup_df: pd.DataFrame):
+        # entity ID -> (proper_name, cusip), the first row of an ID wins
+        self.index = lookup_df.drop_duplicates("factset_entity_id").set_index("factset_entity_id")[["proper_name", "cusip"]]
+
+    @classmethod
+    def from_csv(cls, lookup_df_path: str):
+        return cls(read_lookup(lookup_df_path))
+
+    def resolve(self, entity_ids: pd.Series):
+        '''
+        A method to resolve a column of entity IDs
+
+        Parameters
+        ----------
+        entity_ids: pd.Series
+            Entity IDs, each a single ID or comma-separated IDs; NaN allowed
+
+        Returns
+        -------
+        company_df: pd.DataFrame
+            Aligned with entity_ids, with columns Company and cusip: those of
+            the first ID of the cell that is in the table, '' if none is
+
+        '''
+        positions = pd.Series(entity_ids.values).dropna().astype(str)
+        sub_ids = positions.str.split(",").explode()
+        matched = sub_ids[sub_ids.isin(self.index.index)]
+        matched = matched[~matched.index.duplicated()]
+
+        company_df = pd.DataFrame({"Company": "", "cusip": ""}, index = range(len(entity_ids)), dtype = object)
+        company_df.loc[matched.index, ["Company", "cusip"]] = self.index.loc[matched.values].values
+        company_df.index = entity_ids.index
+        return company_df
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+An inverted index of the dictionary hits of a WordFreq run, for
+concordance queries without rescanning the text: category -> dictionary
+term -> postings (transcript_ID, speaker, QA flag, row, token offset).
+
+A posting is one hit of a term by a token: the row is the n-th non-empty
+talk row of the speaker in the transcript, the token offset the position
+of the token among the words counted in the row (see
+talk_slices.word_freq_tokens). A token hitting n terms makes n postings,
+so the postings add up to the word freq counts.
+
+Layout (index_path):
+- meta.json: the terms, their categories, the dtypes and sizes
+- term_start.bin: where the postings of every term start, plus the end
+- term_first.bin: the transcript_ID of the first posting of every term
+- doc_gap.bin: the transcript_IDs of a term's postings as gaps from the
+  previous posting of the term (0 for the first one), so the gaps fit a
+  dtype much narrower than the transcript_IDs
+- group.bin, row.bin, offset.bin: the talk group (see result_schema.GROUPS),
+  row and token offset of every posting
+- transcripts.bin: the transcript_IDs indexed, sorted
+Every array is stored in the narrowest unsigned dtype that holds it, and
+read through memory maps.
+
+Built by WordFreq(..., hit_index_path = ...).threading(): every batch
+writes its hits to a part, build_hit_index merges the parts.
+
+Run as a script:
+    python hit_index.py terms <index_path> [--category HarmVirtue]
+    python hit_index.py postings <index_path> <term> [--category HarmVirtue]
+
+CONTENT
+-------
+- <CLASS> HitRecorder
+- <FUNC> build_hit_index
+- <CLASS> HitIndex
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import sys
+import glob
+import json
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+from confcall.result_schema import ResultSchema, GROUPS
+
+POSTING_ARRAYS = ["doc_gap", "group", "row", "offset"]
+
+def _narrowest(values: np.ndarray):
+    # the narrowest unsigned dtype that holds every value
+    return np.min_scalar_type(int(values.max()) if len(values) > 0 else 0)
+
+class HitRecorder:
+    '''
+    Collect the hits of the transcripts counted in a worker, and write them
+    to a part file per batch (see scheduler.count_transcripts). Hits are
+    only taken between open() and close(), i.e. inside threading().
+
+    Parameters
+    ----------
+    part_path: str
+        Folder of the parts
+
+    '''
+    def __init__(self, part_path: str):
+        self.part_path = part_path
+        self._part = None
+        self._chunks = []
+
+    def open(self, part_name: str, transcript_ids: list):
+        '''
+        Start a part: the hits added until close() are written to it, with
+        the IDs of the transcripts of the batch (also those without hits)
+        '''
+        self._part = (part_name, list(transcript_ids))
+        self._chunks = []
+
+    def add(self, transcript_id: int, group_i: int, row_i: int, offsets: list, entries: list):
+        '''
+        Add the hits of a talk row: the token offset and the entry hit, one
+        item per hit
+        '''
+        if self._part is None:
+            raise ValueError("the hit index is recorded by threading() only; count single transcripts "
+                             "with an engine without hit_index_path")
+        if len(entries) == 0:
+            return
+        num_hits = len(entries)
+        self._chunks.append(np.column_stack([np.full(num_hits, transcript_id, dtype = np.int64),
+                                             np.full(num_hits, group_i, dtype = np.int64),
+                                             np.full(num_hits, row_i, dtype = np.int64),
+                                             np.asarray(offsets, dtype = np.int64),
+                                             np.asarray(entries, dtype = np.int64)]))
+
+    def close(self):
+        # write the part started by open(); nothing to do without one
+        if self._part is None:
+            return
+        part_name, transcript_ids = self._part
+        hits = np.concatenate(self._chunks) if len(self._chunks) > 0 else np.zeros((0, 5), dtype = np.int64)
+        self._part = None
+        self._chunks = []
+        # write to a temp name first, so a part is either complete or absent
+        tmp_path = self.part_path + '/' + part_name + '.tmp.npz'
+        np.savez(tmp_path, hits = hits, transcript_ids = np.asarray(transcript_ids, dtype = np.int64))
+        os.replace(tmp_path, self.part_path + '/' + part_name + '.npz')
+
+    def clear(self):
+        # drop the parts of an earlier run
+        self._part = None
+        self._chunks = []
+        shutil.rmtree(self.part_path, ignore_errors = True)
+        os.makedirs(self.part_path)
+
+def build_hit_index(part_path: str, index_path: str, matcher, sub_dict_name: dict):
+    '''
+    A func to merge the parts of a HitRecorder into an index
+
+    Parameters
+    ----------
+    part_path: str
+        Folder of the parts; removed once the index is written
+    index_path: str
+        Folder of the index
+    matcher: MoralDictMatcher
+        The matcher the hits were recorded with; its entries are the terms
+    sub_dict_name: dict
+        Sub-dict key -> name
+
+    Returns
+    -------
+    num_hits: int
+
+    '''
+    hit_parts, id_parts = [np.zeros((0, 5), dtype = np.int64)], [np.zeros(0, dtype = np.int64)]
+    for file_path in sorted(glob.glob(part_path + '/*.npz')):
+        with np.load(file_path) as part:
+            hit_parts.append(part["hits"])
+            id_parts.append(part["transcript_ids"])
+    hits = np.concatenate(hit_parts)
+    transcript_ids = np.unique(np.concatenate(id_parts))
+
+    # postings by term, then transcript, group, row and offset
+    hits = hits[np.lexsort((hits[:, 3], hits[:, 2], hits[:, 1], hits[:, 0], hits[:, 4]))]
+    term_start = np.searchsorted(hits[:, 4], np.arange(len(matcher.entry_terms) + 1))
+    doc_gap = np.diff(hits[:, 0], prepend = 0)
+    # the first transcript_ID of every term's list goes to term_first, its gap is 0
+    has_hits = term_start[:-1] < term_start[1:]
+    term_first = np.zeros(len(matcher.entry_terms), dtype = np.int64)
+    term_first[has_hits] = hits[term_start[:-1][has_hits], 0]
+    doc_gap[term_start[:-1][has_hits]] = 0
+    arrays = {"term_start": term_start, "term_first": term_first, "doc_gap": doc_gap, "group": hits[:, 1],
+              "row": hits[:, 2], "offset": hits[:, 3], "transcripts": transcript_ids}
+
+    os.makedirs(index_path, exist_ok = True)
+    dtypes = {}
+    for name, values in arrays.items():
+        dtypes[name] = _narrowest(values).str
+        values.astype(dtypes[name]).tofile(index_path + '/' + name + '.bin')
+    with open(index_path + '/meta.json', 'w') as file:
+        json.dump({"sub_dict_name": sub_dict_name, "dict_keys": list(matcher.categories),
+                   "terms": list(matcher.entry_terms), "term_category": list(matcher.entry_category),
+                   "num_hits": len(hits), "num_transcripts": len(transcript_ids), "dtypes": dtypes}, file)
+    shutil.rmtree(part_path, ignore_errors = True)
+    return len(hits)
+
+class HitIndex:
+    '''
+    Query an index written by build_hit_index. A category is given by its
+    key ("01") or name ("HarmVirtue"), a term as written in the dictionary
+    ("betray*"). The arrays are memory-mapped lazily and never pickled.
+
+    '''
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        with open(index_path + '/meta.json', 'r') as file:
+            self.meta = json.load(file)
+        self.sub_dict_name = self.meta["sub_dict_name"]
+        self.dict_keys = self.meta["dict_keys"]
+        self.terms = self.meta["terms"]
+        self.term_category = self.meta["term_category"]
+        self.schema = ResultSchema(self.sub_dict_name, self.dict_keys, sent_freq = False)
+        self._maps = None
+        self._doc_ids = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_maps'] = None
+        state['_doc_ids'] = None
+        return state
+
+    @property
+    def maps(self):
+        if self._maps is None:
+            lengths = {"term_start": len(self.terms) + 1, "term_first": len(self.terms),
+                       "transcripts": self.meta["num_transcripts"]}
+            self._maps = {}
+            for name, dtype in self.meta["dtypes"].items():
+                length = lengths.get(name, self.meta["num_hits"])
+                if length == 0:
+                    self._maps[name] = np.zeros(0, dtype = dtype)
+                else:
+                    self._maps[name] = np.memmap(self.index_path + '/' + name + '.bin', dtype = dtype,
+                                                 mode = 'r', shape = (length,))
+        return self._maps
+
+    @property
+    def doc_ids(self):
+        '''
+        The transcript_ID of every posting, decoded from the gaps once
+        '''
+        if self._doc_ids is None:
+            term_start = self.maps["term_start"].astype(np.int64)
+            running = np.cumsum(self.maps["doc_gap"], dtype = np.int64)
+            # the running sum before each term's list, taken off that list, plus the term's first ID
+            before = np.where(term_start[:-1] > 0, running[np.maximum(term_start[:-1] - 1, 0)], 0) \
+                     if len(running) > 0 else np.zeros(len(self.terms), dtype = np.int64)
+            first = self.maps["term_first"].astype(np.int64) - before
+            self._doc_ids = running + np.repeat(first, np.diff(term_start))
+        return self._doc_ids
+
+    def category_key(self, category: str):
+        if category in self.dict_keys:
+            return category
+        for key, name in self.sub_dict_name.items():
+            if name == category:
+                return key
+        raise KeyError("unknown category: " + str(category))
+
+    def term_ids(self, term: str = None, category: str = None):
+        # the entries of a term and/or category; a term listed twice in a category has two entries
+        key = None if category is None else self.category_key(category)
+        return [term_i for term_i in range(len(self.terms))
+                if (term is None or self.terms[term_i] == term) and (key is None or self.term_category[term_i] == key)]
+
+    def term_table(self, category: str = None):
+        '''
+        A method to list the terms of a category (or all) with their hits
+
+        Returns
+        -------
+        terms_df: pd.DataFrame
+            category, term, hits
+
+        '''
+        term_ids = self.term_ids(category = category)
+        hits = np.diff(self.maps["term_start"].astype(np.int64))
+        return pd.DataFrame({"category": [self.sub_dict_name[self.term_category[term_i]] for term_i in term_ids],
+                             "term": [self.terms[term_i] for term_i in term_ids],
+                             "hits": hits[term_ids]})
+
+    def postings(self, term: str = None, category: str = None, trans_ids = None):
+        '''
+        A method to list the hits of a term, of a category, or both
+
+        Parameters
+        ----------
+        term: str
+            A dictionary term, e.g. "betray*"
+        category: str
+            A category key or name
+        trans_ids: iterable
+            If given, only the hits in these transcripts
+
+        Returns
+        -------
+        postings_df: pd.DataFrame
+            category, term, transcript_ID, speaker, is_QA, row, offset; by
+            term, then in transcript order
+
+        '''
+        term_start = self.maps["term_start"]
+        parts = []
+        for term_i in self.term_ids(term, category):
+            start, end = int(term_start[term_i]), int(term_start[term_i + 1])
+            if start < end:
+                parts.append((term_i, start, end))
+        positions = np.concatenate([np.arange(start, end) for _, start, end in parts]) if parts else np.zeros(0, dtype = np.int64)
+        term_of = np.repeat([term_i for term_i, _, _ in parts], [end - start for _, start, end in parts]).astype(np.int64)
+        doc_ids = self.doc_ids[positions]
+        if trans_ids is not None:
+            keep = np.isin(doc_ids, np.asarray(list(trans_ids), dtype = np.int64))
+            positions, term_of, doc_ids = positions[keep], term_of[keep], doc_ids[keep]
+        groups = self.maps["group"][positions].astype(np.int64)
+        return pd.DataFrame({"category": [self.sub_dict_name[self.term_category[term_i]] for term_i in term_of],
+                             "term": [self.terms[term_i] for term_i in term_of],
+                             "transcript_ID": doc_ids,
+                             "speaker": [GROUPS[group_i][0] for group_i in groups],
+                             "is_QA": [GROUPS[group_i][1] for group_i in groups],
+                             "row": self.maps["row"][positions].astype(np.int64),
+                             "offset": self.maps["offset"][positions].astype(np.int64)})
+
+    def transcripts(self, term: str = None, category: str = None):
+        # the sorted transcript_IDs where a term (or any term of a category) fires
+        return np.unique(self.postings(term, category)["transcript_ID"].to_numpy())
+
+    def recount(self, trans_ids = None, category: str = None):
+        '''
+        A method to recompute the word freq columns from the postings
+
+        Parameters
+        ----------
+        trans_ids: iterable
+            The transcripts; None for all indexed ones
+        category: str
+            If given, only the columns of this category
+
+        Returns
+        -------
+        counts_df: pd.DataFrame
+            The columns of WordFreq, indexed by transcript_ID, in the order
+            of trans_ids (sorted if None); a transcript without hits has
+            zeros
+
+        '''
+        trans_ids = np.asarray(self.maps["transcripts"] if trans_ids is None else list(trans_ids), dtype = np.int64)
+        term_ids = np.asarray(self.term_ids(category = category), dtype = np.int64)
+        key_index = dict([(key, key_i) for key_i, key in enumerate(self.dict_keys)])
+        term_key = np.array([key_index[key] for key in self.term_category], dtype = np.int64)
+
+        # the postings of the terms, as (row of trans_ids, group, category)
+        term_start = self.maps["term_start"].astype(np.int64)
+        positions = np.concatenate([np.arange(term_start[term_i], term_start[term_i + 1]) for term_i in term_ids]) \
+                    if len(term_ids) > 0 else np.zeros(0, dtype = np.int64)
+        term_of = np.repeat(term_ids, term_start[term_ids + 1] - term_start[term_ids])
+        unique_ids, id_rows = np.unique(trans_ids, return_inverse = True)
+        doc_ids = self.doc_ids[positions]
+        found = np.searchsorted(unique_ids, doc_ids)
+        keep = (found < len(unique_ids)) & (unique_ids[np.minimum(found, len(unique_ids) - 1)] == doc_ids) \
+               if len(unique_ids) > 0 else np.zeros(len(doc_ids), dtype = bool)
+        group_counts = np.zeros((len(unique_ids), len(GROUPS), len(self.dict_keys)), dtype = np.int64)
+        np.add.at(group_counts, (found[keep], self.maps["group"][positions[keep]].astype(np.int64), term_key[term_of[keep]]), 1)
+
+        block = self.schema.new_block(len(unique_ids))
+        self.schema.fill_word_freq(block, group_counts)
+        counts_df = self.schema.to_frame(block[id_rows], pd.Index(trans_ids, name = "transcript_ID"))
+        if category is not None:
+            name = self.sub_dict_name[self.category_key(category)]
+            counts_df = counts_df[[column for column in counts_df.columns
+                                   if column.rsplit('_', 1)[0] in [name, "QA_" + name, "exclude_QA_" + name]]]
+        return counts_df
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Query a dictionary hit index")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+    terms_parser = subparsers.add_parser("terms")
+    terms_parser.add_argument("index_path")
+    terms_parser.add_argument("--category", default = None)
+    postings_parser = subparsers.add_parser("postings")
+    postings_parser.add_argument("index_path")
+    postings_parser.add_argument("term")
+    postings_parser.add_argument("--category", default = None)
+    args = parser.parse_args(argv)
+
+    index = HitIndex(args.index_path)
+    if args.command == "terms":
+        print(index.term_table(args.category).sort_values("hits", ascending = False).to_string(index = False))
+    else:
+        print(index.postings(args.term, args.category).to_string(index = False))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Load the moral foundations dictionary and compile it into a matcher, so that
+every token is resolved to its categories with a few hash lookups instead of
+a scan over the whole lexicon. Several dictionaries (e.g. the moral
+foundations and the time focus ones) can be loaded as one, with namespaced
+categories, so one pass over the corpus counts them all.
+
+CONTENT
+-------
+- <FUNC> dict_path_list
+- <FUNC> load_lexicon
+- <FUNC> load_moral_dict
+- <FUNC> compile_moral_dict
+- <CLASS> MoralDictMatcher
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+from collections import Counter
+
+def dict_path_list(dict_path):
+    # a dictionary path, a list of them, or a dict of namespace -> path, as a list of paths
+    if isinstance(dict_path, str):
+        return [dict_path]
+    if isinstance(dict_path, dict):
+        return list(dict_path.values())
+    return list(dict_path)
+
+def load_lexicon(dict_path: str):
+    # load one dictionary file: the categories are listed between the two "%" lines, then the words
+    with open(dict_path, 'r') as file:
+        moral_dict_ct = file.read()
+    temp_dict = moral_dict_ct.splitlines()
+
+    for line_i in range(len(temp_dict)):
+        temp_dict[line_i] = temp_dict[line_i].replace('\t', ' ')
+
+    header_end = [line_i for line_i, line in enumerate(temp_dict) if line.strip() == '%'][1]
+    sub_dict_keys = temp_dict[1:header_end]
+    for line_i in range(len(sub_dict_keys)):
+        sub_dict_keys[line_i] = sub_dict_keys[line_i].split()
+
+    temp_sub_dicts = temp_dict[header_end + 1:]
+    sub_dicts = {}
+    sub_dict_name = {}
+    for item in sub_dict_keys:
+        sub_dicts[item[0]] = []
+        sub_dict_name[item[0]] = item[1]
+
+    for line in temp_sub_dicts:
+        if len(line.replace(' ', '')) == 0:
+            continue
+        temp_item = line.split()
+        if len(temp_item) > 2:
+            for key in temp_item[1:]:
+                sub_dicts[key].append(temp_item[0])
+        else:
+            sub_dicts[temp_item[1]].append(temp_item[0])
+
+    return sub_dict_name, sub_dicts
+
+# load the dictionary, return a dict of sub dictionaries
+def load_moral_dict(dict_path):
+    '''
+    Load a dictionary, or several combined into one
+
+    Parameters
+    ----------
+    dict_path: str, list or dict
+        A dictionary file; or a list of them, namespaced by file name; or a
+        dict of namespace -> dictionary file
+
+    Returns
+    -------
+    sub_dict_name: dict
+        Sub-dictionary key -> sub-dictionary name. The keys of combined
+        dictionaries are "namespace:key"; a name found in several of them
+        becomes "namespace_name", so the output columns stay apart
+    sub_dicts: dict
+        Sub-dictionary key -> words
+
+    '''
+    if isinstance(dict_path, str):
+        return load_lexicon(dict_path)
+
+    if not isinstance(dict_path, dict):
+        names = [os.path.splitext(os.path.basename(path))[0] for path in dict_path]
+        if len(set(names)) < len(names):
+            raise ValueError("dictionary files with the same name; pass a dict of namespace -> path")
+        dict_path = dict(zip(names, dict_path))
+    lexicons = [(namespace, load_lexicon(path)) for namespace, path in dict_path.items()]
+    name_counts = Counter([name for _, (names, _) in lexicons for name in names.values()])
+
+    sub_dict_name, sub_dicts = {}, {}
+    for namespace, (names, words) in lexicons:
+        for key, name in names.items():
+            sub_dict_name[namespace + ':' + key] = name if name_counts[name] == 1 else namespace + '_' + name
+            sub_dicts[namespace + ':' + key] = words[key]
+    return sub_dict_name, sub_dicts
+
+def compile_moral_dict(dict_path):
+    '''
+    Load the dictionary and compile it in one go
+
+    Parameters
+    ----------
+    dict_path: str, list or dict
+        Path to the moral foundations dictionary, or several dictionaries
+        (see load_moral_dict)
+
+    Returns
+    -------
+    sub_dict_name: dict
+        Sub-dictionary key -> sub-dictionary name, as in load_moral_dict
+    matcher: MoralDictMatcher
+        The compiled matcher of the sub-dictionaries
+
+    '''
+    sub_dict_name, sub_dicts = load_moral_dict(dict_path)
+    return sub_dict_name, MoralDictMatcher(sub_dicts)
+
+class MoralDictMatcher:
+    '''
+    A compiled form of the sub-dictionaries returned by load_moral_dict.
+
+    Every keyword of every sub-dictionary is an "entry". Exact keywords are
+    kept in a hash table; wildcard keywords (e.g. "betray*") are reduced to
+    their stem and kept in a second hash table keyed on the stem, together
+    with the set of stem lengths. A token is then resolved by one exact
+    lookup plus one lookup per stem length, which is what a prefix trie
+    would do, and the result is memoised per token type.
+
+    Duplicated keywords are kept as separate entries, so the counts are the
+    same as those of the original keyword-by-keyword loops.
+
+    '''
+    def __init__(self, sub_dicts: dict):
+        self.categories = list(sub_dicts.keys())
+        self.entry_terms = []
+        self.entry_category = []
+        self.exact_index = {}
+        self.prefix_index = {}
+        for category in self.categories:
+            for term in sub_dicts[category]:
+                entry_i = len(self.entry_terms)
+                self.entry_terms.append(term)
+                self.entry_category.append(category)
+                if "*" in term:
+                    stem = term.split("*")[0]
+                    self.prefix_index.setdefault(stem, []).append(entry_i)
+                else:
+                    self.exact_index.setdefault(term, []).append(entry_i)
+        self.prefix_lengths = sorted(set(len(stem) for stem in self.prefix_index))
+        self._entry_cache = {}
+
+    def match_entries(self, token: str):
+        '''
+        Resolve a token to the dictionary entries it hits
+
+        Parameters
+        ----------
+        token: str
+            A single (already normalised) word
+
+        Returns
+        -------
+        entries: tuple
+            Indices of the entries hit by the token; empty if none
+
+        '''
+        entries = self._entry_cache.get(token)
+        if entries is not None:
+            return entries
+
+        entries = list(self.exact_index.get(token, ()))
+        for length in self.prefix_lengths:
+            if length > len(token):
+                break
+            entries += self.prefix_index.get(token[:length], ())
+        entries = tuple(entries)
+        self._entry_cache[token] = entries
+        return entries
+
+    def match(self, token: str):
+        '''
+        Resolve a token to its categories, one item per entry hit
+        '''
+        return tuple(self.entry_category[entry_i] for entry_i in self.match_entries(token))
+
+    def count(self, words):
+        '''
+        Count the hits of every category in a list of words; a word hitting
+        n entries of a category adds n to that category
+
+        Parameters
+        ----------
+        words: list or Counter
+            The words to count, or a Counter of them
+
+        Returns
+        -------
+        count_result: dict
+            Category -> number of hits
+
+        '''
+        count_result = dict([(category, 0) for category in self.categories])
+        words_counter = words if isinstance(words, Counter) else Counter(words)
+        for word, word_count in words_counter.items():
+            for entry_i in self.match_entries(word):
+                count_result[self.entry_category[entry_i]] += word_count
+        return count_result
+
+    def count_distinct(self, words):
+        '''
+        Count, for every category, the number of distinct entries that
+        appear at least once in a list of words
+
+        Parameters
+        ----------
+        words: list
+            The words of a sentence
+
+        Returns
+        -------
+        count_result: dict
+            Category -> number of entries hit
+
+        '''
+        count_result = dict([(category, 0) for category in self.categories])
+        hit_entries = set()
+        for word in set(words):
+            hit_entries.update(self.match_entries(word))
+        for entry_i in hit_entries:
+            count_result[self.entry_category[entry_i]] += 1
+        return count_result
@@ -8,15 +8,22 @@ A module to classify a sent into a certain polarity, based on the words appear i
 CONTENTS
 --------
 - <FUNC> cut_sentence
-- <FUNC> load_moral_dict
+- <FUNC> iter_sentence_spans
+- <FUNC> cut_sentence_words
+- <FUNC> sentence_word
+- <FUNC> load_moral_dict (from moral_dict)
 - <FUNC> word_in_sentence
 - <CLASS> SentenceMoralClassifier
 
 VERSION
 -------
-Last update: R4/8/26(Kin)
+Last update: R8/10/18(Kin)
 
 '''
+import numpy as np
+from scipy import sparse
+from confcall.moral_dict import load_moral_dict, MoralDictMatcher
+
 def cut_sentence(talk_content: str):
     '''
     A func to cut a string of text into a list of sentences
@@ -32,54 +39,71 @@ def cut_sentence(talk_content: str):
         A list of sentences in the original content
 
     '''
-    talk_sentences = []
-    talk_words = talk_content.split()
+    return [" ".join(sentence_words) for sentence_words in cut_sentence_words(talk_content.split())]
+
+# titles whose trailing period does not end a sent
+SENTENCE_EXCEPTIONS = frozenset(["Mr", "Mrs", "Miss", "Ms", "Sir", "Madam", "Dr", "Cllr", "Lady", "Lord", "Professor", "Prof",
+                                 "Chancellor", "Principal", "President", "Master", "Governer", "Gov", "Attorney", "Atty"])
+
+def iter_sentence_spans(talk_words: list, start: int = 0):
+    '''
+    A generator of the sents of a list of words, as token spans
+
+    Parameters
+    ----------
+    talk_words: list
+        The words of a text, i.e. talk_content.split()
+    start: int
+        Added to every span, e.g. the position of talk_words in a larger
+        token array
+
+    Yields
+    ------
+    span: tuple
+        (first word, last word + 1) of a sent; the spans cover talk_words
+        in order, and talk_words[first: last + 1] is a sent of cut_sentence
+
+    '''
     last_sentence_idx = 0
-    exception_rule = ["Mr", "Mrs", "Miss", "Ms", "Sir", "Madam", "Dr", "Cllr", "Lady", "Lord", "Professor", "Prof",
-                      "Chancellor", "Principal", "President", "Master", "Governer", "Gov", "Attorney", "Atty"]
-    for w_i in range(len(talk_words)):
+    last_w_i = len(talk_words) - 1
+    for w_i in range(last_w_i):
         talk_word = talk_words[w_i]
-        if w_i == len(talk_words) - 1:
-            talk_sentences.append(" ".join(talk_words[last_sentence_idx: w_i + 1]))
-        else:
-            if talk_word[-1] in [".", "?", "!"]:
-                if talk_word[:-1] not in exception_rule:
-                    if talk_words[w_i + 1][0].isupper():
-
-                        talk_sentences.append(" ".join(talk_words[last_sentence_idx: w_i + 1]))
-                        last_sentence_idx = w_i + 1
-    return talk_sentences
-
-def load_moral_dict(dict_path):
-    with open(dict_path, 'r') as file:
-        moral_dict_ct = file.read()
-    temp_dict = moral_dict_ct.splitlines()
-    
-    for line_i in range(len(temp_dict)):
-        temp_dict[line_i] = temp_dict[line_i].replace('\t', ' ')
+        # a sent ends at .?! unless after a title, and only if the next word is capitalised
+        if talk_word[-1] in ".?!" and talk_words[w_i + 1][0].isupper() and talk_word[:-1] not in SENTENCE_EXCEPTIONS:
+            yield start + last_sentence_idx, start + w_i + 1
+            last_sentence_idx = w_i + 1
+    if last_w_i >= 0:
+        yield start + last_sentence_idx, start + last_w_i + 1
 
-    sub_dict_keys = temp_dict[1:12]
-    for line_i in range(len(sub_dict_keys)):
-        sub_dict_keys[line_i] = sub_dict_keys[line_i].split()
+def cut_sentence_words(talk_words: list):
+    '''
+    A func to cut a list of words into sentences, same rule as cut_sentence
+
+    Parameters
+    ----------
+    talk_words: list
+        The words of a text, i.e. talk_content.split()
     
-    temp_sub_dicts = temp_dict[14:]
-    sub_dicts = {}
-    sub_dict_name = {}
-    for item in sub_dict_keys:
-        sub_dicts[item[0]] = []
-        sub_dict_name[item[0]] = item[1]
-        
-    for line in temp_sub_dicts:
-        if len(line.replace(' ', '')) == 0:
-            continue
-        temp_item = line.split()
-        if len(temp_item) > 2:
-            for key in temp_item[1:]:
-                sub_dicts[key].append(temp_item[0])
-        else:
-            sub_dicts[temp_item[1]].append(temp_item[0])
-    return sub_dict_name, sub_dicts
-  
+    Returns
+    -------
+    talk_sentences: list
+        A list of sentences, each a list of words
+
+    '''
+    return [talk_words[first: last] for first, last in iter_sentence_spans(talk_words)]
+
+# punctuations eliminated from the words of a sent
+SENTENCE_SYMBOLS = str.maketrans("", "", "!?.,;")
+
+def sentence_word(word: str):
+    '''
+    A func to normalise a word of a sent before matching: lowercased unless
+    it is all upper case (e.g. "US"), punctuations eliminated
+    '''
+    if not word.isupper():
+        word = word.lower()
+    return word.translate(SENTENCE_SYMBOLS)
+
 def word_in_sentence(dict_word: str, sentence: list):
     '''
     A func to check whether a word(or lemma of word) is in the given sent
@@ -119,6 +143,23 @@ class SentenceMoralClassifier:
         self.sub_dict_name, sub_dicts = load_moral_dict(dict_path = dict_path)
         for key,value in sub_dicts.items():
             self.word_dicts[key] = value
+        self.matcher = MoralDictMatcher(sub_dicts)
+
+        # entry x sub-dict incidence, to fold entry hits into sub-dict counts
+        category_idx = dict([(key, key_i) for key_i, key in enumerate(self.matcher.categories)])
+        entry_category = [category_idx[category] for category in self.matcher.entry_category]
+        self.entry_category_matrix = sparse.csr_matrix(
+            (np.ones(len(entry_category), dtype=np.int64), (np.arange(len(entry_category)), entry_category)),
+            shape=(len(entry_category), len(category_idx)))
+
+    def sentence_words(self, sentence):
+        '''
+        A method to crush a sent (a string, or a list of words from
+        cut_sentence_words) into the words matched against the dictionary
+        '''
+        if isinstance(sentence, str):
+            sentence = sentence.split()
+        return [sentence_word(w) for w in sentence]
 
     def word_count_by_dict(self, sentence: str):
         '''
@@ -135,18 +176,86 @@ class SentenceMoralClassifier:
             A dict that saves the polarity of the sent
             
         '''
-        moral_word_count = {}
-        sentence = [w.lower() if not w.isupper() else w for w in sentence.split()]
+        # number of distinct dictionary words of each sub-dict that appear in the sent
+        return self.matcher.count_distinct(self.sentence_words(sentence))
 
-        replace_list = ["!", "?", ".", ",", ";"]
-        for replace_w in replace_list:
-            for word_i in range(len(sentence)):
-                sentence[word_i] = sentence[word_i].replace(replace_w, "")
+    def word_count_by_batch(self, sentences: list):
+        '''
+        A method to calculate the polarities of many sents at once, e.g. all
+        sents of a transcript or of a whole shard. Gives the same counts as
+        calling word_count_by_dict on every sent.
+
+        Parameters
+        ----------
+        sentences: list
+            A list of sents, as strings or as lists of words
         
-        for key, words in self.word_dicts.items():
-            moral_word_count[key] = 0
-            for word in words:
-                if word_in_sentence(word, sentence):
-                    moral_word_count[key] += 1
-        return moral_word_count
-    
+        Returns
+        -------
+        moral_word_count: np.ndarray
+            An int array of shape (len(sentences), len(self.matcher.categories));
+            entry [i, j] is the number of distinct dictionary words of sub-dict
+            self.matcher.categories[j] that appear in sent i
+            
+        '''
+        # sent x word type incidence
+        vocab = {}
+        sent_idx, type_idx = [], []
+        for sent_i, sentence in enumerate(sentences):
+            for word in set(self.sentence_words(sentence)):
+                sent_idx.append(sent_i)
+                type_idx.append(vocab.setdefault(word, len(vocab)))
+        return self._count_sent_types(sent_idx, type_idx, vocab, len(sentences))
+
+    def word_count_by_spans(self, talk_words: list, spans):
+        '''
+        A method to calculate the polarities of sents given as spans over one
+        list of words, e.g. from iter_sentence_spans, without building the
+        sents. Gives the same counts as word_count_by_batch on the sents.
+
+        Parameters
+        ----------
+        talk_words: list
+            The words of all sents
+        spans: iterable
+            (first word, last word + 1) of every sent
+
+        Returns
+        -------
+        moral_word_count: np.ndarray
+            Same as word_count_by_batch, one row per span
+
+        '''
+        # every word is normalised once, then the sents index the word types
+        vocab = {}
+        word_types = [vocab.setdefault(sentence_word(word), len(vocab)) for word in talk_words]
+        sent_idx, type_idx = [], []
+        num_sents = 0
+        for first, last in spans:
+            for type_i in set(word_types[first: last]):
+                sent_idx.append(num_sents)
+                type_idx.append(type_i)
+            num_sents += 1
+        return self._count_sent_types(sent_idx, type_idx, vocab, num_sents)
+
+    def _count_sent_types(self, sent_idx: list, type_idx: list, vocab: dict, num_sents: int):
+        # sent x word type incidence -> sent x sub-dict counts
+        sent_type = sparse.csr_matrix(
+            (np.ones(len(sent_idx), dtype=np.int64), (sent_idx, type_idx)),
+            shape=(num_sents, len(vocab)))
+
+        # word type x entry incidence, each type resolved once
+        hit_type_idx, hit_entry_idx = [], []
+        for word, type_i in vocab.items():
+            for entry_i in self.matcher.match_entries(word):
+                hit_type_idx.append(type_i)
+                hit_entry_idx.append(entry_i)
+        type_entry = sparse.csr_matrix(
+            (np.ones(len(hit_type_idx), dtype=np.int64), (hit_type_idx, hit_entry_idx)),
+            shape=(len(vocab), len(self.matcher.entry_terms)))
+
+        # an entry counts once per sent however many of its word types appear
+        sent_entry = sent_type @ type_entry
+        sent_entry.data[:] = 1
+
+        return np.asarray((sent_entry @ self.entry_category_matrix).todense())
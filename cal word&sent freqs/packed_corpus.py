@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Pack all_year_processed_data into a few large files and read it back through
+memory maps, so counting never opens the per-transcript CSVs:
+- text.bin: the talk_content of every row, one contiguous UTF-8 blob
+- rows_*.bin: one fixed-width array per row attribute (transcript_ID,
+  speaker, question flag, text flag, byte offsets into text.bin)
+- transcripts.parquet: transcript_ID -> original path, row range, size
+- meta.json: dtypes, lengths and an id of the pack
+
+Run as a script to pack a corpus:
+    python packed_corpus.py <processed_all_year_path> <packed_path>
+
+CONTENT
+-------
+- <FUNC> pack_corpus
+- <CLASS> PackedCorpus
+- <FUNC> open_transcript_source
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import sys
+import json
+import uuid
+import numpy as np
+import pandas as pd
+from confcall.talk_slices import read_talk_rows, transcript_id_from_path, SPEAKER_FILES
+from confcall.transcript_catalog import TranscriptCatalog
+from confcall.prefetch import PrefetchReader
+from confcall.transcript_reader import TranscriptReader
+
+SPEAKERS = [speaker for speaker, _ in SPEAKER_FILES]
+
+# name -> dtype of the row arrays
+ROW_ARRAYS = {"transcript_ID": np.int64,
+              "speaker": np.uint8,
+              "question": np.bool_,
+              "is_text": np.bool_,
+              "offset": np.int64}
+
+def pack_corpus(processed_all_year_path: str, packed_path: str, trans_ids = None, catalog_path: str = None):
+    '''
+    A func to pack the transcripts of a processed_all_year_path
+
+    Parameters
+    ----------
+    processed_all_year_path: str
+        Folder of the "processed" year folders
+    packed_path: str
+        Output folder; created if missing, overwritten if present
+    trans_ids: iterable
+        Only pack these transcript IDs; None packs all
+    catalog_path: str
+        Passed to TranscriptCatalog
+
+    Returns
+    -------
+    num_trans: int
+        Number of transcripts packed
+
+    '''
+    os.makedirs(packed_path, exist_ok = True)
+    catalog_df = TranscriptCatalog(processed_all_year_path, catalog_path).refresh().select(trans_ids)
+
+    row_files = dict([(name, open(packed_path + '/rows_' + name + '.bin', 'wb')) for name in ROW_ARRAYS])
+    text_file = open(packed_path + '/text.bin', 'wb')
+    trans_records = []
+    num_rows = 0
+    offset = 0
+    try:
+        np.array([0], dtype = ROW_ARRAYS["offset"]).tofile(row_files["offset"])
+        for trans_id, trans_path in zip(catalog_df["transcript_ID"], catalog_df["path"]):
+            talk_rows = read_talk_rows(trans_path)
+            row_start = num_rows
+            text_start = offset
+            encoded = [str(talk_content).encode('utf-8') for _, _, talk_content in talk_rows]
+            lengths = np.array([len(text) for text in encoded], dtype = np.int64)
+
+            text_file.write(b''.join(encoded))
+            np.full(len(talk_rows), trans_id, dtype = ROW_ARRAYS["transcript_ID"]).tofile(row_files["transcript_ID"])
+            np.array([SPEAKERS.index(speaker) for speaker, _, _ in talk_rows], dtype = ROW_ARRAYS["speaker"]).tofile(row_files["speaker"])
+            np.array([is_QA for _, is_QA, _ in talk_rows], dtype = ROW_ARRAYS["question"]).tofile(row_files["question"])
+            np.array([isinstance(talk_content, str) for _, _, talk_content in talk_rows], dtype = ROW_ARRAYS["is_text"]).tofile(row_files["is_text"])
+            (offset + np.cumsum(lengths)).astype(ROW_ARRAYS["offset"]).tofile(row_files["offset"])
+
+            num_rows += len(talk_rows)
+            offset += int(lengths.sum())
+            trans_records.append((trans_id, trans_path, row_start, num_rows, offset - text_start))
+    finally:
+        text_file.close()
+        for row_file in row_files.values():
+            row_file.close()
+
+    trans_df = pd.DataFrame(trans_records, columns = ["transcript_ID", "path", "row_start", "row_end", "size"])
+    trans_df.to_parquet(packed_path + '/transcripts.parquet', index = False)
+    with open(packed_path + '/meta.json', 'w') as file:
+        json.dump({"pack_id": uuid.uuid4().hex, "num_rows": num_rows, "text_bytes": offset,
+                   "num_transcripts": len(trans_df), "speakers": SPEAKERS,
+                   "dtypes": dict([(name, np.dtype(dtype).str) for name, dtype in ROW_ARRAYS.items()])}, file)
+    return len(trans_df)
+
+class PackedCorpus:
+    '''
+    Read a corpus written by pack_corpus through memory maps. Offers the
+    paths/sizes/select methods of TranscriptCatalog and the read_talk_rows
+    of talk_slices, so the engines can use it in place of both.
+
+    The maps are opened lazily and never pickled, so a PackedCorpus is cheap
+    to ship to joblib workers.
+
+    '''
+    def __init__(self, packed_path: str):
+        self.packed_path = packed_path
+        with open(packed_path + '/meta.json', 'r') as file:
+            self.meta = json.load(file)
+        self.pack_id = self.meta["pack_id"]
+        self.catalog_df = pd.read_parquet(packed_path + '/transcripts.parquet')
+        self.trans_rows = dict([(str(trans_id), (row_start, row_end)) for trans_id, row_start, row_end
+                                in zip(self.catalog_df["transcript_ID"], self.catalog_df["row_start"], self.catalog_df["row_end"])])
+        self._maps = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_maps'] = None
+        return state
+
+    @property
+    def maps(self):
+        # the prefetch threads open the maps too: publish the dict only once it is complete
+        if self._maps is None:
+            maps = {}
+            for name in ROW_ARRAYS:
+                length = self.meta["num_rows"] + 1 if name == "offset" else self.meta["num_rows"]
+                maps[name] = self._memmap(self.packed_path + '/rows_' + name + '.bin',
+                                          np.dtype(self.meta["dtypes"][name]), length)
+            maps["text"] = self._memmap(self.packed_path + '/text.bin', np.uint8, self.meta["text_bytes"])
+            self._maps = maps
+        return self._maps
+
+    @staticmethod
+    def _memmap(path: str, dtype, length: int):
+        # np.memmap cannot map an empty file
+        if length == 0:
+            return np.zeros(0, dtype = dtype)
+        return np.memmap(path, dtype = dtype, mode = 'r', shape = (length,))
+
+    def select(self, trans_ids = None):
+        if trans_ids is None:
+            return self.catalog_df
+        if not isinstance(trans_ids, (set, frozenset)):
+            trans_ids = set(trans_ids)
+        return self.catalog_df[self.catalog_df["transcript_ID"].isin(trans_ids)]
+
+    def paths(self, trans_ids = None):
+        return list(self.select(trans_ids)["path"])
+
+    def sizes(self, trans_ids = None):
+        return list(self.select(trans_ids)["size"])
+
+    def row_range(self, trans_path: str):
+        '''
+        (first row, last row + 1) of a transcript, (0, 0) if not packed
+        '''
+        return self.trans_rows.get(transcript_id_from_path(trans_path), (0, 0))
+
+    def read_talk_rows(self, trans_path: str):
+        '''
+        Same output as talk_slices.read_talk_rows, read from the maps
+        '''
+        maps = self.maps
+        row_start, row_end = self.row_range(trans_path)
+        offsets = maps["offset"][row_start: row_end + 1]
+        text = maps["text"]
+        talk_rows = []
+        for row_i in range(row_start, row_end):
+            talk_content = bytes(text[offsets[row_i - row_start]: offsets[row_i - row_start + 1]]).decode('utf-8')
+            if not maps["is_text"][row_i]:
+                talk_content = float(talk_content)
+            talk_rows.append((SPEAKERS[maps["speaker"][row_i]], bool(maps["question"][row_i]), talk_content))
+        return talk_rows
+
+def open_transcript_source(processed_all_year_path: str, catalog_path: str = None, packed_corpus_path: str = None,
+                           prefetch_depth: int = 4, io_threads: int = 2, reader_backend: str = "pandas"):
+    '''
+    The catalog and the row reader of the engines: the packed corpus if
+    packed_corpus_path is given, else the transcript folders, read by a
+    TranscriptReader with reader_backend ("auto" times the backends on a
+    sample of the catalog)
+
+    Returns
+    -------
+    catalog: TranscriptCatalog or PackedCorpus
+    row_reader: PrefetchReader
+        row_reader(trans_path) -> list of (speaker, is_QA, talk_content);
+        reads up to prefetch_depth scheduled transcripts ahead in io_threads
+        threads
+
+    '''
+    if packed_corpus_path is not None:
+        packed_corpus = PackedCorpus(packed_corpus_path)
+        return packed_corpus, PrefetchReader(packed_corpus.read_talk_rows, prefetch_depth, io_threads)
+    catalog = TranscriptCatalog(processed_all_year_path, catalog_path).refresh()
+    sample_paths = None
+    if reader_backend == "auto":
+        # up to 16 transcripts spread over the catalog
+        paths = catalog.paths()
+        sample_paths = paths[::max(1, len(paths) // 16)][:16]
+    return catalog, PrefetchReader(TranscriptReader(reader_backend, sample_paths), prefetch_depth, io_threads)
+
+if __name__ == '__main__':
+    num_trans = pack_corpus(sys.argv[1], sys.argv[2])
+    print("packed %d transcripts into %s" % (num_trans, sys.argv[2]))
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Load the wide conf call panel compactly. Only the columns a stage needs are
+read; the comma-separated names and person IDs are cut to their first item
+with vectorized string ops; text columns (IDs, names, dates, conf types)
+become categoricals; numeric columns are downcast to int32 or float32 where
+no value changes, and stay float64 otherwise. The panel is a CSV or a
+parquet file, and can be read in chunks. Used by raw2panel and Panel2Cross.
+
+CONTENT
+-------
+- <FUNC> first_of_list
+- <FUNC> compact_frame
+- <FUNC> panel_columns
+- <FUNC> load_panel
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+# columns of comma-separated lists of which only the first item is kept
+LIST_COLUMNS = ["ceo_name", "cfo_name", "ceo_factset_person_id", "cfo_factset_person_id"]
+
+INT32_INFO = np.iinfo(np.int32)
+
+def first_of_list(column: pd.Series):
+    # "a,b" -> "a", NaN stays NaN
+    return column.dropna().astype(str).str.split(",").str[0].reindex(column.index)
+
+def _downcast(column: pd.Series):
+    # the narrowest of int32/float32 that holds every value of column exactly
+    values = column.to_numpy()
+    if values.dtype.kind == 'i':
+        if len(values) == 0 or (values.min() >= INT32_INFO.min and values.max() <= INT32_INFO.max):
+            return column.astype(np.int32)
+        return column
+    if values.dtype.kind != 'f' or values.dtype == np.float32:
+        return column
+    if not np.isnan(values).any() and np.array_equal(values, np.round(values)) and \
+            (len(values) == 0 or (values.min() >= INT32_INFO.min and values.max() <= INT32_INFO.max)):
+        return column.astype(np.int32)
+    if np.array_equal(values.astype(np.float32).astype(np.float64), values, equal_nan = True):
+        return column.astype(np.float32)
+    return column
+
+def compact_frame(panel_df: pd.DataFrame, list_columns: list = LIST_COLUMNS):
+    '''
+    A func to cut the list columns to their first item, turn text columns
+    into categoricals and downcast numeric columns, in place
+
+    Returns
+    -------
+    panel_df: pd.DataFrame
+        The input frame
+
+    '''
+    for column in panel_df.columns:
+        if column in list_columns:
+            panel_df[column] = first_of_list(panel_df[column])
+        if pd.api.types.is_numeric_dtype(panel_df[column]):
+            panel_df[column] = _downcast(panel_df[column])
+        elif not isinstance(panel_df[column].dtype, pd.CategoricalDtype):
+            panel_df[column] = panel_df[column].astype('category')
+    return panel_df
+
+def panel_columns(panel_df_path: str):
+    # the header of the panel
+    if panel_df_path.endswith('.parquet'):
+        return pq.ParquetFile(panel_df_path).schema_arrow.names
+    return list(pd.read_csv(panel_df_path, nrows = 0).columns)
+
+def _read_parquet(panel_df_path: str, columns: list, chunksize: int):
+    # a parquet panel, whole or as an iterator of chunks
+    if chunksize is None:
+        return pd.read_parquet(panel_df_path, columns = columns)
+    batches = pq.ParquetFile(panel_df_path).iter_batches(batch_size = chunksize, columns = columns)
+    return (batch.to_pandas() for batch in batches)
+
+def load_panel(panel_df_path: str, columns: list = None, list_columns: list = LIST_COLUMNS,
+               compact: bool = True, chunksize: int = None):
+    '''
+    A func to load the panel
+
+    Parameters
+    ----------
+    panel_df_path: str
+        The panel, a CSV or a parquet file (by extension), e.g. the
+        intermediate of pipeline
+    columns: list
+        The columns to read, in the order of the file; None reads all
+    list_columns: list
+        Columns of which only the first comma-separated item is kept
+    compact: bool
+        If True, apply compact_frame; else only cut the list columns, with
+        the dtypes of pd.read_csv
+    chunksize: int
+        If given, return an iterator of frames of chunksize rows
+
+    Returns
+    -------
+    panel_df: pd.DataFrame, or an iterator of pd.DataFrame
+
+    '''
+    list_columns = [column for column in list_columns if columns is None or column in columns]
+    if panel_df_path.endswith('.parquet'):
+        reader = _read_parquet(panel_df_path, columns, chunksize)
+    else:
+        reader = pd.read_csv(panel_df_path, usecols = columns, chunksize = chunksize,
+                             dtype = dict([(column, object) for column in list_columns]))
+
+    def prepare(panel_df):
+        if compact:
+            return compact_frame(panel_df, list_columns)
+        for column in list_columns:
+            panel_df[column] = first_of_list(panel_df[column])
+        return panel_df
+
+    if chunksize is None:
+        return prepare(reader)
+    return (prepare(chunk_df) for chunk_df in reader)
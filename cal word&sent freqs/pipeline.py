@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Run the stages of the project as one make-style DAG:
+
+    wf ─┐
+        ├─ merge_panel ─┬─ raw2panel
+    sf ─┘               └─ panel2cross
+
+- wf, sf: WordFreq / SentFreq over the corpus, one row per transcript
+- merge_panel: the panel with the wf and sf columns joined on
+  transcript_ID (they replace panel columns of the same name)
+- raw2panel: Raw2Panel.reshape of the merged panel
+- panel2cross: panel2cross.exe of the merged panel
+
+Every stage declares its input and output paths; the intermediates and
+outputs are parquet files. A stage runs only if the fingerprint of its
+inputs (file contents, the corpus catalog, its parameters and its code)
+changed since its last run, or one of its outputs is gone. Stages whose
+inputs are ready run concurrently, each in its own process.
+
+Run as a script:
+    python pipeline.py run <panel_data_path> <processed_all_year_path> <moral_dict_path> <lookup_df_path> <work_path> [--jobs 4] [--parallel 2] [--force] [--catalog <catalog_path>]
+    python pipeline.py status <same arguments>
+
+CONTENT
+-------
+- <CLASS> Stage
+- <FUNC> default_stages
+- <CLASS> Pipeline
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import sys
+import json
+import hashlib
+import argparse
+import importlib
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from confcall.transcript_catalog import TranscriptCatalog
+from confcall.result_cache import file_digest, code_version
+
+def _write_parquet(df: pd.DataFrame, path: str):
+    # write to a temp name first, so an output is either complete or absent
+    df.to_parquet(path + '.tmp', index = False)
+    os.replace(path + '.tmp', path)
+
+def run_count(inputs: dict, outputs: dict, engine: str, num_job: int = 4, engine_kwargs: dict = None):
+    '''
+    The wf and sf stages: the counts of every transcript of the panel, with
+    a leading transcript_ID column
+    '''
+    engine_kwargs = engine_kwargs or {}
+    if engine == "wf":
+        from confcall.cal_wf import WordFreq
+        engine_obj = WordFreq(inputs["panel"], inputs["corpus"], inputs["moral_dict"], None, **engine_kwargs)
+    else:
+        from confcall.cal_sf import SentFreq
+        engine_obj = SentFreq(inputs["panel"], inputs["corpus"], inputs["moral_dict"], **engine_kwargs)
+    counts_df = engine_obj.threading(num_job)
+    counts_df["transcript_ID"] = counts_df["transcript_ID"].astype("int64")
+    _write_parquet(counts_df, outputs["counts"])
+
+def run_merge_panel(inputs: dict, outputs: dict):
+    '''
+    The merge_panel stage: the panel, in its order, with the wf and sf
+    columns of each conf call
+    '''
+    panel_df = pd.read_csv(inputs["panel"])
+    for name in ["wf", "sf"]:
+        counts_df = pd.read_parquet(inputs[name]).drop_duplicates("transcript_ID")
+        panel_df = panel_df.drop(columns = [column for column in counts_df.columns if column != "transcript_ID" and column in panel_df.columns])
+        panel_df = panel_df.merge(counts_df, on = "transcript_ID", how = 'left')
+    _write_parquet(panel_df, outputs["panel"])
+
+def run_raw2panel(inputs: dict, outputs: dict):
+    from confcall.raw2panel import Raw2Panel
+    long_df = Raw2Panel(inputs["panel"], inputs["lookup"], inputs["moral_dict"]).reshape()
+    _write_parquet(long_df, outputs["panel"])
+
+def run_panel2cross(inputs: dict, outputs: dict, chunksize: int = None):
+    from confcall.cross.Panel2Cross import panel2cross
+    _write_parquet(panel2cross(inputs["panel"], inputs["lookup"], inputs["moral_dict"]).exe(chunksize), outputs["cross"])
+
+class Stage:
+    '''
+    Parameters
+    ----------
+    name: str
+    func: callable
+        A module-level function, called as func(inputs, outputs, **params)
+        in a worker process
+    inputs: dict
+        Input name -> path; a folder is taken as a processed_all_year_path
+    outputs: dict
+        Output name -> path
+    params: dict
+        Keyword arguments of func; part of the fingerprint
+    code: list
+        Names of the modules whose source is part of the fingerprint
+    options: dict
+        Keyword arguments of func that leave its outputs as they are, e.g.
+        num_job; not part of the fingerprint
+    catalog_path: str
+        The transcript catalog of a corpus folder input, as passed to the
+        engine; None for the default one in the folder
+
+    '''
+    def __init__(self, name: str, func, inputs: dict, outputs: dict, params: dict = None, code: list = (),
+                 options: dict = None, catalog_path: str = None):
+        self.name = name
+        self.func = func
+        self.inputs = dict(inputs)
+        self.outputs = dict(outputs)
+        self.params = dict(params or {})
+        self.code = list(code)
+        self.options = dict(options or {})
+        self.catalog_path = catalog_path
+
+def default_stages(panel_data_path: str, processed_all_year_path: str, moral_dict_path: str, lookup_df_path: str,
+                   work_path: str, num_job: int = 4, engine_kwargs: dict = None, chunksize: int = None):
+    '''
+    The stages of the project, with their intermediates under work_path
+    '''
+    engine_kwargs = engine_kwargs or {}
+    count_code = ["confcall.moral_dict", "confcall.talk_slices", "confcall.result_schema", "confcall.scheduler",
+                  "confcall.transcript_reader", "confcall.packed_corpus"]
+    merged_path = work_path + '/merged_panel.parquet'
+    return [Stage("wf", run_count,
+                  {"panel": panel_data_path, "corpus": processed_all_year_path, "moral_dict": moral_dict_path},
+                  {"counts": work_path + '/wf.parquet'},
+                  {"engine": "wf", "engine_kwargs": engine_kwargs}, ["confcall.cal_wf"] + count_code, {"num_job": num_job},
+                  engine_kwargs.get("catalog_path")),
+            Stage("sf", run_count,
+                  {"panel": panel_data_path, "corpus": processed_all_year_path, "moral_dict": moral_dict_path},
+                  {"counts": work_path + '/sf.parquet'},
+                  {"engine": "sf", "engine_kwargs": engine_kwargs},
+                  ["confcall.cal_sf", "confcall.moral_sent_classifier"] + count_code, {"num_job": num_job},
+                  engine_kwargs.get("catalog_path")),
+            Stage("merge_panel", run_merge_panel,
+                  {"panel": panel_data_path, "wf": work_path + '/wf.parquet', "sf": work_path + '/sf.parquet'},
+                  {"panel": merged_path}, code = ["confcall.pipeline"]),
+            Stage("raw2panel", run_raw2panel,
+                  {"panel": merged_path, "lookup": lookup_df_path, "moral_dict": moral_dict_path},
+                  {"panel": work_path + '/panel.parquet'},
+                  code = ["confcall.raw2panel", "confcall.panel_loader", "confcall.entity_lookup"]),
+            Stage("panel2cross", run_panel2cross,
+                  {"panel": merged_path, "lookup": lookup_df_path, "moral_dict": moral_dict_path},
+                  {"cross": work_path + '/cross.parquet'}, {"chunksize": chunksize},
+                  ["confcall.cross.Panel2Cross", "confcall.panel_loader", "confcall.entity_lookup"])]
+
+def _run_stage(func, inputs: dict, outputs: dict, params: dict):
+    # the body of a worker process
+    for path in outputs.values():
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+    func(inputs, outputs, **params)
+    # shut the joblib workers down, or the worker process waits for their idle timeout on exit
+    from joblib.externals.loky import get_reusable_executor
+    get_reusable_executor().shutdown(wait = True)
+
+class Pipeline:
+    '''
+    Parameters
+    ----------
+    stages: list
+        Stage objects; a stage depends on the stages that write its inputs
+    state_path: str
+        JSON file of the fingerprint of every stage's last successful run
+
+    '''
+    def __init__(self, stages: list, state_path: str):
+        self.stages = dict([(stage.name, stage) for stage in stages])
+        self.state_path = state_path
+
+        producers = {}
+        for stage in stages:
+            for path in stage.outputs.values():
+                if path in producers:
+                    raise ValueError("%s is written by both %s and %s" % (path, producers[path], stage.name))
+                producers[path] = stage.name
+        self.depends = dict([(stage.name, set([producers[path] for path in stage.inputs.values() if path in producers]))
+                             for stage in stages])
+        self.order = self._topological_order()
+        # (corpus folder, catalog path) -> fingerprint, for the span of one run or status call
+        self._corpus_fingerprints = {}
+
+    def _topological_order(self):
+        order, done = [], set()
+        while len(order) < len(self.stages):
+            ready = [name for name in self.stages if name not in done and self.depends[name] <= done]
+            if len(ready) == 0:
+                raise ValueError("the stages have a cycle: " + str(sorted(set(self.stages) - done)))
+            order += ready
+            done.update(ready)
+        return order
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, 'r') as file:
+            return json.load(file)
+
+    def save_state(self, state: dict):
+        with open(self.state_path + '.tmp', 'w') as file:
+            json.dump(state, file, indent = 1, sort_keys = True)
+        os.replace(self.state_path + '.tmp', self.state_path)
+
+    def input_fingerprint(self, path: str, catalog_path: str = None):
+        '''
+        sha1 of a file's content; for a corpus folder, of its catalog
+        (transcript paths, talk file sizes and mtimes) after a deep refresh,
+        which stats every talk file, so files rewritten in place count too
+        '''
+        if not os.path.isdir(path):
+            return file_digest(path)
+        if (path, catalog_path) not in self._corpus_fingerprints:
+            catalog_df = TranscriptCatalog(path, catalog_path).refresh(deep = True).catalog_df
+            digest = hashlib.sha1()
+            for row in catalog_df[["path", "ceo_size", "cfo_size", "others_size", "talk_mtime_ns"]].itertuples(index = False):
+                digest.update(repr(tuple(row)).encode())
+            self._corpus_fingerprints[(path, catalog_path)] = digest.hexdigest()
+        return self._corpus_fingerprints[(path, catalog_path)]
+
+    def fingerprint(self, name: str):
+        stage = self.stages[name]
+        digest = hashlib.sha1()
+        for input_name, path in sorted(stage.inputs.items()):
+            digest.update((input_name + '=' + self.input_fingerprint(path, stage.catalog_path)).encode())
+        digest.update(json.dumps(stage.params, sort_keys = True, default = str).encode())
+        digest.update(code_version(*[importlib.import_module(module) for module in stage.code]).encode())
+        return digest.hexdigest()
+
+    def is_fresh(self, name: str, fingerprint: str, state: dict):
+        # the last run had these inputs, and its outputs are still there
+        return state.get(name) == fingerprint and all(os.path.exists(path) for path in self.stages[name].outputs.values())
+
+    def _targets(self, targets: list):
+        # the targets and every stage they depend on
+        if targets is None:
+            return set(self.stages)
+        needed, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in needed:
+                needed.add(name)
+                todo += list(self.depends[name])
+        return needed
+
+    def status(self, targets: list = None):
+        '''
+        "fresh", "stale" or "waiting" (an input is not there yet) for every stage
+        '''
+        state = self.load_state()
+        self._corpus_fingerprints = {}
+        needed = self._targets(targets)
+        status = {}
+        for name in self.order:
+            if name not in needed:
+                continue
+            if not all(os.path.exists(path) for path in self.stages[name].inputs.values()) or \
+                    any(status[dep] != "fresh" for dep in self.depends[name]):
+                status[name] = "waiting"
+            else:
+                status[name] = "fresh" if self.is_fresh(name, self.fingerprint(name), state) else "stale"
+        return status
+
+    def run(self, targets: list = None, max_parallel: int = 2, force: bool = False, verbose: bool = True):
+        '''
+        A method to bring the targets up to date
+
+        Parameters
+        ----------
+        targets: list
+            Stage names; None runs all
+        max_parallel: int
+            Max number of stages running at once
+        force: bool
+            Run every stage even if fresh
+
+        Returns
+        -------
+        results: dict
+            Stage name -> "ran" or "skipped"
+
+        '''
+        state = self.load_state()
+        self._corpus_fingerprints = {}
+        needed = self._targets(targets)
+        # future -> stage name, and the fingerprints the running stages were started with
+        results, running, fingerprints = {}, {}, {}
+        failure = None
+        with ProcessPoolExecutor(max_workers = max_parallel, mp_context = multiprocessing.get_context('spawn')) as executor:
+            while len(results) < len(needed) and failure is None:
+                # start every stage whose dependencies are done; the fingerprints are taken in
+                # this process, which also refreshes the catalog before the stages read it
+                for name in self.order:
+                    if name not in needed or name in results or name in running.values() or not self.depends[name] <= set(results):
+                        continue
+                    fingerprint = self.fingerprint(name)
+                    if not force and self.is_fresh(name, fingerprint, state):
+                        results[name] = "skipped"
+                        if verbose:
+                            print("%-12s up to date" % name)
+                        continue
+                    stage = self.stages[name]
+                    future = executor.submit(_run_stage, stage.func, stage.inputs, stage.outputs,
+                                             dict(stage.params, **stage.options))
+                    running[future] = name
+                    fingerprints[name] = fingerprint
+                    if verbose:
+                        print("%-12s started" % name)
+                if len(running) == 0:
+                    # the skipped stages may have made others ready
+                    continue
+
+                finished, _ = wait(list(running), return_when = FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        failure = (name, future.exception())
+                        continue
+                    results[name] = "ran"
+                    state[name] = fingerprints[name]
+                    self.save_state(state)
+                    if verbose:
+                        print("%-12s done" % name)
+
+            # let the stages already started finish before reporting a failure
+            for future in wait(list(running))[0]:
+                name = running.pop(future)
+                if future.exception() is None:
+                    state[name] = fingerprints[name]
+                    self.save_state(state)
+        if failure is not None:
+            raise RuntimeError("stage %s failed" % failure[0]) from failure[1]
+        return results
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Run the stages of the project, skipping those that are up to date")
+    parser.add_argument("command", choices = ["run", "status"])
+    parser.add_argument("panel_data_path")
+    parser.add_argument("processed_all_year_path")
+    parser.add_argument("moral_dict_path")
+    parser.add_argument("lookup_df_path")
+    parser.add_argument("work_path")
+    parser.add_argument("--jobs", type = int, default = 4)
+    parser.add_argument("--parallel", type = int, default = 2)
+    parser.add_argument("--targets", nargs = '+', default = None)
+    parser.add_argument("--force", action = "store_true")
+    parser.add_argument("--catalog", default = None, help = "transcript catalog path of the count stages")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.work_path, exist_ok = True)
+    pipeline = Pipeline(default_stages(args.panel_data_path, args.processed_all_year_path, args.moral_dict_path,
+                                       args.lookup_df_path, args.work_path, args.jobs,
+                                       {"catalog_path": args.catalog} if args.catalog is not None else None),
+                        args.work_path + '/pipeline_state.json')
+    if args.command == "status":
+        for name, status in pipeline.status(args.targets).items():
+            print("%-12s %s" % (name, status))
+    else:
+        pipeline.run(args.targets, args.parallel, args.force)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
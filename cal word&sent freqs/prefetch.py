@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Read the talk rows of upcoming transcripts in a few I/O threads while the
+worker counts the current one, so the CPU does not sit idle during every
+open/parse of the talk CSVs on network storage.
+
+A PrefetchReader wraps a row reader (talk_slices.read_talk_rows or
+PackedCorpus.read_talk_rows) and is called like it. count_transcripts
+schedules the transcripts of a batch, in the order they are counted; at
+most prefetch_depth of them are read ahead at any time (read or being read,
+but not taken yet), which caps the memory held by the prefetched rows. A
+path that was not scheduled is read directly; scheduled paths that are
+never asked for (e.g. cache hits) are dropped once a later path is taken.
+
+CONTENT
+-------
+- <CLASS> PrefetchReader
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from confcall.telemetry import TELEMETRY
+
+class PrefetchReader:
+    '''
+    Parameters
+    ----------
+    read_func: callable
+        read_func(trans_path) -> list of (speaker, is_QA, talk_content)
+    prefetch_depth: int
+        Max number of transcripts read ahead; 0 reads every transcript when
+        it is asked for, as read_func would
+    io_threads: int
+        Number of I/O threads
+
+    The thread pool is started lazily and never pickled, so a PrefetchReader
+    is cheap to ship to joblib workers.
+
+    '''
+    def __init__(self, read_func, prefetch_depth: int = 4, io_threads: int = 2):
+        if prefetch_depth < 0 or io_threads < 1:
+            raise ValueError("prefetch_depth must be >= 0 and io_threads >= 1")
+        self.read_func = read_func
+        self.prefetch_depth = prefetch_depth
+        self.io_threads = io_threads
+        self._executor = None
+        self._upcoming = deque()        # scheduled paths, not submitted yet
+        self._pending = OrderedDict()   # path -> future, in schedule order
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_upcoming'] = deque()
+        state['_pending'] = OrderedDict()
+        return state
+
+    def _timed_read(self, trans_path: str):
+        # runs in an I/O thread; the seconds are added to TELEMETRY by the
+        # counting thread, which owns it
+        start = time.perf_counter()
+        talk_rows = self.read_func(trans_path)
+        return talk_rows, time.perf_counter() - start
+
+    def _fill(self):
+        # the backpressure: submit reads only while fewer than prefetch_depth are held
+        while self._upcoming and len(self._pending) < self.prefetch_depth:
+            trans_path = self._upcoming.popleft()
+            if trans_path in self._pending:
+                continue
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers = self.io_threads, thread_name_prefix = 'prefetch')
+            self._pending[trans_path] = self._executor.submit(self._timed_read, trans_path)
+
+    def schedule(self, path_list: list):
+        '''
+        Queue paths to read ahead, in the order they will be asked for
+        '''
+        if self.prefetch_depth == 0:
+            return
+        self._upcoming.extend(path_list)
+        self._fill()
+
+    def __call__(self, trans_path: str):
+        if trans_path not in self._pending:
+            if trans_path in self._upcoming:
+                # every read ahead was skipped, and trans_path is not submitted yet
+                self._drop_skipped(None)
+                while self._upcoming.popleft() != trans_path:
+                    pass
+                self._fill()
+            return self.read_func(trans_path)
+        self._drop_skipped(trans_path)
+        future = self._pending.pop(trans_path)
+        self._fill()
+
+        start = time.perf_counter()
+        talk_rows, read_seconds = future.result()
+        TELEMETRY.add_time("prefetch_wait", time.perf_counter() - start)
+        TELEMETRY.add_time("prefetch_read", read_seconds)
+        return talk_rows
+
+    def _drop_skipped(self, trans_path: str):
+        # paths scheduled before trans_path (all, if None) were skipped; do not hold their rows
+        while self._pending:
+            skipped_path, future = next(iter(self._pending.items()))
+            if skipped_path == trans_path:
+                return
+            future.cancel()
+            del self._pending[skipped_path]
+
+    def close(self):
+        '''
+        Drop the reads not taken and stop the I/O threads; the reader can
+        still be used afterwards
+        '''
+        self._upcoming.clear()
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait = True)
+            self._executor = None
@@ -1,56 +1,41 @@
 # -*- coding: utf-8 -*-
 import pandas as pd
-import numpy as np
-from joblib import Parallel, delayed
-
-def load_moral_dict(dict_path):
-    with open(dict_path, 'r') as file:
-        moral_dict_ct = file.read()
-    temp_dict = moral_dict_ct.splitlines()
-    
-    for line_i in range(len(temp_dict)):
-        temp_dict[line_i] = temp_dict[line_i].replace('\t', ' ')
-
-    sub_dict_keys = temp_dict[1:12]
-    for line_i in range(len(sub_dict_keys)):
-        sub_dict_keys[line_i] = sub_dict_keys[line_i].split()
-    
-    temp_sub_dicts = temp_dict[14:]
-    sub_dicts = {}
-    sub_dict_name = {}
-    for item in sub_dict_keys:
-        sub_dicts[item[0]] = []
-        sub_dict_name[item[0]] = item[1]
-        
-    for line in temp_sub_dicts:
-        if len(line.replace(' ', '')) == 0:
-            continue
-        temp_item = line.split()
-        if len(temp_item) > 2:
-            for key in temp_item[1:]:
-                sub_dicts[key].append(temp_item[0])
-        else:
-            sub_dicts[temp_item[1]].append(temp_item[0])
-    
-    return sub_dict_name, sub_dicts
+import pyarrow as pa
+from confcall.result_sink import ResultSink, read_results
+from confcall.entity_lookup import EntityLookup, read_lookup
+from confcall.panel_loader import load_panel
+from confcall.telemetry import TELEMETRY
+from confcall.moral_dict import load_moral_dict
+
+# conf call columns of the panel, and the talk words columns of the output
+CONF_CALL_INFO = ['transcript_ID', 'conf_date', 'conf_date_quarter',
+                  'fiscal_date', 'conf_type', 'conf_type_detail']
+TALK_WORDS_COLUMNS = ["talk_words_num", "QA_talk_words_num", "exclude_QA_talk_words_num",
+                      "QA_male_talk_words_num","QA_female_talk_words_num", "QA_both_talk_words_num",
+                      'sents_num', 'RD_sents_num']
+
+def role_talk_words_list(position: str):
+    # the panel columns of TALK_WORDS_COLUMNS for a role
+    return [position + "_talk_words_num", "QA_" + position + "_talk_words_num",
+            "exclude_QA_" + position + "_talk_words_num", "QA_male_" + position + "_talk_words_num",
+            "QA_female_" + position + "_talk_words_num", "QA_both_" + position + "_talk_words_num",
+            'total_sentence_number', 'RD_sentence_number']
 
 class Raw2Panel:
+    '''
+    Parameters
+    ----------
+    compact: bool
+        If True, load the panel with categorical IDs and names and downcast
+        numbers (see panel_loader); only the columns of reshape are read
+        either way
+
+    '''
     def __init__(self, 
                 panel_df_path: str,
                 lookup_df_path: str,
-                moral_dict_path: str):
-        
-        panel_df = pd.read_csv(panel_df_path)
-        panel_df["ceo_name"] = panel_df["ceo_name"].apply(lambda x: x.split(",")[0] if not pd.isna(x) else np.nan)
-        panel_df["cfo_name"] = panel_df["cfo_name"].apply(lambda x: x.split(",")[0] if not pd.isna(x) else np.nan)
-
-        panel_df["ceo_factset_person_id"] = panel_df["ceo_factset_person_id"].apply(
-            lambda x: x.split(",")[0] if not pd.isna(x) else np.nan)
-        panel_df["cfo_factset_person_id"] = panel_df["cfo_factset_person_id"].apply(
-            lambda x: x.split(",")[0] if not pd.isna(x) else np.nan)
-
-        self.panel_df = panel_df
-        self.lookup_df = pd.read_csv(lookup_df_path)
+                moral_dict_path: str,
+                compact: bool = True):
 
         indicator_list = ['90_FocusPast', '91_FocusPresent', '92_FocusFuture', 'a_agency', 'a_communion']
         indicator_list1 = ['QA_' + i for i in indicator_list]
@@ -73,105 +58,90 @@ class Raw2Panel:
         QA_sf_indicator_list = ['QA_' + sub_dict + '_sentence_number' for sub_dict in sub_dict_names]
 
         indicator_list = indicator_list + full_wf_indicator_list + exQA_wf_indicator_list + QA_wf_indicator_list + full_sf_indicator_list + exQA_sf_indicator_list + QA_sf_indicator_list
-        
-        self.ceo_list = sorted(set(panel_df["ceo_factset_person_id"].dropna()))
-        self.cfo_list = sorted(set(panel_df["cfo_factset_person_id"].dropna()))
+        self.indicator_list = indicator_list
 
         self.ceo_indicator_list = [indicator + '_ceo' for indicator in indicator_list]
         self.cfo_indicator_list = [indicator + '_cfo' for indicator in indicator_list]
-    
-    def process_single_manager(self, p_id: str):
-        if p_id in self.ceo_list:
-            position = "ceo"
-            talk_words_list = ["ceo_talk_words_num", "QA_ceo_talk_words_num", "exclude_QA_ceo_talk_words_num",
-                            "QA_male_ceo_talk_words_num", "QA_female_ceo_talk_words_num", "QA_both_ceo_talk_words_num",
-                            'total_sentence_number', 'RD_sentence_number']
-            p_indicator_list = self.ceo_indicator_list
-        else:
-            position = "cfo"
-            talk_words_list = ["cfo_talk_words_num", "QA_cfo_talk_words_num", "exclude_QA_cfo_talk_words_num",
-                            "QA_male_cfo_talk_words_num", "QA_female_cfo_talk_words_num", "QA_both_cfo_talk_words_num",
-                            'total_sentence_number', 'RD_sentence_number']
-            p_indicator_list = self.cfo_indicator_list
-
-        id_df = self.panel_df[self.panel_df[position + "_factset_person_id"] == p_id].reset_index(drop=True)
-        
-        manager_df = pd.DataFrame(columns = ["Name","Role", "person_factset_id",               # personal info
-                                            'transcript_ID', 'conf_date', 'conf_date_quarter',
-                                            'fiscal_date', 'conf_type', 'conf_type_detail',    # conf call info
-                                            'Company',"company_factset_id", 'cusip',           # company info
-                                            "talk_words_num", "QA_talk_words_num", "exclude_QA_talk_words_num",
-                                            "QA_male_talk_words_num","QA_female_talk_words_num", "QA_both_talk_words_num", # talk words
-                                            'sents_num', 'RD_sents_num'] + self.indicator_list)
-        
-        # personal info
-        manager_df.loc[0, ["Role", "person_factset_id"]] = position, p_id
-        manager_df.loc[0, 'Name'] = id_df.loc[0,[position + '_name']].values[0]
-        
-        # company info                                                              
-        manager_df.loc[0,"company_factset_id"] = np.array(id_df.loc[0, 'factset_entity_id'])
-        entity_id = id_df.loc[0, "factset_entity_id"].split(',')
-        
-        for sub_id in entity_id:
-            manager_df.loc[0,['Company','cusip']] = ['', '']
-            if sub_id in self.lookup_df['factset_entity_id'].values:
-                manager_df.loc[0, ['Company','cusip']] = np.array(self.lookup_df.loc[
-                    self.lookup_df['factset_entity_id'] == sub_id, ["proper_name", "cusip"]].iloc[0,:]) 
-                break
-
-        # replicate the personal, conf call, and company info to have the save num of rows as id_df
-        manager_df_rep = pd.concat([manager_df]*len(id_df), ignore_index=True)
-        conf_call_info = ['transcript_ID', 'conf_date', 'conf_date_quarter',
-                            'fiscal_date', 'conf_type', 'conf_type_detail']
-        
-        for sub_idx in id_df.index:
-            # conf call info
-            manager_df_rep.loc[sub_idx, conf_call_info] = np.array(id_df.loc[sub_idx,conf_call_info])
-            # talk num
-            manager_df_rep.loc[
-                sub_idx, ["talk_words_num", "QA_talk_words_num", "exclude_QA_talk_words_num",
-                            "QA_male_talk_words_num","QA_female_talk_words_num", "QA_both_talk_words_num",
-                            'sents_num', 'RD_sents_num']] = np.array(id_df.loc[sub_idx, talk_words_list])
-            # indicators
-            manager_df_rep.loc[sub_idx, self.indicator_list] = np.array(id_df.loc[sub_idx, p_indicator_list])
-        
-        return manager_df_rep
-
-    def threading(self, num_job: int):
-        total_list = self.ceo_list + self.cfo_list
-        
-        # calculate ids per job
-        files_per_job = int(len(total_list) / num_job)
-        cut_list = []
-        
-        for i in range(num_job):
-            if i != num_job - 1:
-                cut_list.append(total_list[i * files_per_job: (i + 1) * files_per_job])
-            else:
-                cut_list.append(total_list[i * files_per_job:])
-        
-        # define a function to process a list of trans, return a dataframe
-        def run(id_list):
-            temp_df = pd.DataFrame(columns = ["Name","Role", "person_factset_id",              # personal info
-                                            'transcript_ID', 'conf_date', 'conf_date_quarter',
-                                            'fiscal_date', 'conf_type', 'conf_type_detail',    # conf call info
-                                            'Company',"company_factset_id", 'cusip', 'gvkey',  # company info
-                                            "talk_words_num", "QA_talk_words_num", "exclude_QA_talk_words_num",
-                                            "QA_male_talk_words_num","QA_female_talk_words_num", "QA_both_talk_words_num", # talk words
-                                            'sents_num', 'RD_sents_num'] + self.indicator_list)
-            for person_id in id_list:
-                person_df = self.raw2panel(person_id)
-                temp_df = pd.concat([temp_df, person_df], axis = 0, ignore_index = True)
-            return temp_df
-        
-        # deploy the treading
-        final_dfs = Parallel(n_jobs=num_job, verbose=1)(delayed(run)(sub_list) for sub_list in cut_list)
-        
-        final_df = pd.DataFrame()
-        for df in final_dfs:
-            final_df = pd.concat([final_df, df], axis = 0, ignore_index = True)
-
-        return final_df
+
+        # read only the columns of reshape; the names and person ids keep the first of their lists
+        columns = CONF_CALL_INFO + ["factset_entity_id"]
+        for position in ["ceo", "cfo"]:
+            columns += [position + "_factset_person_id", position + "_name"] + role_talk_words_list(position)
+        columns += self.ceo_indicator_list + self.cfo_indicator_list
+        with TELEMETRY.timer("load_panel"):
+            panel_df = load_panel(panel_df_path, list(dict.fromkeys(columns)), compact = compact)
+        TELEMETRY.count("panel_rows", len(panel_df))
+
+        self.panel_df = panel_df
+        self.lookup_df = read_lookup(lookup_df_path)
+        self.entity_lookup = EntityLookup(self.lookup_df)
+
+        self.ceo_list = sorted(set(panel_df["ceo_factset_person_id"].dropna()))
+        self.cfo_list = sorted(set(panel_df["cfo_factset_person_id"].dropna()))
+
+    def reshape(self, store_path: str = None):
+        '''
+        A method to stack the _ceo and _cfo column families of the panel into
+        one row per (manager, conf call), in a few whole-frame operations
+
+        Parameters
+        ----------
+        store_path: str
+            If given, stream the rows to parquet parts under store_path
+
+        Returns
+        -------
+        long_df: pd.DataFrame or str
+            Managers ordered by role then id, conf calls in panel order; or
+            store_path when streaming
+
+        '''
+        role_dfs = []
+        for position, p_indicator_list in [("ceo", self.ceo_indicator_list), ("cfo", self.cfo_indicator_list)]:
+            id_column = position + "_factset_person_id"
+            role_df = self.panel_df[self.panel_df[id_column].notna()].sort_values(id_column, kind = 'stable')
+
+            # personal and company info come from the first conf call of each manager
+            first_df = role_df.drop_duplicates(id_column)
+            with TELEMETRY.timer("entity_lookup"):
+                company_df = self.entity_lookup.resolve(first_df["factset_entity_id"]).set_index(first_df[id_column])
+            TELEMETRY.count("managers", len(first_df))
+
+            with TELEMETRY.timer("stack_roles"):
+                person_ids = role_df[id_column]
+                # plain values to map to: a categorical person id mapped onto categorical values loses the values
+                first_info_df = first_df.set_index(id_column)[[position + "_name", "factset_entity_id"]].astype(object)
+                info_df = pd.DataFrame({"Name": person_ids.map(first_info_df[position + "_name"]),
+                                        "Role": position,
+                                        "person_factset_id": person_ids,
+                                        "Company": person_ids.map(company_df["Company"]),
+                                        "company_factset_id": person_ids.map(first_info_df["factset_entity_id"]),
+                                        "cusip": person_ids.map(company_df["cusip"])})
+
+                role_dfs.append(pd.concat([info_df, role_df[CONF_CALL_INFO],
+                                           role_df[role_talk_words_list(position)].set_axis(TALK_WORDS_COLUMNS, axis = 1),
+                                           role_df[p_indicator_list].set_axis(self.indicator_list, axis = 1)], axis = 1))
+
+        with TELEMETRY.timer("assemble"):
+            long_df = pd.concat(role_dfs, axis = 0, ignore_index = True).reindex(columns = self.result_columns())
+        if store_path is None:
+            return long_df
+
+        with TELEMETRY.timer("write"):
+            with ResultSink(store_path, self.result_columns(), string_columns = self.result_columns()[:13],
+                            numeric_type = pa.float64(), part_prefix = 'r2p') as sink:
+                sink.write(long_df)
+        return store_path
+
+    def result_columns(self):
+        # the output columns of reshape, in order
+        return ["Name","Role", "person_factset_id",                           # personal info
+                'transcript_ID', 'conf_date', 'conf_date_quarter',
+                'fiscal_date', 'conf_type', 'conf_type_detail',               # conf call info
+                'Company',"company_factset_id", 'cusip', 'gvkey',             # company info
+                "talk_words_num", "QA_talk_words_num", "exclude_QA_talk_words_num",
+                "QA_male_talk_words_num","QA_female_talk_words_num", "QA_both_talk_words_num", # talk words
+                'sents_num', 'RD_sents_num'] + self.indicator_list
 
 if __name__ == '__main__':
     panel_df_path = './ConfCall/task1/raw2panel/factset_conf_call_panel_data_v5.csv'
@@ -180,5 +150,6 @@ if __name__ == '__main__':
     store_path = './ConfCall/task1/raw2panel'
 
     obj = Raw2Panel(panel_df_path, lookup_df_path, moral_dict_path)
-    output = obj.threading(16)
-    output.to_csv(store_path + '/panel.csv', index = False)
\ No newline at end of file
+    output = read_results(obj.reshape(store_path = store_path + '/panel_parts'))
+    output.to_csv(store_path + '/panel.csv', index = False)
+    TELEMETRY.write(store_path + '/raw2panel_telemetry.json')
\ No newline at end of file
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+A content-addressed cache of per-transcript results, so that re-runs of
+WordFreq/SentFreq only compute transcripts that are new or stale. An entry
+is keyed on the transcript's talk files (size and mtime), the dictionary
+file hash, the engine and a hash of the counting code. The cache is a single
+sqlite file with an LRU size bound.
+
+Run as a script to inspect or prune a cache:
+    python result_cache.py stats <cache_path>
+    python result_cache.py prune <cache_path> --max-mb 500 --older-than-days 30
+    python result_cache.py clear <cache_path> [--engine WordFreq]
+
+CONTENT
+-------
+- <FUNC> file_digest
+- <FUNC> code_version
+- <FUNC> transcript_fingerprint
+- <CLASS> ResultCache
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import sys
+import time
+import pickle
+import sqlite3
+import hashlib
+import argparse
+from confcall.telemetry import TELEMETRY
+
+TALK_FILES = ["ceo_talk.csv", "cfo_talk.csv", "others_talk.csv"]
+
+def file_digest(path: str):
+    '''
+    sha1 of the content of a file, e.g. of the moral dictionary
+    '''
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def code_version(*modules):
+    '''
+    sha1 of the source files of the given modules, so that editing the
+    counting code invalidates the cached results
+    '''
+    digest = hashlib.sha1()
+    for module in modules:
+        module_file = getattr(module, '__file__', None)
+        if module_file is not None and os.path.exists(module_file):
+            digest.update(file_digest(module_file).encode())
+        else:
+            digest.update(module.__name__.encode())
+    return digest.hexdigest()
+
+def transcript_fingerprint(trans_path: str):
+    '''
+    (size, mtime) of the talk files of a transcript, as a string
+    '''
+    parts = []
+    for file_name in TALK_FILES:
+        try:
+            file_stat = os.stat(trans_path + '/' + file_name)
+            parts.append('%d:%d' % (file_stat.st_size, file_stat.st_mtime_ns))
+        except OSError:
+            parts.append('-')
+    return '|'.join(parts)
+
+class ResultCache:
+    '''
+    Parameters
+    ----------
+    cache_path: str
+        The sqlite file of the cache; created if missing
+    max_bytes: int
+        Size bound of the cached payloads; least recently used entries are
+        evicted beyond it
+    evict_every: int
+        Number of puts between two size checks
+
+    '''
+    def __init__(self,
+                cache_path: str,
+                max_bytes: int = 2 * 1024 ** 3,
+                evict_every: int = 200):
+
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._conn = None
+        self._num_puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    # connect lazily and never pickle the connection, as the cache is shipped to joblib workers
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        return state
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.cache_path, timeout = 60)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                                  key TEXT PRIMARY KEY, engine TEXT, transcript_ID TEXT,
+                                  created REAL, last_access REAL, size INTEGER, payload BLOB)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_access ON results (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def key(self, trans_path: str, salt: str):
+        '''
+        The cache key of a transcript; salt holds the engine, dictionary
+        hash and code version
+        '''
+        return hashlib.sha1((salt + '#' + trans_path + '#' + transcript_fingerprint(trans_path)).encode()).hexdigest()
+
+    def get(self, key: str):
+        row = self.conn.execute("SELECT payload FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        return pickle.loads(row[0])
+
+    def put(self, key: str, engine: str, transcript_id: str, result):
+        payload = pickle.dumps(result, protocol = pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        self.conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          (key, engine, str(transcript_id), now, now, len(payload), sqlite3.Binary(payload)))
+        self.conn.commit()
+        self._num_puts += 1
+        if self._num_puts % self.evict_every == 0:
+            self.evict()
+
+    def fetch(self, trans_path: str, salt: str, engine: str, transcript_id: str, compute):
+        '''
+        Return the cached result of a transcript, or compute and cache it
+
+        Parameters
+        ----------
+        compute: callable
+            Called as compute(trans_path) on a miss
+
+        '''
+        key = self.key(trans_path, salt)
+        result = self.get(key)
+        if result is None:
+            TELEMETRY.count("cache_miss")
+            result = compute(trans_path)
+            self.put(key, engine, transcript_id, result)
+        else:
+            TELEMETRY.count("cache_hit")
+        return result
+
+    def evict(self, max_bytes: int = None):
+        '''
+        Drop least recently used entries until the payloads fit in max_bytes;
+        returns the number of entries dropped
+        '''
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        num_dropped = 0
+        for key, size in self.conn.execute("SELECT key, size FROM results ORDER BY last_access").fetchall():
+            if total <= max_bytes:
+                break
+            self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            num_dropped += 1
+        self.conn.commit()
+        return num_dropped
+
+    def prune(self, max_bytes: int = None, older_than_days: float = None, engine: str = None):
+        '''
+        Drop entries not used for older_than_days and/or of an engine, then
+        evict down to max_bytes; returns the number of entries dropped
+        '''
+        num_dropped = 0
+        conditions, params = [], []
+        if older_than_days is not None:
+            conditions.append("last_access < ?")
+            params.append(time.time() - older_than_days * 86400)
+        if engine is not None:
+            conditions.append("engine = ?")
+            params.append(engine)
+        if len(conditions) > 0:
+            num_dropped += self.conn.execute("DELETE FROM results WHERE " + " AND ".join(conditions), params).rowcount
+            self.conn.commit()
+        if max_bytes is not None:
+            num_dropped += self.evict(max_bytes)
+        return num_dropped
+
+    def clear(self, engine: str = None):
+        return self.prune(engine = engine) if engine is not None else self.prune(older_than_days = -1)
+
+    def stats(self):
+        '''
+        Number of entries, payload bytes and last access range, by engine
+        '''
+        out_stats = {}
+        for engine, num, size, first, last in self.conn.execute(
+                "SELECT engine, COUNT(*), SUM(size), MIN(last_access), MAX(last_access) FROM results GROUP BY engine"):
+            out_stats[engine] = {"entries": num, "bytes": size,
+                                 "oldest_access": time.strftime('%Y-%m-%d %H:%M', time.localtime(first)),
+                                 "latest_access": time.strftime('%Y-%m-%d %H:%M', time.localtime(last))}
+        return out_stats
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Inspect or prune a WordFreq/SentFreq result cache")
+    parser.add_argument("command", choices = ["stats", "prune", "clear"])
+    parser.add_argument("cache_path")
+    parser.add_argument("--max-mb", type = float, default = None)
+    parser.add_argument("--older-than-days", type = float, default = None)
+    parser.add_argument("--engine", default = None)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.cache_path):
+        print("no cache at " + args.cache_path)
+        return 1
+    cache = ResultCache(args.cache_path)
+    if args.command == "prune":
+        max_bytes = None if args.max_mb is None else int(args.max_mb * 1024 ** 2)
+        print("dropped %d entries" % cache.prune(max_bytes, args.older_than_days, args.engine))
+    elif args.command == "clear":
+        print("dropped %d entries" % cache.clear(args.engine))
+    for engine, engine_stats in cache.stats().items():
+        print(engine, engine_stats)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The column layout of the word and sent freq results, fixed once from the
+sub-dict names and the slices of talk_slices. The counts of a transcript go
+straight into a preallocated int32 row (or a row of a block for a batch):
+the (speaker, is_QA) group counts are added up into the nine slices with
+one matrix product and scattered to their columns by index. A block becomes
+a dataframe or an arrow table only at the end.
+
+CONTENT
+-------
+- <CLASS> ResultSchema
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from confcall.talk_slices import SPEAKER_FILES, SPEAKER_SLICES, SECTION_SLICES, word_freq_columns, sent_freq_columns
+
+# the (speaker, is_QA) groups, in the order of the group axis of the counts
+GROUPS = [(speaker, is_QA) for speaker, _ in SPEAKER_FILES for is_QA in (False, True)]
+
+# the nine (speaker slice, section) slices, and the groups added up in each
+SLICES = [(speaker_slice, section) for speaker_slice in SPEAKER_SLICES for section, _, _ in SECTION_SLICES]
+SECTION_FLAGS = dict([(section, QA_flags) for section, _, QA_flags in SECTION_SLICES])
+SLICE_MATRIX = np.array([[int(speaker in SPEAKER_SLICES[speaker_slice] and is_QA in SECTION_FLAGS[section])
+                          for speaker, is_QA in GROUPS]
+                         for speaker_slice, section in SLICES], dtype = np.int64)
+
+class ResultSchema:
+    '''
+    Parameters
+    ----------
+    sub_dict_name: dict
+        Sub-dict key -> name, from load_moral_dict
+    dict_keys: list
+        The sub-dict keys, in the order of the key axis of the counts
+    word_freq, sent_freq: bool
+        Whether the word freq and/or sent freq columns are in the layout;
+        word freq columns go first
+
+    '''
+    def __init__(self, sub_dict_name: dict, dict_keys: list, word_freq: bool = True, sent_freq: bool = True, dtype = np.int32):
+        self.sub_dict_name = sub_dict_name
+        self.dict_keys = list(dict_keys)
+        self.dtype = dtype
+        self.columns = []
+        if word_freq:
+            self.columns += word_freq_columns(sub_dict_name, self.dict_keys)
+        if sent_freq:
+            self.columns += sent_freq_columns(sub_dict_name, self.dict_keys)
+        column_idx = dict([(column, column_i) for column_i, column in enumerate(self.columns)])
+        section_prefix = dict([(section, prefix) for section, prefix, _ in SECTION_SLICES])
+
+        # (slice, key) -> column index
+        if word_freq:
+            self.word_positions = np.array([[column_idx[section_prefix[section] + sub_dict_name[key] + "_" + speaker_slice]
+                                             for key in self.dict_keys] for speaker_slice, section in SLICES])
+        if sent_freq:
+            self.sent_positions = np.array([[column_idx[section_prefix[section] + sub_dict_name[key] + '_sentence_number_' + speaker_slice]
+                                             for key in self.dict_keys] for speaker_slice, section in SLICES])
+            # the sentence numbers are only kept for the "all" section
+            self.sentence_number_slices = [SLICES.index((speaker_slice, "all")) for speaker_slice in ["all", "ceo", "cfo"]]
+            self.sentence_number_positions = np.array([column_idx[speaker_slice + "_sentence_number"] for speaker_slice in ["all", "ceo", "cfo"]])
+
+    @staticmethod
+    def group_index(speaker: str, is_QA: bool):
+        return GROUPS.index((speaker, is_QA))
+
+    def new_block(self, num_rows: int):
+        return np.zeros((num_rows, len(self.columns)), dtype = self.dtype)
+
+    def new_row(self):
+        return self.new_block(1)[0]
+
+    def fill_word_freq(self, rows: np.ndarray, group_counts: np.ndarray):
+        '''
+        Write word freqs into a row, or into a block of rows
+
+        Parameters
+        ----------
+        rows: np.ndarray
+            A row of new_row, or a block of new_block
+        group_counts: np.ndarray
+            Counts of shape (len(GROUPS), len(dict_keys)), or
+            (number of rows, len(GROUPS), len(dict_keys)) for a block
+
+        '''
+        rows[..., self.word_positions] = np.matmul(SLICE_MATRIX, group_counts)
+
+    def fill_sent_freq(self, rows: np.ndarray, group_counts: np.ndarray, group_sent_num: np.ndarray):
+        '''
+        Write sent freqs into a row, or into a block of rows; group_counts as
+        in fill_word_freq, group_sent_num the number of sents of every group,
+        of shape (len(GROUPS),) or (number of rows, len(GROUPS))
+        '''
+        rows[..., self.sent_positions] = np.matmul(SLICE_MATRIX, group_counts)
+        slice_sent_num = np.matmul(np.asarray(group_sent_num), SLICE_MATRIX.T)
+        rows[..., self.sentence_number_positions] = slice_sent_num[..., self.sentence_number_slices]
+
+    def to_frame(self, block: np.ndarray, index: list):
+        return pd.DataFrame(block, index = index, columns = self.columns)
+
+    def to_table(self, block: np.ndarray, transcript_ids: list):
+        # a block -> an arrow table with a leading transcript_ID column, as read by read_results
+        arrays = [pa.array([str(transcript_id) for transcript_id in transcript_ids], type = pa.string())]
+        arrays += [pa.array(block[:, column_i]) for column_i in range(len(self.columns))]
+        return pa.Table.from_arrays(arrays, names = ["transcript_ID"] + self.columns)
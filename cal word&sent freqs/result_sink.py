@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+A streaming sink for the results of the threading() methods. Rows of a
+fixed schema are appended as the batches finish; every batch_rows rows are
+written to disk as one parquet part file, so memory stays flat, finished
+rows survive a crash and a run leaves a few large parts, not many small ones.
+
+CONTENT
+-------
+- <CLASS> ResultSink
+- <FUNC> read_results
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+class ResultSink:
+    '''
+    Parameters
+    ----------
+    store_path: str
+        Folder of the part files; created if missing
+    columns: list
+        The output columns, in order
+    string_columns: list
+        Columns stored as strings; all other columns are numeric
+    numeric_type: pyarrow.DataType
+        Type of the numeric columns
+    part_prefix: str
+        Prefix of the part files written by this sink, should be unique
+        per worker
+    batch_rows: int
+        Number of buffered rows that triggers a write
+
+    '''
+    def __init__(self,
+                store_path: str,
+                columns: list,
+                string_columns: list = (),
+                numeric_type = pa.int64(),
+                part_prefix: str = 'part',
+                batch_rows: int = 500):
+
+        self.store_path = store_path
+        self.columns = list(columns)
+        self.string_columns = set(string_columns)
+        self.schema = pa.schema([(col, pa.string() if col in self.string_columns else numeric_type)
+                                 for col in self.columns])
+        self.part_prefix = part_prefix + '-' + uuid.uuid4().hex[:8]
+        self.batch_rows = batch_rows
+
+        self.buffer = []
+        self.buffer_rows = 0
+        self.num_parts = 0
+        self.num_rows = 0
+        os.makedirs(store_path, exist_ok = True)
+
+    def write(self, df: pd.DataFrame):
+        '''
+        Buffer a block of rows; missing columns are filled with nulls and
+        extra columns are dropped
+        '''
+        if len(df) == 0:
+            return
+        self.buffer.append(df.reindex(columns = self.columns))
+        self.buffer_rows += len(df)
+        if self.buffer_rows >= self.batch_rows:
+            self.flush()
+
+    def write_table(self, table: pa.Table):
+        '''
+        Buffer a block of rows already in arrow form, e.g. from
+        ResultSchema.to_table; it must hold all the columns
+        '''
+        if table.num_rows == 0:
+            return
+        self.buffer.append(table.select(self.columns).cast(self.schema, safe = False))
+        self.buffer_rows += table.num_rows
+        if self.buffer_rows >= self.batch_rows:
+            self.flush()
+
+    def to_table(self, df: pd.DataFrame):
+        # a buffered dataframe -> a table of the sink's schema
+        df = df.copy()
+        for col in self.columns:
+            if col in self.string_columns:
+                df[col] = df[col].map(lambda x: None if pd.isna(x) else str(x))
+            else:
+                df[col] = pd.to_numeric(df[col], errors = 'coerce')
+        return pa.Table.from_pandas(df, schema = self.schema, preserve_index = False, safe = False)
+
+    def flush(self):
+        if self.buffer_rows == 0:
+            return
+        table = pa.concat_tables([block if isinstance(block, pa.Table) else self.to_table(block) for block in self.buffer])
+
+        # write to a temp name first, so a crash never leaves a half-written part behind
+        part_path = self.store_path + '/' + self.part_prefix + '-%05d.parquet' % self.num_parts
+        pq.write_table(table, part_path + '.tmp')
+        os.replace(part_path + '.tmp', part_path)
+
+        self.num_parts += 1
+        self.num_rows += self.buffer_rows
+        self.buffer = []
+        self.buffer_rows = 0
+
+    def close(self):
+        self.flush()
+        return self.num_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def read_results(store_path: str, columns: list = None):
+    '''
+    Read all finished part files under store_path as one dataframe
+    '''
+    part_list = sorted([store_path + '/' + f for f in os.listdir(store_path) if f.endswith('.parquet')])
+    if len(part_list) == 0:
+        return pd.DataFrame(columns = columns)
+    return pq.ParquetDataset(part_list).read(columns = columns).to_pandas()
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Estimate the results of a full wf, sf or wsf run from a stratified sample
+of transcripts, for quick looks at a revised dictionary:
+1. stratified_sample draws a share of the transcripts of every stratum
+   (year x conf_type of the panel), at least min_per_stratum of each
+2. the sample is counted as in a full run
+3. estimate_totals gives the corpus totals of every column (the stratified
+   estimator, sum over strata of N_h times the sample mean), and the means
+   per manager of the _ceo and _cfo columns (the total over the calls with
+   such a manager, divided by the number of managers of the panel), each
+   with a bootstrap confidence interval: the sample is resampled within
+   every stratum n_boot times, with a finite population correction
+
+Run as a script:
+    python sampling.py <engine> <panel_data_path> <processed_all_year_path> <moral_dict_path> <out_path> [--fraction 0.1 --boot 1000 --jobs 4 --seed 0]
+
+CONTENT
+-------
+- <FUNC> stratified_sample
+- <FUNC> estimate_totals
+- <FUNC> run_sample
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from confcall.scheduler import count_transcripts
+from confcall.panel_loader import first_of_list
+
+STRATA = ["year", "conf_type"]
+
+ROLES = ["ceo", "cfo"]
+
+def stratified_sample(population_df: pd.DataFrame, fraction: float = 0.1, min_per_stratum: int = 2,
+                      strata: list = STRATA, seed: int = 0):
+    '''
+    A func to draw a stratified random sample
+
+    Parameters
+    ----------
+    population_df: pd.DataFrame
+        One row per unit, with the strata columns
+    fraction: float
+        The share of every stratum drawn (proportional allocation)
+    min_per_stratum: int
+        Every stratum gets at least this many units, or all it has
+    seed: int
+
+    Returns
+    -------
+    population_df: pd.DataFrame
+        A copy with a "stratum" code and a "sampled" flag
+
+    '''
+    population_df = population_df.copy()
+    # a missing year or conf type is a stratum of its own
+    population_df["stratum"] = population_df.groupby(strata, dropna = False, sort = True).ngroup().to_numpy()
+    population_df["sampled"] = False
+    rng = np.random.default_rng(seed)
+    for _, row_i in population_df.groupby("stratum").indices.items():
+        size = max(int(round(fraction * len(row_i))), min_per_stratum)
+        drawn = rng.choice(row_i, size = min(size, len(row_i)), replace = False)
+        population_df.iloc[drawn, population_df.columns.get_loc("sampled")] = True
+    return population_df
+
+def _bootstrap_totals(values: np.ndarray, stratum: np.ndarray, stratum_sizes: np.ndarray, n_boot: int, rng):
+    '''
+    The stratified estimate of the column totals of values, and n_boot
+    bootstrap replicates of it; a replicate redraws the rows of every stratum
+    with replacement, done as multinomial row weights. The spread of a
+    stratum's replicates is scaled by sqrt((1 - n_h/N_h) * n_h/(n_h - 1)),
+    so it has the variance of sampling without replacement: nil for a
+    stratum sampled whole
+    '''
+    estimate = np.zeros(values.shape[1])
+    replicates = np.zeros((n_boot, values.shape[1]))
+    for stratum_i, stratum_size in enumerate(stratum_sizes):
+        stratum_values = values[stratum == stratum_i]
+        num_rows = len(stratum_values)
+        if num_rows == 0:
+            continue
+        scale = stratum_size / num_rows
+        stratum_estimate = scale * stratum_values.sum(axis = 0)
+        estimate += stratum_estimate
+        weights = rng.multinomial(num_rows, np.full(num_rows, 1 / num_rows), size = n_boot)
+        spread = np.sqrt((1 - num_rows / stratum_size) * num_rows / (num_rows - 1)) if num_rows > 1 else 0.0
+        replicates += stratum_estimate + spread * (scale * (weights @ stratum_values) - stratum_estimate)
+    return estimate, replicates
+
+def _interval_frame(columns: list, estimate: np.ndarray, replicates: np.ndarray, ci: float):
+    low, high = np.quantile(replicates, [(1 - ci) / 2, (1 + ci) / 2], axis = 0)
+    return pd.DataFrame({"estimate": estimate, "se": replicates.std(axis = 0, ddof = 1),
+                         "ci_low": low, "ci_high": high}, index = pd.Index(columns, name = "column"))
+
+def _role_of(column: str):
+    # "ceo" for HarmVirtue_ceo and ceo_sentence_number, None for the _all columns
+    for role in ROLES:
+        if column.endswith('_' + role) or column.startswith(role + '_'):
+            return role
+    return None
+
+def estimate_totals(sample_df: pd.DataFrame, population_df: pd.DataFrame, value_columns: list,
+                    n_boot: int = 1000, ci: float = 0.95, seed: int = 0):
+    '''
+    A func to estimate the corpus totals and the means per manager
+
+    Parameters
+    ----------
+    sample_df: pd.DataFrame
+        One row per sampled unit: its "stratum", the value_columns and, for
+        the means per manager, the flags "has_ceo" and "has_cfo"
+    population_df: pd.DataFrame
+        One row per unit of the population, with its "stratum" code, and the
+        manager IDs "ceo_id" and "cfo_id"
+    value_columns: list
+        The counted columns
+    n_boot: int
+        Number of bootstrap replicates
+    ci: float
+        Coverage of the percentile intervals
+
+    Returns
+    -------
+    totals_df: pd.DataFrame
+        Per column: estimate, se, ci_low, ci_high of the corpus total
+    manager_df: pd.DataFrame
+        The same for the mean per manager of every _ceo and _cfo column
+
+    '''
+    stratum_sizes = np.bincount(population_df["stratum"], minlength = population_df["stratum"].max() + 1)
+    stratum = sample_df["stratum"].to_numpy()
+    values = sample_df[value_columns].to_numpy(dtype = np.float64)
+    # the same seed gives the same replicates, so totals and manager means are paired
+    estimate, replicates = _bootstrap_totals(values, stratum, stratum_sizes, n_boot, np.random.default_rng(seed))
+    totals_df = _interval_frame(value_columns, estimate, replicates, ci)
+
+    # a manager's calls add up to the manager's total, as in panel2cross; only calls with a manager count
+    manager_columns, manager_estimates, manager_replicates = [], [], []
+    for role in ROLES:
+        role_columns = [column for column in value_columns if _role_of(column) == role]
+        num_managers = population_df[role + "_id"].nunique()
+        if len(role_columns) == 0 or num_managers == 0:
+            continue
+        role_values = sample_df[role_columns].to_numpy(dtype = np.float64) * sample_df["has_" + role].to_numpy()[:, np.newaxis]
+        role_estimate, role_replicates = _bootstrap_totals(role_values, stratum, stratum_sizes, n_boot,
+                                                           np.random.default_rng(seed))
+        manager_columns += role_columns
+        manager_estimates.append(role_estimate / num_managers)
+        manager_replicates.append(role_replicates / num_managers)
+    if len(manager_columns) == 0:
+        manager_df = _interval_frame([], np.zeros(0), np.zeros((n_boot, 0)), ci)
+    else:
+        manager_df = _interval_frame(manager_columns, np.concatenate(manager_estimates),
+                                     np.concatenate(manager_replicates, axis = 1), ci)
+    return totals_df, manager_df
+
+def run_sample(engine_obj, fraction: float = 0.1, num_job: int = 4, n_boot: int = 1000, ci: float = 0.95,
+               min_per_stratum: int = 2, strata: list = STRATA, seed: int = 0, batch_size: int = 16):
+    '''
+    A func to count a stratified sample of the transcripts of an engine, and
+    estimate the results of the full run
+
+    Parameters
+    ----------
+    engine_obj: WordFreq, SentFreq or WordSentFreq
+        Its panel gives the strata of the transcripts
+    fraction, min_per_stratum, strata, seed: see stratified_sample
+    num_job: int
+        Number of workers counting the sample
+    n_boot, ci: see estimate_totals
+
+    Returns
+    -------
+    totals_df, manager_df: pd.DataFrame
+        See estimate_totals
+    strata_df: pd.DataFrame
+        Per stratum: the strata values, the number of transcripts and the
+        number sampled
+
+    '''
+    # the population is what a full run counts: the catalog rows of the panel transcripts
+    catalog_df = engine_obj.catalog.select(engine_obj.trans_id_set).reset_index(drop = True)
+    panel_df = engine_obj.panel_df.drop_duplicates("transcript_ID").set_index("transcript_ID")
+    population_df = panel_df.loc[catalog_df["transcript_ID"], strata].reset_index()
+    for role in ROLES:
+        population_df[role + "_id"] = first_of_list(panel_df.loc[catalog_df["transcript_ID"], role + "_factset_person_id"]).to_numpy()
+    population_df = stratified_sample(population_df, fraction, min_per_stratum, strata, seed)
+
+    sampled = population_df["sampled"].to_numpy()
+    sample_catalog_df = catalog_df[sampled]
+    sizes = list(sample_catalog_df["ceo_size"] + sample_catalog_df["cfo_size"] + sample_catalog_df["others_size"]) \
+            if "ceo_size" in sample_catalog_df.columns else list(sample_catalog_df["size"])
+    counts_df, engine_obj.worker_report, engine_obj.telemetry = count_transcripts(engine_obj.count_row, engine_obj.schema,
+                                                                                  list(sample_catalog_df["path"]), sizes,
+                                                                                  num_job, batch_size = batch_size, part_tag = 'sample',
+                                                                                  prefetch = engine_obj.read_talk_rows)
+
+    sample_df = counts_df.reset_index(drop = True)
+    sample_df["stratum"] = population_df.loc[sampled, "stratum"].to_numpy()
+    for role in ROLES:
+        sample_df["has_" + role] = population_df.loc[sampled, role + "_id"].notna().to_numpy()
+    totals_df, manager_df = estimate_totals(sample_df, population_df, engine_obj.schema.columns, n_boot, ci, seed)
+
+    strata_df = population_df.groupby("stratum").agg(dict([(column, "first") for column in strata] +
+                                                          [("sampled", ["size", "sum"])]))
+    strata_df.columns = strata + ["transcripts", "sampled"]
+    return totals_df, manager_df, strata_df
+
+def _open_engine(engine: str, panel_data_path: str, processed_all_year_path: str, moral_dict_path: str):
+    if engine == "wf":
+        from confcall.cal_wf import WordFreq
+        return WordFreq(panel_data_path, processed_all_year_path, moral_dict_path, None)
+    if engine == "sf":
+        from confcall.cal_sf import SentFreq
+        return SentFreq(panel_data_path, processed_all_year_path, moral_dict_path)
+    from confcall.cal_wsf import WordSentFreq
+    return WordSentFreq(panel_data_path, processed_all_year_path, moral_dict_path)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Estimate the results of wf, sf or wsf from a stratified sample")
+    parser.add_argument("engine", choices = ["wf", "sf", "wsf"])
+    parser.add_argument("panel_data_path")
+    parser.add_argument("processed_all_year_path")
+    parser.add_argument("moral_dict_path")
+    parser.add_argument("out_path", help = "prefix of the output CSVs")
+    parser.add_argument("--fraction", type = float, default = 0.1)
+    parser.add_argument("--boot", type = int, default = 1000)
+    parser.add_argument("--ci", type = float, default = 0.95)
+    parser.add_argument("--jobs", type = int, default = 4)
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args(argv)
+
+    engine_obj = _open_engine(args.engine, args.panel_data_path, args.processed_all_year_path, args.moral_dict_path)
+    totals_df, manager_df, strata_df = run_sample(engine_obj, args.fraction, args.jobs, args.boot, args.ci, seed = args.seed)
+    totals_df.to_csv(args.out_path + '_totals.csv')
+    manager_df.to_csv(args.out_path + '_manager_means.csv')
+    strata_df.to_csv(args.out_path + '_strata.csv', index = False)
+    print("sampled %d of %d transcripts in %d strata" % (strata_df["sampled"].sum(), strata_df["transcripts"].sum(), len(strata_df)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Size-aware, dynamic scheduling for the threading() methods: the work is
+filtered first, ordered largest first, cut into small batches and handed out
+to the joblib process pool one batch at a time, so no worker is stuck with a
+slice of huge transcripts while the others sit idle.
+
+CONTENT
+-------
+- <FUNC> worker_state
+- <FUNC> transcript_size
+- <FUNC> plan_batches
+- <FUNC> run_batches
+- <FUNC> utilisation_report
+- <FUNC> count_transcripts
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from joblib import Parallel, delayed
+from confcall.result_sink import ResultSink
+from confcall.talk_slices import transcript_id_from_path
+from confcall.telemetry import TELEMETRY, Telemetry
+
+TALK_FILES = ["ceo_talk.csv", "cfo_talk.csv", "others_talk.csv"]
+
+# engine attributes only the parent needs; every batch ships count_row, hence the
+# engine, to a worker, which counts with the matcher, schema, reader and cache only
+PARENT_ONLY_STATE = ["panel_df", "trans_id_list", "trans_id_set", "catalog", "full_path_list", "word_dicts",
+                     "worker_report", "telemetry"]
+
+def worker_state(engine_obj):
+    '''
+    The __getstate__ of the engines: their attributes but PARENT_ONLY_STATE.
+    A packed corpus still travels with its row reader.
+    '''
+    state = engine_obj.__dict__.copy()
+    for name in PARENT_ONLY_STATE:
+        state.pop(name, None)
+    return state
+
+def transcript_size(trans_path: str):
+    '''
+    Total size in bytes of the talk files of a transcript, 0 if none exists
+    '''
+    size = 0
+    for file_name in TALK_FILES:
+        try:
+            size += os.stat(trans_path + '/' + file_name).st_size
+        except OSError:
+            pass
+    return size
+
+def plan_batches(items: list, weights: list, batch_size: int):
+    '''
+    A func to order the work largest first and cut it into small batches
+
+    Parameters
+    ----------
+    items: list
+        The work items, e.g. transcript paths or manager ids
+    weights: list
+        Expected cost of every item, e.g. file sizes
+    batch_size: int
+        Number of items per batch
+
+    Returns
+    -------
+    batches: list
+        A list of (positions, items) tuples; positions are the indices of the
+        items in the input list, so the output can be put back in input order
+
+    '''
+    order = sorted(range(len(items)), key = lambda item_i: weights[item_i], reverse = True)
+    batches = []
+    for batch_start in range(0, len(order), batch_size):
+        positions = order[batch_start: batch_start + batch_size]
+        batches.append((positions, [items[item_i] for item_i in positions]))
+    return batches
+
+def _timed_run(func, batch_i: int, batch_items: list):
+    start = time.perf_counter()
+    result = func(batch_items, batch_i)
+    busy = time.perf_counter() - start
+    return batch_i, os.getpid(), busy, len(batch_items), result
+
+def run_batches(func, batches: list, num_job: int, consume = None):
+    '''
+    A func to hand out batches dynamically to a pool of num_job processes
+
+    Parameters
+    ----------
+    func: callable
+        Called as func(batch_items, batch_i) in a worker
+    batches: list
+        Output of plan_batches
+    num_job: int
+        Number of worker processes
+    consume: callable
+        If given, called as consume(batch_i, result) in the parent as each
+        batch finishes; its return value is kept in place of the result
+
+    Returns
+    -------
+    results: list
+        func's return value (or consume's) for every batch, in the order of batches
+    usage_df: pd.DataFrame
+        One row per finished batch: batch, pid, busy seconds and item count
+
+    '''
+    start = time.perf_counter()
+    # batch_size=1 makes joblib dispatch one batch whenever a worker is free
+    outputs = Parallel(n_jobs = num_job, verbose = 1, batch_size = 1, return_as = "generator_unordered")(
+        delayed(_timed_run)(func, batch_i, batch_items) for batch_i, (_, batch_items) in enumerate(batches))
+
+    results = [None] * len(batches)
+    usage = []
+    for batch_i, pid, busy, num_items, result in outputs:
+        results[batch_i] = result if consume is None else consume(batch_i, result)
+        usage.append({"batch": batch_i, "pid": pid, "busy": busy, "items": num_items})
+    wall = time.perf_counter() - start
+
+    usage_df = pd.DataFrame(usage, columns = ["batch", "pid", "busy", "items"])
+    usage_df.attrs["wall"] = wall
+    return results, usage_df
+
+def utilisation_report(usage_df: pd.DataFrame, verbose: bool = True):
+    '''
+    A func to sum up run_batches' usage by worker
+
+    Returns
+    -------
+    report_df: pd.DataFrame
+        One row per worker process: batches, items, busy seconds and the
+        share of the wall time the worker was busy
+
+    '''
+    wall = usage_df.attrs.get("wall", usage_df["busy"].sum())
+    report_df = usage_df.groupby("pid").agg(batches = ("batch", "count"),
+                                            items = ("items", "sum"),
+                                            busy = ("busy", "sum"))
+    report_df["utilisation"] = report_df["busy"] / wall if wall > 0 else 0.0
+    if verbose:
+        print("wall time: %.1fs" % wall)
+        print(report_df.to_string(float_format = lambda x: "%.2f" % x))
+    return report_df
+
+def _count_batch(count_func, schema, trans_list: list, batch_i: int, store_path: str, part_tag: str, prefetch,
+                 hit_recorder = None):
+    # the batch body of count_transcripts; a module-level function, so that in a
+    # worker it sees the worker's TELEMETRY rather than a pickled copy
+    block = schema.new_block(len(trans_list))
+    if prefetch is not None:
+        prefetch.schedule(trans_list)
+    if hit_recorder is not None:
+        hit_recorder.open(part_tag + '-%05d' % batch_i, [int(transcript_id_from_path(path)) for path in trans_list])
+    try:
+        for trans_i, path in enumerate(trans_list):
+            start = time.perf_counter()
+            block[trans_i] = count_func(path)
+            seconds = time.perf_counter() - start
+            TELEMETRY.add_time("transcript", seconds)
+            TELEMETRY.record_item(path, seconds)
+    finally:
+        if prefetch is not None:
+            prefetch.close()
+
+    if hit_recorder is not None:
+        with TELEMETRY.timer("write_hits"):
+            hit_recorder.close()
+
+    if store_path is not None:
+        # the parent writes the table through its one sink (see count_transcripts)
+        with TELEMETRY.timer("assemble"):
+            table = schema.to_table(block, [transcript_id_from_path(path) for path in trans_list])
+        return table, TELEMETRY.drain()
+    with TELEMETRY.timer("assemble"):
+        batch_df = schema.to_frame(block, range(len(trans_list)))
+        batch_df.insert(0, "transcript_ID", [transcript_id_from_path(path) for path in trans_list])
+    return batch_df, TELEMETRY.drain()
+
+def count_transcripts(count_func, schema, path_list: list, sizes: list,
+                      num_job: int, store_path: str = None, batch_size: int = 16, part_tag: str = 'part',
+                      telemetry_path: str = None, prefetch = None, hit_recorder = None):
+    '''
+    A func to run a count_row method over transcripts, the shared body of
+    the threading() methods
+
+    Parameters
+    ----------
+    count_func: callable
+        count_func(trans_path) -> the row of the transcript, laid out by schema
+    schema: ResultSchema
+        The layout of the rows; every batch fills one preallocated block
+    path_list: list
+        Transcript folders to count
+    sizes: list
+        Size of every transcript, to schedule the largest first
+    num_job: int
+        Number of worker processes
+    store_path: str
+        If given, stream the rows to parquet parts under store_path; the
+        batches are written as they finish through one sink, which rolls a
+        part every batch_rows rows
+    batch_size: int
+        Number of transcripts per batch
+    part_tag: str
+        Prefix of the parquet parts
+    telemetry_path: str
+        If given, write the merged telemetry there (see Telemetry.write)
+    prefetch: PrefetchReader
+        The row reader used by count_func; if given, every batch schedules
+        its transcripts on it, so they are read ahead while counting
+    hit_recorder: HitRecorder
+        The hit recorder used by count_func, if any; every batch writes the
+        hits of its transcripts to a part (see hit_index)
+
+    Returns
+    -------
+    out: pd.DataFrame or str
+        The rows in the order of path_list, or store_path when streaming;
+        either way the rows lead with a transcript_ID column (a string,
+        as read back by read_results)
+    report_df: pd.DataFrame
+        Output of utilisation_report
+    telemetry: Telemetry
+        The stage timers and counters of all workers, the slowest
+        transcripts and the per-worker throughput
+
+    '''
+    batches = plan_batches(path_list, sizes, batch_size)
+
+    # process a list of trans into a block of rows, return a dataframe,
+    # or an arrow table to stream to store_path
+    def run(trans_list, batch_i):
+        return _count_batch(count_func, schema, trans_list, batch_i, store_path, part_tag, prefetch, hit_recorder)
+
+    telemetry = Telemetry()
+    consume = None
+    if store_path is not None:
+        sink = ResultSink(store_path, ["transcript_ID"] + schema.columns, string_columns = ["transcript_ID"],
+                          numeric_type = pa.from_numpy_dtype(schema.dtype), part_prefix = part_tag)
+
+        # write every batch as it arrives, keep only its row count
+        def consume(batch_i, output):
+            table, batch_telemetry = output
+            start = time.perf_counter()
+            sink.write_table(table)
+            telemetry.add_time("write", time.perf_counter() - start)
+            return table.num_rows, batch_telemetry
+
+    # deploy the treading
+    try:
+        outputs, usage_df = run_batches(run, batches, num_job, consume)
+    finally:
+        if store_path is not None:
+            sink.close()
+    report_df = utilisation_report(usage_df)
+
+    # merge the telemetry of the batches
+    for _, batch_telemetry in outputs:
+        telemetry.merge(batch_telemetry)
+    telemetry.set_workers(report_df)
+    if telemetry_path is not None:
+        telemetry.write(telemetry_path)
+
+    sub_results = [sub_result for sub_result, _ in outputs]
+    if store_path is not None:
+        return store_path, report_df, telemetry
+    if len(sub_results) == 0:
+        final_df = schema.to_frame(schema.new_block(0), [])
+        final_df.insert(0, "transcript_ID", pd.Series([], dtype = str))
+        return final_df, report_df, telemetry
+
+    # combine the results and put the rows back in the order of path_list
+    final_df = pd.concat(sub_results, axis = 0)
+    positions = [pos for batch_positions, _ in batches for pos in batch_positions]
+    final_df = final_df.iloc[np.argsort(positions, kind = 'stable')]
+    final_df.reset_index(drop = True, inplace = True)
+    return final_df, report_df, telemetry
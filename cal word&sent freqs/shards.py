@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Run wf, sf or wsf as independent shards, on one box or several sharing a
+file system:
+1. plan_shards writes a manifest: the transcripts of the panel found in
+   the catalog, cut into deterministic shards by year folder and
+   transcript_ID range, with the engine and its inputs
+2. run_worker (any number of processes, e.g. one per node) counts the
+   shards of a worker, worker_i of num_workers; every shard goes to its own
+   parquet file, written atomically, so a finished shard is never redone
+   and a crashed one is simply run again
+3. merge_shards checks that every shard is there and holds exactly its
+   transcripts, then concatenates them in transcript_ID order
+
+run_local stands in for several nodes with several local processes.
+
+Run as a script:
+    python shards.py plan <manifest> <engine> <panel_data_path> <processed_all_year_path> <moral_dict_path> [--shard-size 2000]
+    python shards.py run <manifest> <shard_path> [--worker 0 --workers 1 --jobs 1]
+    python shards.py merge <manifest> <shard_path> <out_parquet>
+    python shards.py local <manifest> <shard_path> <out_parquet> [--workers 4]
+
+CONTENT
+-------
+- <CLASS> CoverageError
+- <FUNC> plan_shards
+- <FUNC> load_manifest
+- <FUNC> run_shard
+- <FUNC> run_worker
+- <FUNC> merge_shards
+- <FUNC> run_local
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import sys
+import json
+import argparse
+import subprocess
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from confcall.transcript_catalog import TranscriptCatalog
+from confcall.scheduler import count_transcripts
+
+ENGINES = ["wf", "sf", "wsf"]
+
+class CoverageError(Exception):
+    '''
+    The shard outputs do not cover the manifest: shards missing, or
+    transcripts missing, unexpected or repeated
+    '''
+    def __init__(self, missing_shards: list, missing_ids: list, extra_ids: list, duplicate_ids: list):
+        self.missing_shards = missing_shards
+        self.missing_ids = missing_ids
+        self.extra_ids = extra_ids
+        self.duplicate_ids = duplicate_ids
+        super().__init__("%d shards missing, %d transcripts missing, %d unexpected, %d repeated"
+                         % (len(missing_shards), len(missing_ids), len(extra_ids), len(duplicate_ids)))
+
+def plan_shards(manifest_path: str, engine: str, panel_data_path: str, processed_all_year_path: str, moral_dict_path: str,
+                shard_size: int = 2000, catalog_path: str = None, engine_kwargs: dict = None):
+    '''
+    A func to cut the work into shards and write the manifest
+
+    Parameters
+    ----------
+    manifest_path: str
+        The manifest (JSON) to write
+    engine: str
+        One of ENGINES
+    panel_data_path, processed_all_year_path, moral_dict_path: str
+        The inputs of the engine
+    shard_size: int
+        Max number of transcripts per shard; a year folder is cut into ID
+        ranges of at most shard_size transcripts
+    catalog_path: str
+        Passed to TranscriptCatalog
+    engine_kwargs: dict
+        Further keyword arguments of the engine, e.g. cache_path or
+        reader_backend; paths must be valid on every node
+
+    Returns
+    -------
+    manifest: dict
+
+    '''
+    if engine not in ENGINES:
+        raise ValueError("unknown engine: " + engine)
+    # refresh the catalog once here, so the workers find it up to date and never write it
+    catalog_df = TranscriptCatalog(processed_all_year_path, catalog_path).refresh().catalog_df
+    trans_ids = set(pd.read_csv(panel_data_path, usecols = ["transcript_ID"])["transcript_ID"])
+    catalog_df = catalog_df[catalog_df["transcript_ID"].isin(trans_ids)].sort_values(["year", "transcript_ID"])
+
+    shards = []
+    for year, year_df in catalog_df.groupby("year", sort = True):
+        year_ids = [int(trans_id) for trans_id in year_df["transcript_ID"]]
+        for shard_start in range(0, len(year_ids), shard_size):
+            shard_ids = year_ids[shard_start: shard_start + shard_size]
+            shards.append({"shard_id": "%s-%04d" % (year, shard_start // shard_size),
+                           "year": year, "id_min": shard_ids[0], "id_max": shard_ids[-1],
+                           "transcript_IDs": shard_ids})
+
+    manifest = {"engine": engine,
+                "panel_data_path": panel_data_path,
+                "processed_all_year_path": processed_all_year_path,
+                "moral_dict_path": moral_dict_path,
+                "catalog_path": catalog_path,
+                "engine_kwargs": engine_kwargs or {},
+                "shard_size": shard_size,
+                "num_transcripts": len(catalog_df),
+                "shards": shards}
+    with open(manifest_path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent = 1)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+def load_manifest(manifest_path: str):
+    with open(manifest_path, 'r') as file:
+        return json.load(file)
+
+def _open_engine(manifest: dict):
+    # the engine of the manifest; imported here, so planning and merging do not load the engines
+    engine, kwargs = manifest["engine"], dict(manifest["engine_kwargs"])
+    kwargs["catalog_path"] = manifest["catalog_path"]
+    inputs = (manifest["panel_data_path"], manifest["processed_all_year_path"], manifest["moral_dict_path"])
+    if engine == "wf":
+        from confcall.cal_wf import WordFreq
+        return WordFreq(*inputs, store_path = None, **kwargs)
+    if engine == "sf":
+        from confcall.cal_sf import SentFreq
+        return SentFreq(*inputs, **kwargs)
+    from confcall.cal_wsf import WordSentFreq
+    return WordSentFreq(*inputs, **kwargs)
+
+def _shard_file(shard_path: str, shard_id: str):
+    return shard_path + '/' + shard_id + '.parquet'
+
+def run_shard(engine_obj, shard: dict, shard_path: str, num_job: int = 1, batch_size: int = 16):
+    '''
+    A func to count the transcripts of a shard into its own parquet file
+
+    Parameters
+    ----------
+    engine_obj: WordFreq, SentFreq or WordSentFreq
+        The engine of the manifest
+    shard: dict
+        A shard of the manifest
+
+    Returns
+    -------
+    num_rows: int
+
+    '''
+    shard_df = engine_obj.catalog.select(set(shard["transcript_IDs"]))
+    if "year" in shard_df.columns:
+        # an ID found in several year folders belongs to the shard of each
+        shard_df = shard_df[shard_df["year"] == shard["year"]]
+    path_list = list(shard_df["path"])
+    sizes = list(shard_df["ceo_size"] + shard_df["cfo_size"] + shard_df["others_size"]) if "ceo_size" in shard_df.columns \
+            else list(shard_df["size"])
+    out_df, _, _ = count_transcripts(engine_obj.count_row, engine_obj.schema, path_list, sizes,
+                                     num_job, batch_size = batch_size, part_tag = shard["shard_id"],
+                                     prefetch = engine_obj.read_talk_rows)
+    table = engine_obj.schema.to_table(out_df[engine_obj.schema.columns].to_numpy(dtype = engine_obj.schema.dtype),
+                                       list(out_df["transcript_ID"]))
+
+    # write to a temp name first, so a shard file is either complete or absent
+    out_path = _shard_file(shard_path, shard["shard_id"])
+    pq.write_table(table, out_path + '.tmp')
+    os.replace(out_path + '.tmp', out_path)
+    return table.num_rows
+
+def run_worker(manifest_path: str, shard_path: str, worker_i: int = 0, num_workers: int = 1,
+               num_job: int = 1, overwrite: bool = False, verbose: bool = True):
+    '''
+    A func to run the shards of one worker: shard k of the manifest belongs
+    to worker k % num_workers. Shards with an output file are skipped
+    unless overwrite is set.
+
+    Returns
+    -------
+    done: list
+        The shard ids counted by this call
+
+    '''
+    manifest = load_manifest(manifest_path)
+    os.makedirs(shard_path, exist_ok = True)
+    todo = [shard for shard_i, shard in enumerate(manifest["shards"])
+            if shard_i % num_workers == worker_i and (overwrite or not os.path.exists(_shard_file(shard_path, shard["shard_id"])))]
+    if len(todo) == 0:
+        return []
+
+    engine_obj = _open_engine(manifest)
+    done = []
+    for shard in todo:
+        num_rows = run_shard(engine_obj, shard, shard_path, num_job)
+        done.append(shard["shard_id"])
+        if verbose:
+            print("worker %d/%d: shard %s, %d transcripts" % (worker_i, num_workers, shard["shard_id"], num_rows))
+    return done
+
+def merge_shards(manifest_path: str, shard_path: str, out_path: str = None):
+    '''
+    A func to check the coverage of the shard files and concatenate them
+
+    Parameters
+    ----------
+    out_path: str
+        If given, also write the merged rows there (parquet)
+
+    Returns
+    -------
+    merged_df: pd.DataFrame
+        All rows, with a leading transcript_ID column, in transcript_ID order
+
+    Raises
+    ------
+    CoverageError
+        If a shard file is missing, or the files do not hold exactly the
+        transcripts of their shards
+
+    '''
+    manifest = load_manifest(manifest_path)
+    missing_shards, tables = [], []
+    missing_ids, extra_ids, duplicate_ids = [], [], []
+    for shard in manifest["shards"]:
+        path = _shard_file(shard_path, shard["shard_id"])
+        if not os.path.exists(path):
+            missing_shards.append(shard["shard_id"])
+            continue
+        table = pq.read_table(path)
+        file_ids = pd.Series(table.column("transcript_ID").to_pylist()).astype('int64')
+        expected = set(shard["transcript_IDs"])
+        missing_ids += sorted(expected - set(file_ids))
+        extra_ids += sorted(set(file_ids) - expected)
+        duplicate_ids += sorted(set(file_ids[file_ids.duplicated()]))
+        tables.append(table)
+    if missing_shards or missing_ids or extra_ids or duplicate_ids:
+        raise CoverageError(missing_shards, missing_ids, extra_ids, duplicate_ids)
+
+    merged_df = pa.concat_tables(tables).to_pandas() if len(tables) > 0 else pd.DataFrame(columns = ["transcript_ID"])
+    order = merged_df["transcript_ID"].astype('int64').argsort(kind = 'stable')
+    merged_df = merged_df.iloc[order].reset_index(drop = True)
+    if out_path is not None:
+        merged_df.to_parquet(out_path + '.tmp', index = False)
+        os.replace(out_path + '.tmp', out_path)
+    return merged_df
+
+def run_local(manifest_path: str, shard_path: str, out_path: str = None, num_workers: int = 2, num_job: int = 1):
+    '''
+    A func to run every worker as its own local process, standing in for
+    num_workers nodes, and merge their shards
+    '''
+    procs = [subprocess.Popen([sys.executable, "-m", "confcall.shards", "run", manifest_path, shard_path,
+                               "--worker", str(worker_i), "--workers", str(num_workers), "--jobs", str(num_job)])
+             for worker_i in range(num_workers)]
+    failed = [worker_i for worker_i, proc in enumerate(procs) if proc.wait() != 0]
+    if failed:
+        raise RuntimeError("workers failed: " + str(failed))
+    return merge_shards(manifest_path, shard_path, out_path)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Run wf, sf or wsf as shards, and merge them")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+    plan_parser = subparsers.add_parser("plan")
+    plan_parser.add_argument("manifest")
+    plan_parser.add_argument("engine", choices = ENGINES)
+    plan_parser.add_argument("panel_data_path")
+    plan_parser.add_argument("processed_all_year_path")
+    plan_parser.add_argument("moral_dict_path")
+    plan_parser.add_argument("--shard-size", type = int, default = 2000)
+    plan_parser.add_argument("--catalog", default = None)
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("manifest")
+    run_parser.add_argument("shard_path")
+    run_parser.add_argument("--worker", type = int, default = 0)
+    run_parser.add_argument("--workers", type = int, default = 1)
+    run_parser.add_argument("--jobs", type = int, default = 1)
+    run_parser.add_argument("--overwrite", action = "store_true")
+    for name in ["merge", "local"]:
+        sub_parser = subparsers.add_parser(name)
+        sub_parser.add_argument("manifest")
+        sub_parser.add_argument("shard_path")
+        sub_parser.add_argument("out_path")
+        if name == "local":
+            sub_parser.add_argument("--workers", type = int, default = 2)
+            sub_parser.add_argument("--jobs", type = int, default = 1)
+    args = parser.parse_args(argv)
+
+    if args.command == "plan":
+        manifest = plan_shards(args.manifest, args.engine, args.panel_data_path, args.processed_all_year_path,
+                               args.moral_dict_path, args.shard_size, args.catalog)
+        print("planned %d shards of %d transcripts into %s" % (len(manifest["shards"]), manifest["num_transcripts"], args.manifest))
+    elif args.command == "run":
+        run_worker(args.manifest, args.shard_path, args.worker, args.workers, args.jobs, args.overwrite)
+    else:
+        try:
+            if args.command == "merge":
+                merged_df = merge_shards(args.manifest, args.shard_path, args.out_path)
+            else:
+                merged_df = run_local(args.manifest, args.shard_path, args.out_path, args.workers, args.jobs)
+        except CoverageError as error:
+            print("incomplete shards: %s" % error)
+            return 1
+        print("merged %d transcripts into %s" % (len(merged_df), args.out_path))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Generate synthetic inputs for every stage of the project, laid out like the
+real ones, so the pipeline can be run and timed away from the real data:
+- a moral foundations dictionary file (11 sub-dicts, exact and wildcard terms)
+- an all_year_processed_data tree: <year>processed/<CO>-<transcript_ID>-<type>/
+  with ceo_talk.csv, cfo_talk.csv and others_talk.csv
+- a panel CSV with the transcript, manager and indicator columns read by
+  cal_wf, cal_sf, raw2panel and Panel2Cross
+- a lookup CSV of factset_entity_id -> proper_name, cusip
+
+Transcript sizes, speaker mix, Q&A share and the share of dictionary words
+are configurable, and the output only depends on the seed.
+
+Run as a script:
+    python synthetic_corpus.py <out_path> <number of transcripts> [--seed 0]
+
+CONTENT
+-------
+- <FUNC> make_moral_dict
+- <FUNC> make_corpus
+- <FUNC> make_panel
+- <FUNC> make_lookup
+- <FUNC> make_all
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+SUB_DICT_NAMES = ['HarmVirtue', 'HarmVice', 'FairnessVirtue', 'FairnessVice', 'IngroupVirtue', 'IngroupVice',
+                  'AuthorityVirtue', 'AuthorityVice', 'PurityVirtue', 'PurityVice', 'MoralityGeneral']
+
+# the non-dictionary indicators of the panel, as listed by raw2panel
+INDICATOR_LIST = ['90_FocusPast', '91_FocusPresent', '92_FocusFuture', 'a_agency', 'a_communion']
+
+TITLES = ["Mr.", "Mrs.", "Ms.", "Dr.", "Prof.", "Gov."]
+
+def _random_words(rng, num_words: int, min_len: int = 2, max_len: int = 10):
+    letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+    lengths = rng.integers(min_len, max_len + 1, num_words)
+    return sorted(set(''.join(rng.choice(letters, length)) for length in lengths))
+
+def make_moral_dict(dict_path: str, num_terms: int = 320, wildcard_share: float = 0.6, seed: int = 0):
+    '''
+    A func to write a dictionary file in the format of load_moral_dict
+
+    Returns
+    -------
+    terms: list
+        The dictionary terms, wildcards with their trailing "*"
+
+    '''
+    rng = np.random.default_rng(seed)
+    stems = _random_words(rng, num_terms, 4, 9)
+    terms = [stem + '*' if rng.random() < wildcard_share else stem for stem in stems]
+    with open(dict_path, 'w') as file:
+        file.write('%\n')
+        for key_i, name in enumerate(SUB_DICT_NAMES):
+            file.write('%02d\t%s\n' % (key_i + 1, name))
+        file.write('%\n')
+        for term in terms:
+            keys = rng.choice(len(SUB_DICT_NAMES), rng.integers(1, 4), replace = False) + 1
+            file.write(term + '\t' + '\t'.join('%02d' % key for key in sorted(keys)) + '\n')
+    return terms
+
+def _talk_content(rng, vocab: list, dict_words: list, num_words: int, moral_share: float):
+    # sentences of capitalised words ending in .?!, with a title now and then
+    words = []
+    while len(words) < num_words:
+        sentence = []
+        for _ in range(int(rng.integers(4, 25))):
+            if len(dict_words) > 0 and rng.random() < moral_share:
+                sentence.append(dict_words[rng.integers(len(dict_words))])
+            else:
+                sentence.append(vocab[rng.integers(len(vocab))])
+        if rng.random() < 0.05:
+            sentence.insert(int(rng.integers(len(sentence))), TITLES[rng.integers(len(TITLES))])
+        sentence[0] = sentence[0].capitalize()
+        sentence[-1] += ".?!,"[int(rng.choice(4, p = [0.8, 0.1, 0.05, 0.05]))]
+        words += sentence
+    return ' '.join(words)
+
+def make_corpus(processed_all_year_path: str,
+                num_transcripts: int,
+                dict_terms: list = (),
+                years: tuple = (2018, 2019, 2020),
+                rows_per_transcript: float = 60,
+                words_per_row: float = 45,
+                size_sigma: float = 0.6,
+                speaker_mix: tuple = (0.25, 0.15, 0.6),
+                qa_share: float = 0.5,
+                moral_share: float = 0.03,
+                empty_share: float = 0.02,
+                seed: int = 0):
+    '''
+    A func to write an all_year_processed_data tree
+
+    Parameters
+    ----------
+    processed_all_year_path: str
+        Output folder; created if missing
+    num_transcripts: int
+        Number of transcripts, spread evenly over the years
+    dict_terms: list
+        Output of make_moral_dict; matching words are mixed into the talk
+    rows_per_transcript, words_per_row: float
+        Median number of talk rows of a transcript, and of words of a row;
+        both are log-normal with sigma size_sigma, so a few transcripts are
+        much larger than the rest
+    speaker_mix: tuple
+        Shares of the rows spoken by ceo, cfo and others
+    qa_share: float
+        Share of the rows in the Q&A section
+    moral_share: float
+        Share of the words that match the dictionary
+    empty_share: float
+        Share of the rows with an empty talk_content
+
+    Returns
+    -------
+    trans_ids: list
+        The transcript IDs written
+
+    '''
+    rng = np.random.default_rng(seed)
+    vocab = _random_words(rng, 3000)
+    dict_words = [term.rstrip('*') + ('ing' if term.endswith('*') and rng.random() < 0.5 else '') for term in dict_terms]
+    speaker_p = np.asarray(speaker_mix, dtype = float) / np.sum(speaker_mix)
+
+    trans_ids = []
+    for trans_i in range(num_transcripts):
+        trans_id = 10000000 + trans_i
+        year = years[trans_i % len(years)]
+        trans_path = '%s/%dprocessed/CO%04d-%d-%s' % (processed_all_year_path, year, trans_i % 997, trans_id,
+                                                     ['E', 'G', 'S'][trans_i % 3])
+        os.makedirs(trans_path, exist_ok = True)
+
+        num_rows = max(1, int(rng.lognormal(np.log(rows_per_transcript), size_sigma)))
+        row_speakers = rng.choice(3, num_rows, p = speaker_p)
+        row_is_QA = rng.random(num_rows) < qa_share
+        for speaker_i, file_name in enumerate(['ceo_talk.csv', 'cfo_talk.csv', 'others_talk.csv']):
+            talk_rows = []
+            for row_i in np.nonzero(row_speakers == speaker_i)[0]:
+                if rng.random() < empty_share:
+                    talk_content = ''
+                else:
+                    num_words = max(1, int(rng.lognormal(np.log(words_per_row), size_sigma)))
+                    talk_content = _talk_content(rng, vocab, dict_words, num_words, moral_share)
+                talk_rows.append(('speaker %d' % speaker_i, talk_content, 'Q' if row_is_QA[row_i] else ''))
+            pd.DataFrame(talk_rows, columns = ['speaker', 'talk_content', 'question']).to_csv(trans_path + '/' + file_name, index = False)
+        trans_ids.append(trans_id)
+    return trans_ids
+
+def make_panel(panel_path: str, trans_ids: list, num_entities: int = 400, calls_per_manager: float = 12,
+               both_roles_share: float = 0.02, missing_share: float = 0.1, seed: int = 0):
+    '''
+    A func to write a panel CSV: one row per conf call, with the conf call
+    info, the CEO and CFO of the call and their talk words and indicators
+
+    Parameters
+    ----------
+    panel_path: str
+        Output file
+    trans_ids: list
+        The conf calls, e.g. from make_corpus
+    num_entities: int
+        Number of companies
+    calls_per_manager: float
+        Mean number of conf calls per manager
+    both_roles_share: float
+        Share of the CFOs that are CEOs elsewhere
+    missing_share: float
+        Share of the calls without a CEO, and without a CFO
+
+    '''
+    rng = np.random.default_rng(seed)
+    num_calls = len(trans_ids)
+    num_managers = max(1, int(num_calls / calls_per_manager))
+    ceo_ids = np.array(['%06d-E' % i for i in range(num_managers)], dtype = object)
+    cfo_ids = np.array(['%06d-F' % i for i in range(num_managers)], dtype = object)
+    shared = rng.random(num_managers) < both_roles_share
+    cfo_ids[shared] = ceo_ids[rng.integers(num_managers, size = int(shared.sum()))]
+
+    panel = {"transcript_ID": np.asarray(trans_ids),
+             "conf_date": pd.to_datetime('2018-01-01') + pd.to_timedelta(rng.integers(0, 1095, num_calls), unit = 'D'),
+             "conf_type": rng.choice(['E', 'G', 'S'], num_calls),
+             "conf_type_detail": rng.choice(['Earnings Call', 'Guidance Call', 'Sales Call'], num_calls),
+             "factset_entity_id": ['%06d-E' % entity_i for entity_i in rng.integers(num_entities, size = num_calls)]}
+    panel["conf_date_quarter"] = panel["conf_date"].to_period('Q').astype(str)
+    panel["fiscal_date"] = (panel["conf_date"] + pd.offsets.QuarterEnd(0)).strftime('%Y-%m-%d')
+    panel["conf_date"] = panel["conf_date"].strftime('%Y-%m-%d')
+    panel["year"] = panel["conf_date"].str[:4].astype(int)
+    # some calls hold several entity IDs, comma-separated
+    multi = rng.random(num_calls) < 0.05
+    panel["factset_entity_id"] = [entity_id + (',%06d-E' % rng.integers(num_entities) if is_multi else '')
+                                  for entity_id, is_multi in zip(panel["factset_entity_id"], multi)]
+
+    for position, manager_ids in [("ceo", ceo_ids), ("cfo", cfo_ids)]:
+        person_ids = manager_ids[rng.integers(num_managers, size = num_calls)].astype(object)
+        person_ids[rng.random(num_calls) < missing_share] = np.nan
+        panel[position + "_factset_person_id"] = person_ids
+        panel[position + "_name"] = ['Name ' + person_id if isinstance(person_id, str) else np.nan for person_id in person_ids]
+        talk_words = rng.integers(0, 6000, num_calls)
+        panel[position + "_talk_words_num"] = talk_words
+        panel["QA_" + position + "_talk_words_num"] = talk_words // 2
+        panel["exclude_QA_" + position + "_talk_words_num"] = talk_words - talk_words // 2
+        for gender in ["male", "female", "both"]:
+            panel["QA_" + gender + "_" + position + "_talk_words_num"] = rng.integers(0, 1000, num_calls)
+        panel[position + "_sentence_number"] = talk_words // 18
+
+        indicators = INDICATOR_LIST + ['QA_' + i for i in INDICATOR_LIST] + ['exclude_QA_' + i for i in INDICATOR_LIST]
+        indicators += [gender + i for gender in ['QA_male_', 'QA_female_', 'QA_both_'] for i in INDICATOR_LIST if "a_" in i]
+        for prefix in ['', 'exclude_QA_', 'QA_']:
+            indicators += [prefix + name for name in SUB_DICT_NAMES] + [prefix + name + '_sentence_number' for name in SUB_DICT_NAMES]
+        for indicator in indicators:
+            panel[indicator + '_' + position] = rng.poisson(20, num_calls)
+
+    panel["total_sentence_number"] = panel["ceo_sentence_number"] + panel["cfo_sentence_number"] + rng.integers(0, 400, num_calls)
+    panel["RD_sentence_number"] = rng.integers(0, 30, num_calls)
+    pd.DataFrame(panel).to_csv(panel_path, index = False)
+
+def make_lookup(lookup_path: str, num_entities: int = 400, coverage: float = 0.9, seed: int = 0):
+    '''
+    A func to write a lookup CSV covering a share of the entity IDs of make_panel
+    '''
+    rng = np.random.default_rng(seed)
+    entity_ids = ['%06d-E' % entity_i for entity_i in range(num_entities) if rng.random() < coverage]
+    pd.DataFrame({"factset_entity_id": entity_ids,
+                  "proper_name": ['Company %s' % entity_id for entity_id in entity_ids],
+                  "cusip": ['%09d' % rng.integers(10 ** 9) for _ in entity_ids]}).to_csv(lookup_path, index = False)
+
+def make_all(out_path: str, num_transcripts: int, seed: int = 0, **corpus_kwargs):
+    '''
+    A func to write every input under out_path
+
+    Returns
+    -------
+    paths: dict
+        moral_dict_path, processed_all_year_path, panel_data_path and
+        lookup_df_path
+
+    '''
+    os.makedirs(out_path, exist_ok = True)
+    paths = {"moral_dict_path": out_path + '/moral foundations dictionary.txt',
+             "processed_all_year_path": out_path + '/all_year_processed_data',
+             "panel_data_path": out_path + '/panel.csv',
+             "lookup_df_path": out_path + '/lookup.csv'}
+    terms = make_moral_dict(paths["moral_dict_path"], seed = seed)
+    trans_ids = make_corpus(paths["processed_all_year_path"], num_transcripts, terms, seed = seed, **corpus_kwargs)
+    num_entities = max(10, num_transcripts // 5)
+    make_panel(paths["panel_data_path"], trans_ids, num_entities = num_entities, seed = seed)
+    make_lookup(paths["lookup_df_path"], num_entities = num_entities, seed = seed)
+    return paths
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Generate synthetic inputs for the pipeline")
+    parser.add_argument("out_path")
+    parser.add_argument("num_transcripts", type = int)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--rows-per-transcript", type = float, default = 60)
+    parser.add_argument("--words-per-row", type = float, default = 45)
+    parser.add_argument("--qa-share", type = float, default = 0.5)
+    args = parser.parse_args()
+    paths = make_all(args.out_path, args.num_transcripts, args.seed, rows_per_transcript = args.rows_per_transcript,
+                     words_per_row = args.words_per_row, qa_share = args.qa_share)
+    for name, path in paths.items():
+        print(name + ': ' + path)
+    sys.exit(0)
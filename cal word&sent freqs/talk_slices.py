@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Read the talk rows of a transcript once, and define the nine slices
+(ceo/cfo/all x all/exQA/QA) used by cal_wf, cal_sf and cal_wsf. Also holds
+the output columns of the word and sent freqs, so that every engine lays
+them out the same way (see result_schema).
+
+CONTENT
+-------
+- <FUNC> transcript_id_from_path
+- <FUNC> read_talk_rows
+- <FUNC> word_freq_tokens
+- <FUNC> word_freq_columns
+- <FUNC> sent_freq_columns
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import pandas as pd
+
+# (speaker, file of the speaker's talk in a transcript folder)
+SPEAKER_FILES = [("ceo", "ceo_talk.csv"),
+                 ("cfo", "cfo_talk.csv"),
+                 ("others", "others_talk.csv")]
+
+# (speaker slice, speakers added up in the slice)
+SPEAKER_SLICES = {"ceo": ("ceo",),
+                  "cfo": ("cfo",),
+                  "all": ("ceo", "cfo", "others")}
+
+# (section, prefix of the output column, question flags added up in the section)
+SECTION_SLICES = [("all", "", (False, True)),
+                  ("exQA", "exclude_QA_", (False,)),
+                  ("QA", "QA_", (True,))]
+
+# punctuations eliminated before counting words
+WORD_FREQ_SYMBOLS = str.maketrans("", "", ",.!?")
+
+def transcript_id_from_path(trans_path: str):
+    return trans_path.split('-')[-2]
+
+def read_talk_rows(trans_path: str):
+    '''
+    A func to read the talk of ceo, cfo and others in a transcript
+
+    Parameters
+    ----------
+    trans_path: str
+        Path to a transcript folder
+
+    Returns
+    -------
+    talk_rows: list
+        A list of (speaker, is_QA, talk_content), one per non-empty talk row;
+        is_QA is True when the "question" column of the row is filled
+
+    '''
+    talk_rows = []
+    for speaker, file_name in SPEAKER_FILES:
+        talk_df = pd.read_csv(trans_path + '/' + file_name)
+        is_QA = ~pd.isna(talk_df["question"])
+        for talk_content, row_is_QA in zip(talk_df["talk_content"], is_QA):
+            if pd.isna(talk_content):
+                continue
+            talk_rows.append((speaker, bool(row_is_QA), talk_content))
+    return talk_rows
+
+def word_freq_tokens(talk_words: list):
+    '''
+    The words counted by the word freq: punctuations eliminated, lowercased,
+    empty words dropped
+    '''
+    out_words = []
+    for word in talk_words:
+        word = word.translate(WORD_FREQ_SYMBOLS).lower()
+        if len(word) > 0:
+            out_words.append(word)
+    return out_words
+
+def word_freq_columns(sub_dict_name: dict, dict_keys: list):
+    # the word freq columns, e.g. "exclude_QA_HarmVirtue_ceo"
+    return [prefix + sub_dict_name[key] + "_" + speaker_slice
+            for _, prefix, _ in SECTION_SLICES
+            for speaker_slice in ["ceo", "cfo", "all"]
+            for key in dict_keys]
+
+def sent_freq_columns(sub_dict_name: dict, dict_keys: list):
+    # the sent freq columns, e.g. "QA_HarmVirtue_sentence_number_cfo"
+    return ["all_sentence_number", "ceo_sentence_number", "cfo_sentence_number"] + \
+           [prefix + sub_dict_name[key] + '_sentence_number_' + speaker_slice
+            for _, prefix, _ in SECTION_SLICES
+            for speaker_slice in ["all", "ceo", "cfo"]
+            for key in dict_keys]
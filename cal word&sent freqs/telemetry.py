@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Cheap per-stage instrumentation. Every process has one TELEMETRY object
+that adds up timers (seconds and calls per stage, e.g. read_csv, tokenize,
+cut_sentence, match, assemble), counters (e.g. rows, words, sentences) and
+keeps the slowest transcripts. A timer costs two perf_counter calls, so it
+can stay on; set CONFCALL_TELEMETRY=0 to turn it off.
+
+count_transcripts drains the numbers of every worker batch and merges them
+in the parent, together with the per-worker throughput, and can write them
+as JSON or as a Prometheus textfile (a path ending in .prom).
+
+CONTENT
+-------
+- <CLASS> Telemetry
+- <VAR> TELEMETRY
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import json
+import heapq
+import time
+
+class _Timer:
+    __slots__ = ("telemetry", "name", "start")
+
+    def __init__(self, telemetry, name: str):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.telemetry.add_time(self.name, time.perf_counter() - self.start)
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+_NULL_TIMER = _NullTimer()
+
+class Telemetry:
+    '''
+    Parameters
+    ----------
+    enabled: bool
+        If False, timers and counters do nothing
+    keep_slowest: int
+        Number of slowest items (e.g. transcripts) kept
+
+    '''
+    def __init__(self, enabled: bool = True, keep_slowest: int = 20):
+        self.enabled = enabled
+        self.keep_slowest = keep_slowest
+        self.reset()
+
+    def reset(self):
+        self.timers = {}        # stage -> [seconds, calls]
+        self.counters = {}      # name -> value
+        self.slowest = []       # min-heap of (seconds, item)
+        self.workers = []       # one dict per worker process, see set_workers
+
+    def timer(self, name: str):
+        # with TELEMETRY.timer("read_csv"): ...
+        return _Timer(self, name) if self.enabled else _NULL_TIMER
+
+    def add_time(self, name: str, seconds: float, calls: int = 1):
+        if not self.enabled:
+            return
+        total = self.timers.get(name)
+        if total is None:
+            self.timers[name] = [seconds, calls]
+        else:
+            total[0] += seconds
+            total[1] += calls
+
+    def count(self, name: str, value: int = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_item(self, item: str, seconds: float):
+        '''
+        Keep item if it is among the keep_slowest slowest so far
+        '''
+        if not self.enabled:
+            return
+        if len(self.slowest) < self.keep_slowest:
+            heapq.heappush(self.slowest, (seconds, item))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, item))
+
+    def snapshot(self):
+        return {"timers": dict([(name, list(total)) for name, total in self.timers.items()]),
+                "counters": dict(self.counters),
+                "slowest": list(self.slowest)}
+
+    def drain(self):
+        # the numbers so far, then start over; called at the end of a worker batch
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot: dict):
+        for name, (seconds, calls) in snapshot["timers"].items():
+            self.add_time(name, seconds, calls)
+        for name, value in snapshot["counters"].items():
+            self.count(name, value)
+        for seconds, item in snapshot["slowest"]:
+            self.record_item(item, seconds)
+
+    def set_workers(self, report_df):
+        '''
+        Keep the per-worker numbers of scheduler.utilisation_report
+        '''
+        self.workers = []
+        for pid, row in report_df.iterrows():
+            self.workers.append({"pid": int(pid), "batches": int(row["batches"]), "items": int(row["items"]),
+                                 "busy": float(row["busy"]), "utilisation": float(row["utilisation"]),
+                                 "items_per_sec": float(row["items"] / row["busy"]) if row["busy"] > 0 else 0.0})
+
+    def to_dict(self):
+        return {"timers": dict([(name, {"seconds": seconds, "calls": calls})
+                                for name, (seconds, calls) in sorted(self.timers.items(), key = lambda x: -x[1][0])]),
+                "counters": dict(sorted(self.counters.items())),
+                "slowest": [{"item": item, "seconds": seconds} for seconds, item in sorted(self.slowest, reverse = True)],
+                "workers": self.workers}
+
+    def to_prometheus(self, prefix: str = "confcall"):
+        # the Prometheus text exposition format, for a node_exporter textfile collector
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        lines = ["# TYPE %s_stage_seconds_total counter" % prefix]
+        lines += ['%s_stage_seconds_total{stage="%s"} %.6f' % (prefix, label(name), seconds)
+                  for name, (seconds, _) in sorted(self.timers.items())]
+        lines += ["# TYPE %s_stage_calls_total counter" % prefix]
+        lines += ['%s_stage_calls_total{stage="%s"} %d' % (prefix, label(name), calls)
+                  for name, (_, calls) in sorted(self.timers.items())]
+        lines += ["# TYPE %s_events_total counter" % prefix]
+        lines += ['%s_events_total{name="%s"} %d' % (prefix, label(name), value)
+                  for name, value in sorted(self.counters.items())]
+        lines += ["# TYPE %s_slowest_item_seconds gauge" % prefix]
+        lines += ['%s_slowest_item_seconds{item="%s"} %.6f' % (prefix, label(item), seconds)
+                  for seconds, item in sorted(self.slowest, reverse = True)]
+        lines += ["# TYPE %s_worker_items_per_second gauge" % prefix]
+        lines += ['%s_worker_items_per_second{pid="%d"} %.6f' % (prefix, worker["pid"], worker["items_per_sec"])
+                  for worker in self.workers]
+        lines += ["# TYPE %s_worker_utilisation gauge" % prefix]
+        lines += ['%s_worker_utilisation{pid="%d"} %.6f' % (prefix, worker["pid"], worker["utilisation"])
+                  for worker in self.workers]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        '''
+        Write the numbers to path: Prometheus text if path ends in .prom,
+        JSON otherwise. The file is replaced atomically, as textfile
+        collectors may read it at any time.
+        '''
+        if path.endswith('.prom'):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent = 2)
+        with open(path + '.tmp', 'w') as file:
+            file.write(content)
+        os.replace(path + '.tmp', path)
+
+# the telemetry of this process
+TELEMETRY = Telemetry(enabled = os.environ.get("CONFCALL_TELEMETRY", "1") != "0")
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+A pre-tokenized corpus: every talk row is split into words once and stored
+as uint32 word type IDs against a corpus vocabulary, with the sentence
+boundaries of iter_sentence_spans, all in memory-mapped arrays. Scoring with
+a dictionary then resolves every vocabulary type to its sub-dicts once and
+counts with gathers and bincounts over the integer arrays, so re-scoring
+with a revised dictionary does not touch the text again.
+
+The scores have the columns of cal_wsf.WordSentFreq (word freq columns
+followed by sent freq columns) and the same values.
+
+Run as a script:
+    python token_corpus.py build <processed_all_year_path> <token_path> [--packed <packed_path>]
+    python token_corpus.py score <token_path> <moral_dict_path> <out_csv> [--panel <panel_data_path>]
+
+CONTENT
+-------
+- <FUNC> tokenize_corpus
+- <CLASS> TokenCorpus
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from confcall.moral_dict import compile_moral_dict
+from confcall.moral_sent_classifier import iter_sentence_spans, sentence_word
+from confcall.packed_corpus import open_transcript_source
+from confcall.talk_slices import SPEAKER_FILES, word_freq_tokens
+from confcall.result_schema import ResultSchema, GROUPS
+
+SPEAKERS = [speaker for speaker, _ in SPEAKER_FILES]
+
+# name -> dtype of the memory-mapped arrays
+TOKEN_ARRAYS = {"tokens": np.uint32,            # word type ID of every token
+                "row_speaker": np.uint8,        # index in SPEAKERS of every row
+                "row_question": np.bool_,       # question flag of every row
+                "row_token_offset": np.int64,   # first token of every row, plus the end
+                "row_sent_offset": np.int64,    # first sentence of every row, plus the end
+                "sent_token_start": np.int64,   # first token of every sentence
+                "sent_token_end": np.int64}     # last token + 1 of every sentence
+
+def tokenize_corpus(processed_all_year_path: str, token_path: str, trans_ids = None,
+                    catalog_path: str = None, packed_corpus_path: str = None):
+    '''
+    A func to tokenize a corpus once
+
+    Parameters
+    ----------
+    processed_all_year_path: str
+        Folder of the "processed" year folders
+    token_path: str
+        Output folder; created if missing, overwritten if present
+    trans_ids: iterable
+        Only tokenize these transcript IDs; None tokenizes all
+    catalog_path, packed_corpus_path: str
+        Passed to open_transcript_source; the packed corpus is read if given
+
+    Returns
+    -------
+    num_trans: int
+        Number of transcripts tokenized
+
+    '''
+    os.makedirs(token_path, exist_ok = True)
+    catalog, read_talk_rows = open_transcript_source(processed_all_year_path, catalog_path, packed_corpus_path)
+    catalog_df = catalog.select(trans_ids)
+
+    vocab = {}
+    out_files = dict([(name, open(token_path + '/' + name + '.bin', 'wb')) for name in TOKEN_ARRAYS])
+    trans_records = []
+    num_rows, num_tokens, num_sents = 0, 0, 0
+    # read the upcoming transcripts while the current one is tokenized
+    read_talk_rows.schedule(list(catalog_df["path"]))
+    try:
+        np.array([0], dtype = np.int64).tofile(out_files["row_token_offset"])
+        np.array([0], dtype = np.int64).tofile(out_files["row_sent_offset"])
+        for trans_id, trans_path in zip(catalog_df["transcript_ID"], catalog_df["path"]):
+            row_start, sent_start = num_rows, num_sents
+            for speaker, is_QA, talk_content in read_talk_rows(trans_path):
+                talk_words = str(talk_content).split()
+                np.array([vocab.setdefault(word, len(vocab)) for word in talk_words], dtype = np.uint32).tofile(out_files["tokens"])
+
+                # like cal_sf, only text rows are cut into sentences; they cover the row's tokens
+                if isinstance(talk_content, str):
+                    sent_spans = np.array(list(iter_sentence_spans(talk_words, num_tokens)), dtype = np.int64).reshape(-1, 2)
+                else:
+                    sent_spans = np.zeros((0, 2), dtype = np.int64)
+                sent_spans[:, 0].tofile(out_files["sent_token_start"])
+                sent_spans[:, 1].tofile(out_files["sent_token_end"])
+
+                num_rows += 1
+                num_tokens += len(talk_words)
+                num_sents += len(sent_spans)
+                np.array([SPEAKERS.index(speaker)], dtype = np.uint8).tofile(out_files["row_speaker"])
+                np.array([is_QA], dtype = np.bool_).tofile(out_files["row_question"])
+                np.array([num_tokens], dtype = np.int64).tofile(out_files["row_token_offset"])
+                np.array([num_sents], dtype = np.int64).tofile(out_files["row_sent_offset"])
+            trans_records.append((trans_id, trans_path, row_start, num_rows, sent_start, num_sents))
+    finally:
+        read_talk_rows.close()
+        for out_file in out_files.values():
+            out_file.close()
+
+    # one word type per line; words never contain whitespace
+    with open(token_path + '/vocab.txt', 'w', encoding = 'utf-8') as file:
+        file.write('\n'.join(vocab.keys()))
+    trans_df = pd.DataFrame(trans_records, columns = ["transcript_ID", "path", "row_start", "row_end", "sent_start", "sent_end"])
+    trans_df.to_parquet(token_path + '/transcripts.parquet', index = False)
+    with open(token_path + '/meta.json', 'w') as file:
+        json.dump({"num_rows": num_rows, "num_tokens": num_tokens, "num_sents": num_sents,
+                   "num_types": len(vocab), "speakers": SPEAKERS}, file)
+    return len(trans_df)
+
+class TokenCorpus:
+    '''
+    Read a corpus written by tokenize_corpus and score it with dictionaries.
+    The arrays are memory-mapped lazily and never pickled.
+
+    '''
+    def __init__(self, token_path: str):
+        self.token_path = token_path
+        with open(token_path + '/meta.json', 'r') as file:
+            self.meta = json.load(file)
+        self.catalog_df = pd.read_parquet(token_path + '/transcripts.parquet')
+        self._maps = None
+        self._vocab = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_maps'] = None
+        return state
+
+    @property
+    def maps(self):
+        if self._maps is None:
+            lengths = {"tokens": self.meta["num_tokens"],
+                       "row_speaker": self.meta["num_rows"], "row_question": self.meta["num_rows"],
+                       "row_token_offset": self.meta["num_rows"] + 1, "row_sent_offset": self.meta["num_rows"] + 1,
+                       "sent_token_start": self.meta["num_sents"], "sent_token_end": self.meta["num_sents"]}
+            self._maps = {}
+            for name, dtype in TOKEN_ARRAYS.items():
+                if lengths[name] == 0:
+                    self._maps[name] = np.zeros(0, dtype = dtype)
+                else:
+                    self._maps[name] = np.memmap(self.token_path + '/' + name + '.bin', dtype = dtype,
+                                                 mode = 'r', shape = (lengths[name],))
+        return self._maps
+
+    @property
+    def vocab(self):
+        if self._vocab is None:
+            with open(self.token_path + '/vocab.txt', 'r', encoding = 'utf-8') as file:
+                content = file.read()
+            self._vocab = content.split('\n') if len(content) > 0 else []
+        return self._vocab
+
+    def resolve_types(self, matcher):
+        '''
+        A method to resolve every vocabulary type against a dictionary, once
+
+        Returns
+        -------
+        word_weights: np.ndarray
+            (types x sub-dicts) hits of every type in the word freq
+        type_entry: sparse.csr_matrix
+            (types x entries) incidence of every type in the sent freq
+
+        '''
+        category_idx = dict([(key, key_i) for key_i, key in enumerate(matcher.categories)])
+        entry_category = np.array([category_idx[category] for category in matcher.entry_category], dtype = np.int64)
+
+        word_weights = np.zeros((len(self.vocab), len(category_idx)), dtype = np.int64)
+        type_idx, entry_idx = [], []
+        for type_i, word in enumerate(self.vocab):
+            for token in word_freq_tokens([word]):
+                for entry_i in matcher.match_entries(token):
+                    word_weights[type_i, entry_category[entry_i]] += 1
+            for entry_i in matcher.match_entries(sentence_word(word)):
+                type_idx.append(type_i)
+                entry_idx.append(entry_i)
+        type_entry = sparse.csr_matrix((np.ones(len(type_idx), dtype = np.int64), (type_idx, entry_idx)),
+                                       shape = (len(self.vocab), len(entry_category)))
+        return word_weights, type_entry, entry_category
+
+    def _score_rows(self, row_start: int, row_end: int, word_weights, type_entry, entry_category):
+        # per-row word hits, sentence hits and sentence numbers of rows [row_start, row_end)
+        maps = self.maps
+        num_rows = row_end - row_start
+        num_cats = word_weights.shape[1]
+        token_offset = np.asarray(maps["row_token_offset"][row_start: row_end + 1])
+        tokens = np.asarray(maps["tokens"][token_offset[0]: token_offset[-1]]).astype(np.int64)
+        token_row = np.repeat(np.arange(num_rows), np.diff(token_offset))
+
+        # word freq: gather the hits of the tokens that hit anything
+        row_word = np.zeros((num_rows, num_cats), dtype = np.int64)
+        hit = np.nonzero(word_weights.any(axis = 1)[tokens])[0]
+        np.add.at(row_word, token_row[hit], word_weights[tokens[hit]])
+
+        # sent freq: (sentence, type) pairs -> distinct (sentence, entry) pairs -> sub-dict counts
+        sent_offset = np.asarray(maps["row_sent_offset"][row_start: row_end + 1])
+        sent_start = np.asarray(maps["sent_token_start"][sent_offset[0]: sent_offset[-1]])
+        sent_end = np.asarray(maps["sent_token_end"][sent_offset[0]: sent_offset[-1]])
+        sent_row = np.repeat(np.arange(num_rows), np.diff(sent_offset))
+        row_sent = np.zeros((num_rows, num_cats), dtype = np.int64)
+
+        type_hits = np.diff(type_entry.indptr)
+        hit = np.nonzero(type_hits[tokens] > 0)[0]
+        token_pos = token_offset[0] + hit
+        token_sent = np.searchsorted(sent_start, token_pos, side = 'right') - 1
+        in_sent = (token_sent >= 0) & (token_pos < sent_end[np.maximum(token_sent, 0)] if len(sent_end) > 0 else False)
+        token_sent, hit_types = token_sent[in_sent], tokens[hit[in_sent]]
+        if len(token_sent) > 0:
+            pairs = np.unique(token_sent * len(self.vocab) + hit_types)
+            pair_sent, pair_type = pairs // len(self.vocab), pairs % len(self.vocab)
+            # expand every (sentence, type) pair into the entries of the type
+            pair_hits = type_hits[pair_type]
+            pair_first = np.repeat(type_entry.indptr[pair_type] - np.cumsum(pair_hits) + pair_hits, pair_hits)
+            pair_entry = type_entry.indices[pair_first + np.arange(pair_hits.sum())]
+            pair_sent = np.repeat(pair_sent, pair_hits)
+            sent_entry = np.unique(pair_sent * len(entry_category) + pair_entry)
+            np.add.at(row_sent, (sent_row[sent_entry // len(entry_category)], entry_category[sent_entry % len(entry_category)]), 1)
+
+        return row_word, row_sent, np.diff(sent_offset)
+
+    def _score_transcripts(self, chunk_df: pd.DataFrame, schema, word_weights, type_entry, entry_category):
+        # scores of consecutive transcripts, as a block of rows laid out by schema
+        row_start, row_end = int(chunk_df["row_start"].iloc[0]), int(chunk_df["row_end"].iloc[-1])
+        row_word, row_sent, row_sent_num = self._score_rows(row_start, row_end, word_weights, type_entry, entry_category)
+
+        # (transcript, (speaker, is_QA) group) of every row; GROUPS runs over speakers, then question flags
+        row_trans = np.repeat(np.arange(len(chunk_df)), np.asarray(chunk_df["row_end"] - chunk_df["row_start"]))
+        row_group = np.asarray(self.maps["row_speaker"][row_start: row_end]).astype(np.int64) * 2 + \
+                    np.asarray(self.maps["row_question"][row_start: row_end])
+
+        word_group_counts = np.zeros((len(chunk_df), len(GROUPS), word_weights.shape[1]), dtype = np.int64)
+        sent_group_counts = np.zeros((len(chunk_df), len(GROUPS), word_weights.shape[1]), dtype = np.int64)
+        group_sent_num = np.zeros((len(chunk_df), len(GROUPS)), dtype = np.int64)
+        np.add.at(word_group_counts, (row_trans, row_group), row_word)
+        np.add.at(sent_group_counts, (row_trans, row_group), row_sent)
+        np.add.at(group_sent_num, (row_trans, row_group), row_sent_num)
+
+        block = schema.new_block(len(chunk_df))
+        schema.fill_word_freq(block, word_group_counts)
+        schema.fill_sent_freq(block, sent_group_counts, group_sent_num)
+        return block
+
+    def score(self, moral_dict_path: str, trans_ids = None, chunk_rows: int = 1000000):
+        '''
+        A method to score the corpus with a dictionary
+
+        Parameters
+        ----------
+        moral_dict_path: str
+            The dictionary, or a list of them scored in one pass (see
+            moral_dict.load_moral_dict)
+        trans_ids: iterable
+            Only score these transcript IDs; None scores all
+        chunk_rows: int
+            Max number of talk rows scored at once, bounds the memory use
+
+        Returns
+        -------
+        scores_df: pd.DataFrame
+            One row per transcript, indexed by transcript ID, with the columns
+            of cal_wsf.WordSentFreq
+
+        '''
+        sub_dict_name, matcher = compile_moral_dict(moral_dict_path)
+        word_weights, type_entry, entry_category = self.resolve_types(matcher)
+        schema = ResultSchema(sub_dict_name, matcher.categories)
+
+        selected_df = self.catalog_df
+        if trans_ids is not None:
+            selected_df = selected_df[selected_df["transcript_ID"].isin(set(trans_ids))]
+
+        # score runs of transcripts that are consecutive in the arrays, at most chunk_rows rows at a time
+        chunk_dfs = []
+        chunk_first = 0
+        row_starts, row_ends = list(selected_df["row_start"]), list(selected_df["row_end"])
+        for trans_i in range(1, len(selected_df) + 1):
+            if trans_i == len(selected_df) or row_starts[trans_i] != row_ends[trans_i - 1] or \
+                    row_ends[trans_i] - row_starts[chunk_first] > chunk_rows:
+                chunk_df = selected_df.iloc[chunk_first: trans_i]
+                block = self._score_transcripts(chunk_df, schema, word_weights, type_entry, entry_category)
+                chunk_dfs.append(schema.to_frame(block, chunk_df["transcript_ID"].astype(str)))
+                chunk_first = trans_i
+
+        if len(chunk_dfs) == 0:
+            return schema.to_frame(schema.new_block(0), [])
+        scores_df = pd.concat(chunk_dfs, axis = 0)
+        scores_df.index.name = None
+        return scores_df
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Tokenize a corpus once, then score it with dictionaries")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("processed_all_year_path")
+    build_parser.add_argument("token_path")
+    build_parser.add_argument("--packed", default = None)
+    score_parser = subparsers.add_parser("score")
+    score_parser.add_argument("token_path")
+    score_parser.add_argument("moral_dict_path")
+    score_parser.add_argument("out_csv")
+    score_parser.add_argument("--panel", default = None)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        num_trans = tokenize_corpus(args.processed_all_year_path, args.token_path, packed_corpus_path = args.packed)
+        print("tokenized %d transcripts into %s" % (num_trans, args.token_path))
+    else:
+        trans_ids = None
+        if args.panel is not None:
+            trans_ids = set(pd.read_csv(args.panel, usecols = ["transcript_ID"])["transcript_ID"])
+        scores_df = TokenCorpus(args.token_path).score(args.moral_dict_path, trans_ids)
+        scores_df.to_csv(args.out_csv, index_label = "transcript_ID")
+        print("scored %d transcripts into %s" % (len(scores_df), args.out_csv))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+A persisted catalog of the transcript folders under processed_all_year_path:
+transcript_ID -> path, year folder, talk file sizes and mtimes. The catalog
+is written once and then refreshed incrementally: only year folders whose
+mtime changed are scanned again.
+
+CONTENT
+-------
+- <CLASS> TranscriptCatalog
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import numpy as np
+import pandas as pd
+
+TALK_FILES = [("ceo", "ceo_talk.csv"), ("cfo", "cfo_talk.csv"), ("others", "others_talk.csv")]
+
+CATALOG_COLUMNS = ["transcript_ID", "year", "folder", "path", "year_mtime_ns", "folder_mtime_ns",
+                   "ceo_size", "cfo_size", "others_size", "talk_mtime_ns"]
+
+class TranscriptCatalog:
+    '''
+    Parameters
+    ----------
+    processed_all_year_path: str
+        Folder of the "processed" year folders
+    catalog_path: str
+        Where the catalog is persisted (parquet); defaults to
+        processed_all_year_path/transcript_catalog.parquet
+
+    '''
+    def __init__(self,
+                processed_all_year_path: str,
+                catalog_path: str = None):
+
+        self.processed_all_year_path = processed_all_year_path
+        if catalog_path is None:
+            catalog_path = processed_all_year_path + '/transcript_catalog.parquet'
+        self.catalog_path = catalog_path
+        self.catalog_df = pd.DataFrame(columns = CATALOG_COLUMNS)
+
+    def scan_year(self, year: str, year_mtime_ns: int):
+        '''
+        Scan one year folder: one scandir for the year, one per transcript folder
+        '''
+        year_path = self.processed_all_year_path + '/' + year
+        records = []
+        with os.scandir(year_path) as trans_entries:
+            for trans_entry in trans_entries:
+                if not trans_entry.is_dir():
+                    continue
+                try:
+                    trans_id = int(trans_entry.name.split('-')[-2])
+                except (IndexError, ValueError):
+                    continue
+
+                record = {"transcript_ID": trans_id, "year": year, "folder": trans_entry.name,
+                          "path": year_path + '/' + trans_entry.name, "year_mtime_ns": year_mtime_ns,
+                          "folder_mtime_ns": trans_entry.stat().st_mtime_ns,
+                          "ceo_size": 0, "cfo_size": 0, "others_size": 0, "talk_mtime_ns": 0}
+                with os.scandir(trans_entry.path) as file_entries:
+                    file_stats = dict([(file_entry.name, file_entry.stat()) for file_entry in file_entries])
+                for speaker, file_name in TALK_FILES:
+                    if file_name in file_stats:
+                        record[speaker + "_size"] = file_stats[file_name].st_size
+                        record["talk_mtime_ns"] = max(record["talk_mtime_ns"], file_stats[file_name].st_mtime_ns)
+                records.append(record)
+        return records
+
+    def refresh(self, deep: bool = False):
+        '''
+        Load the persisted catalog and scan again the year folders that are
+        new or whose mtime changed; year folders that are gone are dropped.
+        With deep=True every year folder is scanned again, which also picks
+        up files rewritten in place.
+
+        Returns
+        -------
+        self
+
+        '''
+        if os.path.exists(self.catalog_path):
+            self.catalog_df = pd.read_parquet(self.catalog_path)
+        known_mtimes = self.catalog_df.groupby("year")["year_mtime_ns"].first().to_dict()
+
+        year_mtimes = {}
+        with os.scandir(self.processed_all_year_path) as year_entries:
+            for year_entry in year_entries:
+                if year_entry.is_dir() and 'processed' in year_entry.name:
+                    year_mtimes[year_entry.name] = year_entry.stat().st_mtime_ns
+
+        stale_years = [year for year, mtime in year_mtimes.items() if deep or known_mtimes.get(year) != mtime]
+        gone_years = [year for year in known_mtimes if year not in year_mtimes]
+        if len(stale_years) == 0 and len(gone_years) == 0:
+            return self
+
+        records = []
+        for year in stale_years:
+            records += self.scan_year(year, year_mtimes[year])
+        kept_df = self.catalog_df[~self.catalog_df["year"].isin(stale_years + gone_years)]
+        new_df = pd.DataFrame(records, columns = CATALOG_COLUMNS)
+        frames = [df for df in [kept_df, new_df] if len(df) > 0]
+        self.catalog_df = pd.concat(frames, ignore_index = True) if len(frames) > 0 else new_df
+        self.catalog_df = self.catalog_df.astype(dict([(col, np.int64) for col in CATALOG_COLUMNS
+                                                       if col not in ["year", "folder", "path"]]))
+        self.catalog_df = self.catalog_df.sort_values(["year", "folder"], ignore_index = True)
+        self.save()
+        return self
+
+    def save(self):
+        tmp_path = self.catalog_path + '.tmp'
+        self.catalog_df.to_parquet(tmp_path, index = False)
+        os.replace(tmp_path, self.catalog_path)
+
+    def select(self, trans_ids = None):
+        '''
+        A method to filter the catalog against a set of transcript IDs
+
+        Parameters
+        ----------
+        trans_ids: iterable
+            Transcript IDs to keep, e.g. those of the panel; None keeps all
+
+        Returns
+        -------
+        selected_df: pd.DataFrame
+            The matching catalog rows, in (year, folder) order
+
+        '''
+        if trans_ids is None:
+            return self.catalog_df
+        if not isinstance(trans_ids, (set, frozenset)):
+            trans_ids = set(trans_ids)
+        return self.catalog_df[self.catalog_df["transcript_ID"].isin(trans_ids)]
+
+    def paths(self, trans_ids = None):
+        return list(self.select(trans_ids)["path"])
+
+    def sizes(self, trans_ids = None):
+        selected_df = self.select(trans_ids)
+        return list(selected_df["ceo_size"] + selected_df["cfo_size"] + selected_df["others_size"])
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Read the talk rows of a transcript through interchangeable backends. Only
+the talk_content and question columns of the talk files are parsed, as text,
+so no backend infers the dtypes of the other columns:
+- pandas: the C engine of pd.read_csv with usecols and fixed dtypes
+- pyarrow: pyarrow's multithreaded CSV reader
+- csv: the csv module, with the least overhead for tiny files
+- auto: time the backends on a sample of transcripts, use the fastest
+
+Every backend gives the output of talk_slices.read_talk_rows: the cells
+pandas would read as NaN are NaN, and a talk_content column that holds
+numbers only comes back as floats, as if pandas had inferred it.
+
+CONTENT
+-------
+- <CLASS> TranscriptReader
+- <FUNC> benchmark_backends
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import csv
+import time
+import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+from confcall.talk_slices import SPEAKER_FILES
+
+USE_COLUMNS = ["talk_content", "question"]
+
+# the default NA strings of pd.read_csv
+NA_VALUES = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                       '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'])
+
+def _as_number(text: str):
+    # float(text) if pandas would parse text as a number, else None
+    if '_' in text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def _talk_rows(speaker: str, contents: list, questions: list):
+    '''
+    The talk rows of one talk file from its talk_content and question cells,
+    None for NA
+    '''
+    # pandas infers a float column if every non-NA talk_content is a number
+    texts = [content for content in contents if content is not None]
+    numbers = [_as_number(text) for text in texts]
+    if len(texts) > 0 and all(number is not None for number in numbers):
+        numbers = iter(numbers)
+        contents = [None if content is None else next(numbers) for content in contents]
+
+    return [(speaker, question is not None, content) for content, question in zip(contents, questions)
+            if content is not None]
+
+def _read_pandas(file_path: str):
+    talk_df = pd.read_csv(file_path, usecols = USE_COLUMNS, dtype = object, engine = 'c')
+    return ([None if pd.isna(content) else content for content in talk_df["talk_content"]],
+            [None if pd.isna(question) else question for question in talk_df["question"]])
+
+def _read_pyarrow(file_path: str):
+    table = pa_csv.read_csv(file_path,
+                            read_options = pa_csv.ReadOptions(use_threads = True),
+                            convert_options = pa_csv.ConvertOptions(include_columns = USE_COLUMNS,
+                                                                    column_types = dict([(column, pa.string()) for column in USE_COLUMNS]),
+                                                                    null_values = list(NA_VALUES),
+                                                                    strings_can_be_null = True))
+    return table.column("talk_content").to_pylist(), table.column("question").to_pylist()
+
+def _read_csv_module(file_path: str):
+    with open(file_path, 'r', encoding = 'utf-8-sig', newline = '') as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        content_i, question_i = header.index("talk_content"), header.index("question")
+        contents, questions = [], []
+        for row in reader:
+            # pandas skips blank lines
+            if len(row) == 0:
+                continue
+            content = row[content_i] if content_i < len(row) else ''
+            question = row[question_i] if question_i < len(row) else ''
+            contents.append(None if content in NA_VALUES else content)
+            questions.append(None if question in NA_VALUES else question)
+    return contents, questions
+
+BACKENDS = {"pandas": _read_pandas,
+            "pyarrow": _read_pyarrow,
+            "csv": _read_csv_module}
+
+def benchmark_backends(sample_paths: list, backends: list = None, repeat: int = 2):
+    '''
+    A func to time the backends on a sample of transcripts
+
+    Parameters
+    ----------
+    sample_paths: list
+        Transcript folders to read
+    backends: list
+        Backend names; defaults to all of BACKENDS
+    repeat: int
+        The best of repeat runs counts
+
+    Returns
+    -------
+    seconds: dict
+        Backend -> seconds to read the sample; a backend that fails on the
+        sample, or whose rows differ from those of pandas, is left out
+
+    '''
+    if backends is None:
+        backends = list(BACKENDS)
+    reference = [TranscriptReader("pandas")(path) for path in sample_paths]
+    seconds = {}
+    for backend in backends:
+        reader = TranscriptReader(backend)
+        best = None
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                talk_rows = [reader(path) for path in sample_paths]
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+        except (ValueError, csv.Error, pa.ArrowInvalid):
+            # e.g. pyarrow rejects rows with a different number of fields
+            continue
+        if talk_rows == reference:
+            seconds[backend] = best
+    return seconds
+
+class TranscriptReader:
+    '''
+    Parameters
+    ----------
+    backend: str
+        One of BACKENDS, or "auto"
+    sample_paths: list
+        For "auto": the transcripts to time the backends on
+
+    Called as reader(trans_path), like talk_slices.read_talk_rows. A reader
+    only holds the name of its backend, so it is cheap to ship to joblib
+    workers.
+
+    '''
+    def __init__(self, backend: str = "pandas", sample_paths: list = None):
+        if backend == "auto":
+            self.timings = benchmark_backends(list(sample_paths or []))
+            backend = min(self.timings, key = self.timings.get) if self.timings else "pandas"
+        elif backend not in BACKENDS:
+            raise ValueError("unknown reader backend: " + backend)
+        self.backend = backend
+
+    def __call__(self, trans_path: str):
+        read_file = BACKENDS[self.backend]
+        talk_rows = []
+        for speaker, file_name in SPEAKER_FILES:
+            talk_rows += _talk_rows(speaker, *read_file(trans_path + '/' + file_name))
+        return talk_rows
@@ -1,56 +1,45 @@
 import pandas as pd
 import numpy as np
-from tqdm import tqdm
-
-def load_moral_dict(dict_path):
-    with open(dict_path, 'r') as file:
-        moral_dict_ct = file.read()
-    temp_dict = moral_dict_ct.splitlines()
-    
-    for line_i in range(len(temp_dict)):
-        temp_dict[line_i] = temp_dict[line_i].replace('\t', ' ')
-
-    sub_dict_keys = temp_dict[1:12]
-    for line_i in range(len(sub_dict_keys)):
-        sub_dict_keys[line_i] = sub_dict_keys[line_i].split()
-    
-    temp_sub_dicts = temp_dict[14:]
-    sub_dicts = {}
-    sub_dict_name = {}
-    for item in sub_dict_keys:
-        sub_dicts[item[0]] = []
-        sub_dict_name[item[0]] = item[1]
-        
-    for line in temp_sub_dicts:
-        if len(line.replace(' ', '')) == 0:
-            continue
-        temp_item = line.split()
-        if len(temp_item) > 2:
-            for key in temp_item[1:]:
-                sub_dicts[key].append(temp_item[0])
-        else:
-            sub_dicts[temp_item[1]].append(temp_item[0])
-    
-    return sub_dict_name, sub_dicts
+
+# the entity lookup, the panel loader and the telemetry are shared with raw2panel
+from confcall.entity_lookup import EntityLookup, read_lookup
+from confcall.telemetry import TELEMETRY
+from confcall.panel_loader import load_panel
+from confcall.moral_dict import load_moral_dict
+
+# output columns of the talk words, and the panel columns they add up for each role
+TALK_WORDS_COLUMNS = ["talk_words_num", "QA_talk_words_num", "exclude_QA_talk_words_num",
+                      "QA_male_talk_words_num","QA_female_talk_words_num", "QA_both_talk_words_num"]
+
+def role_talk_words_list(position: str):
+    return [position + "_talk_words_num", "QA_" + position + "_talk_words_num", "exclude_QA_" + position + "_talk_words_num",
+            "QA_male_" + position + "_talk_words_num", "QA_female_" + position + "_talk_words_num", "QA_both_" + position + "_talk_words_num"]
+
+# the dtypes the downcast columns are added up in
+SUM_DTYPES = {np.dtype(np.int32): np.int64, np.dtype(np.float32): np.float64}
 
 class panel2cross:
+    '''
+    Parameters
+    ----------
+    compact: bool
+        If True, load the panel with categorical IDs and names and downcast
+        numbers (see panel_loader); only the columns of exe are read either
+        way
+
+    '''
     def __init__(self,
                 panel_df_path: str,
-                lookup_df_path: str):
+                lookup_df_path: str,
+                moral_dict_path: str,
+                compact: bool = True):
         
-        panel_df = pd.read_csv(panel_df_path)
-        panel_df["ceo_name"] = panel_df["ceo_name"].apply(lambda x: x.split(",")[0] if not pd.isna(x) else np.nan)
-        panel_df["cfo_name"] = panel_df["cfo_name"].apply(lambda x: x.split(",")[0] if not pd.isna(x) else np.nan)
-
-        panel_df["ceo_factset_person_id"] = panel_df["ceo_factset_person_id"].apply(
-            lambda x: x.split(",")[0] if not pd.isna(x) else np.nan)
-        panel_df["cfo_factset_person_id"] = panel_df["cfo_factset_person_id"].apply(
-            lambda x: x.split(",")[0] if not pd.isna(x) else np.nan)
-        
-        self.panel_df = panel_df
-        self.lookup_df = pd.read_csv(lookup_df_path)
+        self.panel_df_path = panel_df_path
+        self.compact = compact
+        self._panel_df = None
+        self.lookup_df = read_lookup(lookup_df_path)
+        self.entity_lookup = EntityLookup(self.lookup_df)
 
-        moral_dict_path = "C:/Users/niccolo/Desktop/QLFtask/moral word freq project/dictionary/moral foundations dictionary.txt"
         sub_dict_names, sub_dicts = load_moral_dict(moral_dict_path)
 
         sub_dict_names = list(sub_dict_names.values())
@@ -73,56 +62,103 @@ class panel2cross:
 
         self.indicator_list = indicator_list + full_wf_indicator_list + exQA_wf_indicator_list + QA_wf_indicator_list + full_sf_indicator_list + exQA_sf_indicator_list + QA_sf_indicator_list
 
-        self.ceo_indicator_list = [indicator + '_ceo' for indicator in indicator_list]
-        self.cfo_indicator_list = [indicator + '_cfo' for indicator in indicator_list]
-
-
-    def exe(self):
-        ceo_list = sorted(set(self.panel_df["ceo_factset_person_id"].dropna()))
-        cfo_list = sorted(set(self.panel_df["cfo_factset_person_id"].dropna()))
-
-        manager_df = pd.DataFrame(columns = ["Name", "Role", "person_factset_id", "company_factset_id",
-                                            'Company', 'cusip',
-                                            "talk_words_num", "QA_talk_words_num", "exclude_QA_talk_words_num",
-                                            "QA_male_talk_words_num","QA_female_talk_words_num", "QA_both_talk_words_num",
-                                            'sentence_num'] + self.indicator_list)
-
-        for p_id in tqdm(cfo_list + ceo_list):
-            manager_idx = len(manager_df)
-            if p_id in self.ceo_list:
-                position = "ceo"
-                talk_words_list = ["ceo_talk_words_num", "QA_ceo_talk_words_num", "exclude_QA_ceo_talk_words_num",
-                                "QA_male_ceo_talk_words_num", "QA_female_ceo_talk_words_num", "QA_both_ceo_talk_words_num"]
-                p_indicator_list = self.ceo_indicator_list
-            else:
-                position = "cfo"
-                talk_words_list = ["cfo_talk_words_num", "QA_cfo_talk_words_num", "exclude_QA_cfo_talk_words_num",
-                                "QA_male_cfo_talk_words_num", "QA_female_cfo_talk_words_num", "QA_both_cfo_talk_words_num"]
-                p_indicator_list = self.cfo_indicator_list
-            # id_df
-            id_df = self.panel_df[self.panel_df[position + "_factset_person_id"] == p_id].reset_index(drop=True)
-            # basic info
-            manager_df.loc[manager_idx, ["Role", "person_factset_id"]] = position, p_id
-            manager_df.loc[manager_idx, ["Name", "company_factset_id"]] = np.array(
-                id_df.loc[0, [position + "_name","factset_entity_id"]])
-            
-            entity_id = id_df.loc[0, "factset_entity_id"].split(',')[0]
-            
-            if entity_id not in self.lookup_df['factset_entity_id'].values:
-                manager_df.loc[manager_idx, ['Company','cusip']] = ['', '']
-            else:
-                manager_df.loc[manager_idx, ['Company','cusip']] = np.array(self.lookup_df.loc[
-                    self.lookup_df['factset_entity_id'] == entity_id, ["proper_name", "cusip"]].iloc[0,:]) 
-
-            # talk num
-            manager_df.loc[
-                manager_idx, ["talk_words_num", "QA_talk_words_num", "exclude_QA_talk_words_num",
-                            "QA_male_talk_words_num","QA_female_talk_words_num", "QA_both_talk_words_num"]] = np.array(id_df[talk_words_list].sum())
-            manager_df.loc[
-                manager_idx, ['sentence_num']] = np.array(id_df[position + '_sentence_number']).sum()
-            
-            # indicator
-            manager_df.loc[manager_idx, self.indicator_list] = np.array(id_df[p_indicator_list].sum())
-
-
-    
+        self.ceo_indicator_list = [indicator + '_ceo' for indicator in self.indicator_list]
+        self.cfo_indicator_list = [indicator + '_cfo' for indicator in self.indicator_list]
+
+        # the summed up columns of a manager, and those taken from the manager's first conf call
+        self.sum_columns = TALK_WORDS_COLUMNS + ['sentence_num'] + self.indicator_list
+        self.first_columns = ["Name", "company_factset_id"]
+
+        # the panel columns read
+        self.panel_columns = ["factset_entity_id"]
+        for position, p_indicator_list in [("cfo", self.cfo_indicator_list), ("ceo", self.ceo_indicator_list)]:
+            self.panel_columns += [position + "_factset_person_id", position + "_name"] + role_talk_words_list(position) + \
+                                  [position + "_sentence_number"] + p_indicator_list
+
+    @property
+    def panel_df(self):
+        # the panel, read on first use; exe(chunksize = ...) never reads it whole.
+        # the names and person ids keep the first of their comma-separated lists
+        if self._panel_df is None:
+            with TELEMETRY.timer("load_panel"):
+                self._panel_df = load_panel(self.panel_df_path, self.panel_columns, compact = self.compact)
+        return self._panel_df
+
+    def stack_roles(self, panel_df: pd.DataFrame):
+        '''
+        A method to stack the _ceo and _cfo column families of (a part of) the
+        panel into role-tagged rows, one per (manager, conf call)
+        '''
+        TELEMETRY.count("panel_rows", len(panel_df))
+        with TELEMETRY.timer("stack_roles"):
+            role_dfs = []
+            for position, p_indicator_list in [("cfo", self.cfo_indicator_list), ("ceo", self.ceo_indicator_list)]:
+                role_df = panel_df[panel_df[position + "_factset_person_id"].notna()]
+                role_df = role_df[[position + "_factset_person_id", position + "_name", "factset_entity_id"] +
+                                  role_talk_words_list(position) + [position + "_sentence_number"] + p_indicator_list]
+                role_df = role_df.set_axis(["person_factset_id"] + self.first_columns + self.sum_columns, axis = 1)
+                # add up the downcast columns of the compact panel in int64/float64
+                role_df = role_df.astype(dict([(column, SUM_DTYPES[role_df[column].dtype]) for column in self.sum_columns
+                                               if role_df[column].dtype in SUM_DTYPES]))
+                role_df.insert(0, "Role", position)
+                role_dfs.append(role_df)
+            return pd.concat(role_dfs, axis = 0, ignore_index = True)
+
+    def aggregate(self, long_df: pd.DataFrame):
+        '''
+        A method to add up the rows of every (role, person id) in one hashed
+        groupby, taking the first-row attributes from the same groups.
+        The output has the columns of the input, so partial results of
+        several parts of the panel can be aggregated again, in panel order.
+        '''
+        with TELEMETRY.timer("aggregate"):
+            grouped = long_df.groupby(["Role", "person_factset_id"], sort = False, observed = True)
+            sums_df = grouped[self.sum_columns].sum()
+            # nth keeps the first row even where it is NaN, unlike first()
+            firsts_df = grouped[["Role", "person_factset_id"] + self.first_columns].nth(0).set_index(["Role", "person_factset_id"])
+            return pd.concat([firsts_df, sums_df], axis = 1).reset_index()
+
+    def exe(self, chunksize: int = None):
+        '''
+        A method to compress the panel into one row per manager
+
+        Parameters
+        ----------
+        chunksize: int
+            If given, read the panel in parts of chunksize rows and aggregate
+            them one by one, so the whole panel is never in memory
+
+        Returns
+        -------
+        manager_df: pd.DataFrame
+            CFOs then CEOs, each sorted by person id
+
+        '''
+        if chunksize is None:
+            manager_df = self.aggregate(self.stack_roles(self.panel_df))
+        else:
+            partial_dfs = []
+            chunk_reader = load_panel(self.panel_df_path, self.panel_columns, compact = self.compact, chunksize = chunksize)
+            while True:
+                with TELEMETRY.timer("load_panel"):
+                    chunk_df = next(chunk_reader, None)
+                if chunk_df is None:
+                    break
+                partial_dfs.append(self.aggregate(self.stack_roles(chunk_df)))
+            manager_df = self.aggregate(pd.concat(partial_dfs, axis = 0, ignore_index = True))
+        TELEMETRY.count("managers", len(manager_df))
+
+        # plain text columns; the categoricals of the compact panel differ between roles and chunks
+        for column in ["person_factset_id"] + self.first_columns:
+            if isinstance(manager_df[column].dtype, pd.CategoricalDtype):
+                manager_df[column] = manager_df[column].astype(object)
+
+        manager_df["Role"] = pd.Categorical(manager_df["Role"], categories = ["cfo", "ceo"])
+        manager_df = manager_df.sort_values(["Role", "person_factset_id"], kind = 'stable').reset_index(drop = True)
+        manager_df["Role"] = manager_df["Role"].astype(str)
+
+        # company info of the first conf call: the first of its entity ids found in the lookup table
+        with TELEMETRY.timer("entity_lookup"):
+            manager_df[["Company", "cusip"]] = self.entity_lookup.resolve(manager_df["company_factset_id"])
+
+        return manager_df[["Name", "Role", "person_factset_id", "company_factset_id", 'Company', 'cusip'] + self.sum_columns]
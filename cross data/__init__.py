@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+confcall.cross: compress the panel data into cross-sectional data, one row
+per manager (Panel2Cross).
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
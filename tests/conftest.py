@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The fixtures shared by the tests: a small synthetic corpus, panel, lookup
+table and dictionary (see synthetic_corpus), written once per session, and
+its word and sent freqs counted as the original code did (see reference).
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import pytest
+from confcall.synthetic_corpus import make_all
+from confcall.cal_wsf import WordSentFreq
+from reference import reference_counts
+
+@pytest.fixture(scope = "session")
+def corpus(tmp_path_factory):
+    out_path = str(tmp_path_factory.mktemp("corpus"))
+    paths = make_all(out_path, 36, rows_per_transcript = 16, words_per_row = 30, moral_share = 0.1)
+    paths["tmp_path"] = out_path
+    return paths
+
+@pytest.fixture(scope = "session")
+def reference(corpus):
+    # the counts of the panel transcripts, in catalog order
+    engine_obj = WordSentFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], corpus["moral_dict_path"])
+    return reference_counts(engine_obj.catalog.paths(engine_obj.trans_id_set), corpus["moral_dict_path"])
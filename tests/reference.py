@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Reference results for the tests, computed the way the original code did:
+the word freq matches keyword by keyword on a Counter of the words, the
+sent freq cuts every talk row into sents and checks every dictionary word
+against every sent, and raw2panel and panel2cross walk the panel manager
+by manager. The "all" slices are the sums of ceo, cfo and others (the
+original word freq glued the three texts together without a space,
+merging a word at each seam).
+
+CONTENT
+-------
+- <FUNC> reference_word_count
+- <FUNC> reference_cut_sentence
+- <FUNC> reference_sent_count
+- <FUNC> reference_row
+- <FUNC> reference_counts
+- <FUNC> assert_counts
+- <FUNC> reference_company
+- <FUNC> reference_panel
+- <FUNC> normalised
+- <FUNC> assert_frames
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+from collections import Counter
+import numpy as np
+import pandas as pd
+import pytest
+from confcall.talk_slices import read_talk_rows, transcript_id_from_path
+from confcall.moral_dict import load_moral_dict
+
+SECTIONS = [("all", "", (False, True)), ("exQA", "exclude_QA_", (False,)), ("QA", "QA_", (True,))]
+
+SPEAKER_SLICES = [("ceo", ("ceo",)), ("cfo", ("cfo",)), ("all", ("ceo", "cfo", "others"))]
+
+TALK_WORDS = ["talk_words_num", "QA_talk_words_num", "exclude_QA_talk_words_num",
+              "QA_male_talk_words_num", "QA_female_talk_words_num", "QA_both_talk_words_num"]
+
+def reference_word_count(word_dicts: dict, talk_words: list):
+    talk_words_counter = Counter(talk_words)
+    talk_count_result = {}
+    for word_dict_name, keyword_list in word_dicts.items():
+        dict_count = 0
+        for kw in keyword_list:
+            if "*" not in kw:
+                dict_count += talk_words_counter.get(kw, 0)
+            else:
+                kw = kw.split("*")[0]
+                dict_count += sum(count for word, count in talk_words_counter.items() if word[:len(kw)] == kw)
+        talk_count_result[word_dict_name] = dict_count
+    return talk_count_result
+
+def reference_cut_sentence(talk_content: str):
+    exception_rule = ["Mr", "Mrs", "Miss", "Ms", "Sir", "Madam", "Dr", "Cllr", "Lady", "Lord", "Professor", "Prof",
+                      "Chancellor", "Principal", "President", "Master", "Governer", "Gov", "Attorney", "Atty"]
+    talk_sentences = []
+    talk_words = talk_content.split()
+    last_sentence_idx = 0
+    for w_i in range(len(talk_words)):
+        if w_i == len(talk_words) - 1:
+            talk_sentences.append(talk_words[last_sentence_idx: w_i + 1])
+        elif talk_words[w_i][-1] in [".", "?", "!"] and talk_words[w_i][:-1] not in exception_rule \
+                and talk_words[w_i + 1][0].isupper():
+            talk_sentences.append(talk_words[last_sentence_idx: w_i + 1])
+            last_sentence_idx = w_i + 1
+    return talk_sentences
+
+def reference_sent_count(word_dicts: dict, sentence: list):
+    # the number of dictionary words of each sub-dict found in the sent
+    sentence = [w.lower() if not w.isupper() else w for w in sentence]
+    for symbol in ["!", "?", ".", ",", ";"]:
+        sentence = [w.replace(symbol, "") for w in sentence]
+    moral_word_count = {}
+    for key, words in word_dicts.items():
+        moral_word_count[key] = 0
+        for word in words:
+            stem = word.split("*")[0]
+            if any(sent_word[:len(stem)] == stem if '*' in word else sent_word == word for sent_word in sentence):
+                moral_word_count[key] += 1
+    return moral_word_count
+
+def reference_row(trans_path: str, sub_dict_name: dict, word_dicts: dict):
+    # the word and sent freq columns of a transcript, as a dict
+    words, sents, num_sents = {}, {}, {}
+    for speaker in ["ceo", "cfo", "others"]:
+        for is_QA in [False, True]:
+            words[speaker, is_QA] = dict((key, 0) for key in word_dicts)
+            sents[speaker, is_QA] = dict((key, 0) for key in word_dicts)
+            num_sents[speaker, is_QA] = 0
+    for speaker, is_QA, talk_content in read_talk_rows(trans_path):
+        talk_content = str(talk_content)
+        tokens = [w for w in talk_content.replace(",", "").replace(".", "").replace("!", "").replace("?", "").lower().split()]
+        for key, value in reference_word_count(word_dicts, tokens).items():
+            words[speaker, is_QA][key] += value
+        for sentence in reference_cut_sentence(talk_content):
+            num_sents[speaker, is_QA] += 1
+            for key, value in reference_sent_count(word_dicts, sentence).items():
+                sents[speaker, is_QA][key] += value
+
+    row = {}
+    for speaker_slice, speakers in SPEAKER_SLICES:
+        row[speaker_slice + "_sentence_number"] = sum(num_sents[speaker, is_QA] for speaker in speakers for is_QA in [False, True])
+        for _, prefix, flags in SECTIONS:
+            for key in word_dicts:
+                name = sub_dict_name[key]
+                row[prefix + name + "_" + speaker_slice] = sum(words[speaker, is_QA][key] for speaker in speakers for is_QA in flags)
+                row[prefix + name + "_sentence_number_" + speaker_slice] = sum(sents[speaker, is_QA][key]
+                                                                             for speaker in speakers for is_QA in flags)
+    return row
+
+def reference_counts(trans_paths: list, moral_dict_path: str):
+    # one row per transcript, indexed by transcript_ID, with every wf and sf column
+    sub_dict_name, word_dicts = load_moral_dict(moral_dict_path)
+    return pd.DataFrame([reference_row(trans_path, sub_dict_name, word_dicts) for trans_path in trans_paths],
+                        index = [transcript_id_from_path(trans_path) for trans_path in trans_paths])
+
+def assert_counts(counts_df: pd.DataFrame, reference_df: pd.DataFrame):
+    assert len(counts_df) == len(reference_df)
+    if "transcript_ID" in counts_df.columns:
+        # the rows of threading() lead with their transcript_ID
+        assert [str(x) for x in counts_df["transcript_ID"]] == [str(x) for x in reference_df.index]
+        counts_df = counts_df.drop(columns = "transcript_ID")
+    assert set(counts_df.columns) <= set(reference_df.columns)
+    np.testing.assert_array_equal(counts_df.to_numpy(dtype = np.float64),
+                                  reference_df[list(counts_df.columns)].to_numpy(dtype = np.float64))
+
+def reference_company(entity_ids: str, lookup_df: pd.DataFrame):
+    # the first of the entity ids found in the lookup table
+    for sub_id in str(entity_ids).split(','):
+        found_df = lookup_df[lookup_df['factset_entity_id'] == sub_id]
+        if len(found_df) > 0:
+            return found_df["proper_name"].iloc[0], found_df["cusip"].iloc[0]
+    return '', ''
+
+def reference_panel(panel_data_path: str):
+    panel_df = pd.read_csv(panel_data_path)
+    for column in ["ceo_name", "cfo_name", "ceo_factset_person_id", "cfo_factset_person_id"]:
+        panel_df[column] = panel_df[column].apply(lambda x: x.split(",")[0] if not pd.isna(x) else np.nan)
+    return panel_df
+
+def normalised(column: pd.Series):
+    # compare numbers as floats, whatever their dtype, and missing values as None
+    def normalise(value):
+        if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NA:
+            return None
+        if isinstance(value, (int, float, np.number)) or str(value).isdigit():
+            return float(value)
+        return str(value)
+    return [normalise(value) for value in column.astype(object)]
+
+def assert_frames(out_df: pd.DataFrame, reference_df: pd.DataFrame):
+    assert list(out_df.columns) == list(reference_df.columns)
+    assert len(out_df) == len(reference_df)
+    for column in reference_df.columns:
+        out_values, reference_values = normalised(out_df[column]), normalised(reference_df[column])
+        for out_value, reference_value in zip(out_values, reference_values):
+            if isinstance(reference_value, float) and isinstance(out_value, float):
+                assert out_value == pytest.approx(reference_value, rel = 1e-6), column
+            else:
+                assert out_value == reference_value, column
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The fused wsf engine: the wf and sf columns of the original code (see
+reference) from one read of every transcript.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import pandas as pd
+from confcall.cal_wf import WordFreq
+from confcall.cal_sf import SentFreq
+from confcall.cal_wsf import WordSentFreq
+from reference import assert_counts
+
+def test_wsf_match_reference(corpus, reference):
+    engine_obj = WordSentFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], corpus["moral_dict_path"])
+    single_df = pd.concat([engine_obj.count_single_transcript(trans_path)
+                           for trans_path in engine_obj.catalog.paths(engine_obj.trans_id_set)], axis = 0)
+    assert list(single_df.index) == list(reference.index)
+    assert_counts(single_df, reference)
+    assert_counts(engine_obj.threading(2, batch_size = 5), reference)
+
+def test_wsf_columns(corpus):
+    args = (corpus["panel_data_path"], corpus["processed_all_year_path"], corpus["moral_dict_path"])
+    wsf_columns = WordSentFreq(*args).result_columns()
+    assert sorted(wsf_columns) == sorted(WordFreq(*args, None).result_columns() + SentFreq(*args).result_columns())
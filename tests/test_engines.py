@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The wf and sf engines against the original code (see reference): every
+transcript alone through count_single_transcript, and all of them through
+threading().
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import pandas as pd
+import pytest
+from confcall.cal_wf import WordFreq
+from confcall.cal_sf import SentFreq
+from reference import assert_counts
+
+@pytest.mark.parametrize("engine", ["wf", "sf"])
+def test_engines_match_reference(corpus, reference, engine):
+    if engine == "wf":
+        engine_obj = WordFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], corpus["moral_dict_path"], None)
+    else:
+        engine_obj = SentFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], corpus["moral_dict_path"])
+    single_df = pd.concat([engine_obj.count_single_transcript(trans_path)
+                           for trans_path in engine_obj.catalog.paths(engine_obj.trans_id_set)], axis = 0)
+    assert list(single_df.index) == list(reference.index)
+    assert_counts(single_df, reference)
+    assert_counts(engine_obj.threading(2, batch_size = 5), reference)
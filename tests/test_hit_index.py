@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The hit index of a WordFreq run: its postings add up to the word freqs,
+the transcript_ID gaps are stored narrower than the IDs, and hits are
+only taken inside threading(), where every batch writes them out.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import numpy as np
+import pytest
+from confcall.cal_wf import WordFreq
+from confcall.hit_index import HitIndex, HitRecorder
+from reference import assert_counts
+
+@pytest.fixture(scope = "module")
+def hit_index_path(corpus, reference):
+    index_path = corpus["tmp_path"] + "/hits"
+    engine_obj = WordFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], corpus["moral_dict_path"], None,
+                          hit_index_path = index_path)
+    assert_counts(engine_obj.threading(2, batch_size = 5), reference)
+    return index_path
+
+def test_recount(hit_index_path, reference):
+    hit_index = HitIndex(hit_index_path)
+    trans_ids = [int(trans_id) for trans_id in reference.index]
+    assert_counts(hit_index.recount(trans_ids), reference)
+    harm_df = hit_index.recount(trans_ids[3:20:4], category = "HarmVirtue")
+    assert list(harm_df.index) == trans_ids[3:20:4]
+    assert all("HarmVirtue" in column for column in harm_df.columns)
+    assert_counts(harm_df, reference.iloc[3:20:4])
+
+def test_postings_decode(hit_index_path):
+    hit_index = HitIndex(hit_index_path)
+    postings_df = hit_index.postings()
+    assert len(postings_df) == hit_index.meta["num_hits"]
+    # the decoded IDs are indexed transcripts, ascending within every term of a category
+    assert set(postings_df["transcript_ID"]) <= set(hit_index.maps["transcripts"].tolist())
+    for _, term_df in postings_df.groupby(["category", "term"], sort = False):
+        assert (np.diff(term_df["transcript_ID"].to_numpy()) >= 0).all()
+
+def test_gaps_narrower_than_ids(hit_index_path):
+    hit_index = HitIndex(hit_index_path)
+    dtypes = dict((name, np.dtype(dtype)) for name, dtype in hit_index.meta["dtypes"].items())
+    num_hits = hit_index.meta["num_hits"]
+    assert num_hits > 0
+    # the synthetic transcript_IDs need 4 bytes, the gaps between the calls of a term one
+    assert dtypes["doc_gap"].itemsize < dtypes["transcripts"].itemsize
+    assert os.path.getsize(hit_index_path + '/doc_gap.bin') == num_hits * dtypes["doc_gap"].itemsize
+    assert os.path.getsize(hit_index_path + '/doc_gap.bin') < num_hits * dtypes["transcripts"].itemsize
+
+def test_hits_outside_threading(corpus, tmp_path):
+    engine_obj = WordFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], corpus["moral_dict_path"], None,
+                          hit_index_path = str(tmp_path / "hits"))
+    trans_path = engine_obj.catalog.paths(engine_obj.trans_id_set)[0]
+    with pytest.raises(ValueError):
+        engine_obj.count_single_transcript(trans_path)
+
+    # a batch part holds every hit added between open and close, and nothing stays buffered
+    recorder = HitRecorder(str(tmp_path / "parts"))
+    recorder.clear()
+    recorder.open("part-00000", [1, 2])
+    recorder.add(1, 0, 0, [0, 3], [5, 7])
+    recorder.close()
+    with np.load(str(tmp_path / "parts" / "part-00000.npz")) as part:
+        assert part["hits"].tolist() == [[1, 0, 0, 0, 5], [1, 0, 0, 3, 7]]
+        assert part["transcript_ids"].tolist() == [1, 2]
+    with pytest.raises(ValueError):
+        recorder.add(2, 0, 0, [1], [5])
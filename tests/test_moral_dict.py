@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+raw2panel and panel2cross read the dictionary with the parser of the
+engines, so their indicator columns follow the engines' columns for any
+layout of the dictionary file.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+from confcall.synthetic_corpus import SUB_DICT_NAMES
+from confcall.moral_dict import load_moral_dict
+from confcall.cal_wsf import WordSentFreq
+from confcall.raw2panel import Raw2Panel
+from confcall.cross.Panel2Cross import panel2cross
+
+def write_small_dict(dict_path: str):
+    # five categories, and the words right after the closing "%" (no blank line)
+    with open(dict_path, 'w') as file:
+        file.write('%\n')
+        for key_i, name in enumerate(SUB_DICT_NAMES[:5]):
+            file.write('%02d\t%s\n' % (key_i + 1, name))
+        file.write('%\n')
+        file.write('harm*\t01\t02\nfair\t03\ngroup*\t05\ncare\t01\t04\n')
+
+def test_load_moral_dict_layout(tmp_path):
+    dict_path = str(tmp_path / "small.dic")
+    write_small_dict(dict_path)
+    sub_dict_name, sub_dicts = load_moral_dict(dict_path)
+    assert list(sub_dict_name.values()) == SUB_DICT_NAMES[:5]
+    assert sub_dicts["01"] == ["harm*", "care"]
+    assert sub_dicts["02"] == ["harm*"]
+
+def test_stages_follow_engine_columns(corpus, tmp_path):
+    dict_path = str(tmp_path / "small.dic")
+    write_small_dict(dict_path)
+    engine_columns = WordSentFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], dict_path).result_columns()
+    for role in ["ceo", "cfo"]:
+        role_columns = set(column for column in engine_columns
+                           if column.endswith('_' + role) and column != role + "_sentence_number")
+        for stage_obj in [Raw2Panel(corpus["panel_data_path"], corpus["lookup_df_path"], dict_path),
+                          panel2cross(corpus["panel_data_path"], corpus["lookup_df_path"], dict_path)]:
+            stage_columns = getattr(stage_obj, role + "_indicator_list")
+            dict_columns = set(column for column in stage_columns if any(name in column for name in SUB_DICT_NAMES))
+            assert dict_columns == role_columns
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The span-based segmenter against the sentence rule of the original code
+(see reference): cut_sentence, cut_sentence_words and iter_sentence_spans
+on the talk rows of the synthetic corpus and on edge cases.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import glob
+import pandas as pd
+from confcall.moral_sent_classifier import cut_sentence, cut_sentence_words, iter_sentence_spans
+from reference import reference_cut_sentence
+
+EDGE_CASES = ["",
+              "Done.",
+              "One sentence. Another one? Yes! fine",
+              "ends with a period. lowercase next",
+              "Mr. Smith met Dr. Jones and Prof. Brown. Then Gov. Lee left.",
+              "Atty. Ms. Sir. Then it ends.",
+              "Q4 was strong... Very strong!! Thanks.",
+              "numbers 1.5 and 2. 3 apples. Okay",
+              "A. B. C.",
+              "  spaced   out.   Words   here  "]
+
+def _talk_contents(processed_all_year_path: str):
+    talk_contents = []
+    for file_path in sorted(glob.glob(processed_all_year_path + '/**/*_talk.csv', recursive = True)):
+        talk_contents += [str(talk_content) for talk_content in pd.read_csv(file_path)["talk_content"].dropna()]
+    return talk_contents
+
+def test_segmenter_matches_reference(corpus):
+    talk_contents = _talk_contents(corpus["processed_all_year_path"])
+    assert len(talk_contents) > 0
+    for talk_content in talk_contents + EDGE_CASES:
+        reference_sentences = reference_cut_sentence(talk_content)
+        talk_words = talk_content.split()
+        assert cut_sentence(talk_content) == [" ".join(sentence) for sentence in reference_sentences]
+        assert cut_sentence_words(talk_words) == reference_sentences
+        # the spans tile the words in order, shifted by start
+        spans = list(iter_sentence_spans(talk_words, start = 5))
+        assert [talk_words[first - 5: last - 5] for first, last in spans] == reference_sentences
+        assert all(spans[span_i][1] == spans[span_i + 1][0] for span_i in range(len(spans) - 1))
+
+def test_title_exceptions():
+    assert cut_sentence("Mr. Smith spoke. Then Mrs. Smith spoke.") == ["Mr. Smith spoke.", "Then Mrs. Smith spoke."]
+    assert cut_sentence("President. Obama") == ["President. Obama"]
+    assert cut_sentence("Presidents. Obama") == ["Presidents.", "Obama"]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The packed corpus: wsf counts read from the packed files equal those of
+the original code (see reference).
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+from confcall.cal_wsf import WordSentFreq
+from confcall.packed_corpus import pack_corpus
+from reference import assert_counts
+
+def test_packed_corpus(corpus, reference):
+    packed_path = corpus["tmp_path"] + "/packed"
+    pack_corpus(corpus["processed_all_year_path"], packed_path)
+    packed_df = WordSentFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], corpus["moral_dict_path"],
+                             packed_corpus_path = packed_path).threading(2, batch_size = 5)
+    assert_counts(packed_df, reference)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The groupby aggregation of panel2cross against the manager-by-manager sums
+of the original code, plain, compact and read in chunks.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import pandas as pd
+from confcall.entity_lookup import read_lookup
+from confcall.cross.Panel2Cross import panel2cross
+from reference import reference_company, reference_panel, assert_frames, TALK_WORDS
+
+def test_panel2cross_exe(corpus):
+    plain_obj = panel2cross(corpus["panel_data_path"], corpus["lookup_df_path"], corpus["moral_dict_path"], compact = False)
+    panel_df = reference_panel(corpus["panel_data_path"])
+    lookup_df = read_lookup(corpus["lookup_df_path"])
+
+    # manager by manager, CFOs then CEOs, the sums over the manager's conf calls
+    rows = []
+    for position, p_indicator_list in [("cfo", plain_obj.cfo_indicator_list), ("ceo", plain_obj.ceo_indicator_list)]:
+        talk_words_list = [position + "_talk_words_num", "QA_" + position + "_talk_words_num",
+                           "exclude_QA_" + position + "_talk_words_num", "QA_male_" + position + "_talk_words_num",
+                           "QA_female_" + position + "_talk_words_num", "QA_both_" + position + "_talk_words_num"]
+        for p_id in sorted(set(panel_df[position + "_factset_person_id"].dropna())):
+            id_df = panel_df[panel_df[position + "_factset_person_id"] == p_id].reset_index(drop = True)
+            company, cusip = reference_company(id_df.loc[0, "factset_entity_id"], lookup_df)
+            row = {"Name": id_df.loc[0, position + "_name"], "Role": position, "person_factset_id": p_id,
+                   "company_factset_id": id_df.loc[0, "factset_entity_id"], "Company": company, "cusip": cusip,
+                   "sentence_num": id_df[position + '_sentence_number'].sum()}
+            row.update(zip(TALK_WORDS, id_df[talk_words_list].sum()))
+            row.update(zip(plain_obj.indicator_list, id_df[p_indicator_list].sum()))
+            rows.append(row)
+    reference_df = pd.DataFrame(rows)[["Name", "Role", "person_factset_id", "company_factset_id", 'Company', 'cusip'] +
+                                      plain_obj.sum_columns]
+
+    assert_frames(plain_obj.exe(), reference_df)
+    compact_obj = panel2cross(corpus["panel_data_path"], corpus["lookup_df_path"], corpus["moral_dict_path"])
+    assert_frames(compact_obj.exe(), reference_df)
+    assert_frames(compact_obj.exe(chunksize = 7), reference_df)
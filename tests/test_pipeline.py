@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The stage DAG: a second run with the same inputs skips every stage, and
+editing the dictionary or the panel runs the stages that read it again.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import shutil
+import pandas as pd
+from confcall.pipeline import Pipeline, default_stages
+
+STAGES = ["wf", "sf", "merge_panel", "raw2panel", "panel2cross"]
+
+def test_rerun_only_when_inputs_change(corpus, tmp_path):
+    # the panel and the dictionary are copied, as the test edits them
+    panel_data_path = str(tmp_path / "panel.csv")
+    moral_dict_path = str(tmp_path / "dict.txt")
+    shutil.copy(corpus["panel_data_path"], panel_data_path)
+    shutil.copy(corpus["moral_dict_path"], moral_dict_path)
+    work_path = str(tmp_path / "work")
+    pipeline = Pipeline(default_stages(panel_data_path, corpus["processed_all_year_path"], moral_dict_path,
+                                       corpus["lookup_df_path"], work_path, num_job = 1),
+                        str(tmp_path / "pipeline_state.json"))
+
+    assert pipeline.run(verbose = False) == dict((name, "ran") for name in STAGES)
+    assert pipeline.status() == dict((name, "fresh") for name in STAGES)
+    assert pipeline.run(verbose = False) == dict((name, "skipped") for name in STAGES)
+
+    # every count stage and both panel stages read the dictionary
+    with open(moral_dict_path, 'a') as file:
+        file.write('zzzqx\t01\n')
+    assert pipeline.status()["wf"] == "stale"
+    results = pipeline.run(verbose = False)
+    assert [results[name] for name in ["wf", "sf", "raw2panel", "panel2cross"]] == ["ran"] * 4
+    assert pipeline.run(verbose = False) == dict((name, "skipped") for name in STAGES)
+
+    # every stage reads the panel, directly or through the merged panel
+    panel_df = pd.read_csv(panel_data_path)
+    panel_df.loc[0, "conf_type_detail"] = "edited"
+    panel_df.to_csv(panel_data_path, index = False)
+    assert pipeline.run(verbose = False) == dict((name, "ran") for name in STAGES)
+    assert pd.read_parquet(work_path + '/panel.parquet')["conf_type_detail"].eq("edited").any()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+PrefetchReader on a slow reader: the rows come back in the order asked
+for, at most prefetch_depth reads are held ahead, and a failed read raises
+in the caller when its path is taken.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import time
+import threading
+import pytest
+from confcall.prefetch import PrefetchReader
+
+class SlowReader:
+    # the earlier paths take longer, so the reads finish out of order
+    def __init__(self, num_paths: int, fail_path: str = None):
+        self.num_paths = num_paths
+        self.fail_path = fail_path
+        self.lock = threading.Lock()
+        self.started = 0
+        self.taken = 0
+        self.max_ahead = 0
+
+    def __call__(self, trans_path: str):
+        with self.lock:
+            self.started += 1
+            self.max_ahead = max(self.max_ahead, self.started - self.taken)
+        time.sleep(0.002 * (self.num_paths - int(trans_path)))
+        if trans_path == self.fail_path:
+            raise OSError("cannot read " + trans_path)
+        return [("ceo", False, "rows of " + trans_path)]
+
+@pytest.mark.parametrize("prefetch_depth", [0, 1, 3])
+def test_order_and_depth(prefetch_depth):
+    path_list = [str(path_i) for path_i in range(12)]
+    read_func = SlowReader(len(path_list))
+    reader = PrefetchReader(read_func, prefetch_depth = prefetch_depth, io_threads = 2)
+    reader.schedule(path_list)
+    rows = []
+    for trans_path in path_list:
+        with read_func.lock:
+            read_func.taken += 1
+        rows.append(reader(trans_path)[0][2])
+    reader.close()
+    assert rows == ["rows of " + trans_path for trans_path in path_list]
+    assert read_func.started == len(path_list)
+    assert read_func.max_ahead <= max(prefetch_depth, 1)
+
+def test_skipped_paths_are_dropped():
+    path_list = [str(path_i) for path_i in range(8)]
+    read_func = SlowReader(len(path_list))
+    reader = PrefetchReader(read_func, prefetch_depth = 2)
+    reader.schedule(path_list)
+    # 0, 2 and 3 are never asked for, e.g. cache hits
+    assert [reader(trans_path)[0][2] for trans_path in ["1", "4", "5", "6", "7"]] == \
+           ["rows of " + trans_path for trans_path in ["1", "4", "5", "6", "7"]]
+    assert len(reader._pending) == 0 and len(reader._upcoming) == 0
+    reader.close()
+
+def test_failed_read_raises_in_caller():
+    path_list = [str(path_i) for path_i in range(6)]
+    reader = PrefetchReader(SlowReader(len(path_list), fail_path = "3"), prefetch_depth = 3)
+    reader.schedule(path_list)
+    assert [reader(trans_path)[0][2] for trans_path in path_list[:3]] == ["rows of 0", "rows of 1", "rows of 2"]
+    with pytest.raises(OSError, match = "cannot read 3"):
+        reader("3")
+    # the reader goes on with the next paths
+    assert reader("4")[0][2] == "rows of 4"
+    reader.close()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The vectorized reshape of Raw2Panel against the manager-by-manager loop of
+the original code, with and without the compact panel.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import numpy as np
+import pandas as pd
+from confcall.entity_lookup import read_lookup
+from confcall.raw2panel import Raw2Panel
+from reference import reference_company, reference_panel, assert_frames, TALK_WORDS
+
+def test_raw2panel_reshape(corpus):
+    compact_obj = Raw2Panel(corpus["panel_data_path"], corpus["lookup_df_path"], corpus["moral_dict_path"])
+    plain_obj = Raw2Panel(corpus["panel_data_path"], corpus["lookup_df_path"], corpus["moral_dict_path"], compact = False)
+    panel_df = reference_panel(corpus["panel_data_path"])
+    lookup_df = read_lookup(corpus["lookup_df_path"])
+    conf_call_info = ['transcript_ID', 'conf_date', 'conf_date_quarter', 'fiscal_date', 'conf_type', 'conf_type_detail']
+
+    # manager by manager, CEOs then CFOs, each conf call of the manager in panel order
+    rows = []
+    for position, p_indicator_list in [("ceo", plain_obj.ceo_indicator_list), ("cfo", plain_obj.cfo_indicator_list)]:
+        talk_words_list = [position + "_talk_words_num", "QA_" + position + "_talk_words_num",
+                           "exclude_QA_" + position + "_talk_words_num", "QA_male_" + position + "_talk_words_num",
+                           "QA_female_" + position + "_talk_words_num", "QA_both_" + position + "_talk_words_num",
+                           'total_sentence_number', 'RD_sentence_number']
+        for p_id in sorted(set(panel_df[position + "_factset_person_id"].dropna())):
+            id_df = panel_df[panel_df[position + "_factset_person_id"] == p_id].reset_index(drop = True)
+            company, cusip = reference_company(id_df.loc[0, "factset_entity_id"], lookup_df)
+            for sub_idx in id_df.index:
+                row = {"Name": id_df.loc[0, position + '_name'], "Role": position, "person_factset_id": p_id,
+                       "Company": company, "company_factset_id": id_df.loc[0, "factset_entity_id"], "cusip": cusip,
+                       "gvkey": np.nan}
+                row.update(zip(conf_call_info, id_df.loc[sub_idx, conf_call_info]))
+                row.update(zip(TALK_WORDS + ['sents_num', 'RD_sents_num'], id_df.loc[sub_idx, talk_words_list]))
+                row.update(zip(plain_obj.indicator_list, id_df.loc[sub_idx, p_indicator_list]))
+                rows.append(row)
+    reference_df = pd.DataFrame(rows)[plain_obj.result_columns()]
+
+    assert_frames(plain_obj.reshape(), reference_df)
+    assert_frames(compact_obj.reshape(), reference_df)
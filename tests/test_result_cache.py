@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The per-transcript result cache: a re-run hits, a changed dictionary,
+salt or transcript misses, and the size bound and prune drop the least
+recently used entries.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import shutil
+import time
+import pandas as pd
+from confcall.cal_wf import WordFreq
+from confcall.result_cache import ResultCache
+from reference import assert_counts
+
+def _count_all(engine_obj):
+    return pd.concat([engine_obj.count_single_transcript(trans_path)
+                      for trans_path in engine_obj.catalog.paths(engine_obj.trans_id_set)], axis = 0)
+
+def test_engine_hits_and_invalidation(corpus, reference, tmp_path):
+    dict_path = str(tmp_path / "dict.txt")
+    shutil.copy(corpus["moral_dict_path"], dict_path)
+    cache_path = str(tmp_path / "cache.sqlite")
+    num_transcripts = len(reference)
+
+    # a cold run misses every transcript, a warm one hits every transcript, same counts
+    engine_obj = WordFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], dict_path, None, cache_path = cache_path)
+    assert_counts(_count_all(engine_obj), reference)
+    assert (engine_obj.result_cache.hits, engine_obj.result_cache.misses) == (0, num_transcripts)
+    engine_obj = WordFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], dict_path, None, cache_path = cache_path)
+    assert_counts(_count_all(engine_obj), reference)
+    assert (engine_obj.result_cache.hits, engine_obj.result_cache.misses) == (num_transcripts, 0)
+
+    # a changed dictionary changes the salt, so every transcript misses
+    with open(dict_path, 'a') as file:
+        file.write('zzzqx\t01\n')
+    engine_obj = WordFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], dict_path, None, cache_path = cache_path)
+    _count_all(engine_obj)
+    assert (engine_obj.result_cache.hits, engine_obj.result_cache.misses) == (0, num_transcripts)
+
+def _first_transcript(corpus):
+    for root, _, file_names in sorted(os.walk(corpus["processed_all_year_path"])):
+        if "ceo_talk.csv" in file_names:
+            return root
+    raise AssertionError("no transcript in the corpus")
+
+def test_salt_and_transcript_invalidation(corpus, tmp_path):
+    trans_dir = tmp_path / "trans"
+    shutil.copytree(_first_transcript(corpus), str(trans_dir))
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    calls = []
+    def compute(trans_path):
+        calls.append(trans_path)
+        return len(calls)
+
+    assert cache.fetch(str(trans_dir), "salt-a", "WordFreq", "1", compute) == 1
+    assert cache.fetch(str(trans_dir), "salt-a", "WordFreq", "1", compute) == 1
+    assert cache.fetch(str(trans_dir), "salt-b", "WordFreq", "1", compute) == 2
+    # a touched talk file makes a new key
+    talk_path = str(trans_dir / "ceo_talk.csv")
+    stat = os.stat(talk_path)
+    os.utime(talk_path, ns = (stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.fetch(str(trans_dir), "salt-a", "WordFreq", "1", compute) == 3
+    assert (cache.hits, cache.misses) == (1, 3)
+
+def test_lru_eviction_and_prune(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), max_bytes = 10 ** 9, evict_every = 1000)
+    payload = b'x' * 1000
+    for key in ["a", "b", "c", "d"]:
+        cache.put(key, "WordFreq" if key != "d" else "SentFreq", key, payload)
+        time.sleep(0.01)
+    # touch a, so b is now the least recently used
+    assert cache.get("a") == payload
+    size = cache.conn.execute("SELECT size FROM results WHERE key = 'a'").fetchone()[0]
+
+    assert cache.evict(max_bytes = 3 * size) == 1
+    assert cache.get("b") is None
+    assert all(cache.get(key) == payload for key in ["a", "c", "d"])
+
+    # the size cap is also checked every evict_every puts
+    small_cache = ResultCache(str(tmp_path / "small.sqlite"), max_bytes = 2 * size, evict_every = 1)
+    for key in ["a", "b", "c"]:
+        small_cache.put(key, "WordFreq", key, payload)
+        time.sleep(0.01)
+    assert small_cache.get("a") is None and small_cache.get("c") == payload
+
+    # prune by engine, then by age
+    assert cache.prune(engine = "SentFreq") == 1
+    cache.conn.execute("UPDATE results SET last_access = ? WHERE key = 'c'", (time.time() - 40 * 86400,))
+    cache.conn.commit()
+    assert cache.prune(older_than_days = 30) == 1
+    assert cache.stats()["WordFreq"]["entries"] == 1
+    assert cache.get("a") == payload
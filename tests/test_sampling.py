@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Stratified sampling: a seed gives the same sample, every stratum keeps its
+share, and sampling every transcript estimates the totals exactly.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import numpy as np
+import pandas as pd
+from confcall.cal_wsf import WordSentFreq
+from confcall.sampling import stratified_sample, run_sample
+
+def _population():
+    # strata of 200, 60, 9 and 1 units, one with a missing conf type
+    year = [2018] * 200 + [2019] * 60 + [2019] * 9 + [2020]
+    conf_type = ["E"] * 200 + ["E"] * 60 + [np.nan] * 9 + ["S"]
+    return pd.DataFrame({"unit": range(len(year)), "year": year, "conf_type": conf_type})
+
+def test_seed_gives_same_sample():
+    population_df = _population()
+    sample_df = stratified_sample(population_df, 0.1, seed = 7)
+    pd.testing.assert_frame_equal(stratified_sample(population_df, 0.1, seed = 7), sample_df)
+    assert not stratified_sample(population_df, 0.1, seed = 8)["sampled"].equals(sample_df["sampled"])
+    # the input is left as it is
+    assert "sampled" not in population_df.columns
+
+def test_stratum_proportions():
+    sample_df = stratified_sample(_population(), 0.1, min_per_stratum = 2, seed = 0)
+    sampled = sample_df.groupby("stratum")["sampled"].agg(["size", "sum"])
+    assert sampled["size"].tolist() == [200, 60, 9, 1]
+    # 10% of each stratum, at least 2, at most all of it
+    assert sampled["sum"].tolist() == [20, 6, 2, 1]
+
+def test_full_sample_is_exact(corpus, reference):
+    engine_obj = WordSentFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], corpus["moral_dict_path"])
+    totals_df, _, strata_df = run_sample(engine_obj, fraction = 1.0, num_job = 1, n_boot = 50)
+    assert (strata_df["sampled"] == strata_df["transcripts"]).all()
+    assert strata_df["transcripts"].sum() == len(reference)
+    np.testing.assert_allclose(totals_df["estimate"].to_numpy(),
+                               reference[list(totals_df.index)].sum().to_numpy(dtype = np.float64))
+    assert (totals_df["se"] == 0).all()
+
+def test_run_sample_reproducible(corpus):
+    engine_obj = WordSentFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], corpus["moral_dict_path"])
+    first = run_sample(engine_obj, fraction = 0.3, num_job = 1, n_boot = 50, seed = 3)
+    second = run_sample(engine_obj, fraction = 0.3, num_job = 1, n_boot = 50, seed = 3)
+    for first_df, second_df in zip(first, second):
+        pd.testing.assert_frame_equal(first_df, second_df)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+count_transcripts in its two modes: the rows kept in memory and the rows
+streamed to parquet parts are the same frame, transcript_ID included, and
+streaming leaves a few parts rather than one per batch.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import pandas as pd
+from confcall.cal_wsf import WordSentFreq
+from confcall.result_sink import read_results
+from reference import assert_counts
+
+def test_memory_and_stream_match(corpus, reference):
+    engine_obj = WordSentFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], corpus["moral_dict_path"])
+    memory_df = engine_obj.threading(2, batch_size = 5)
+    assert list(memory_df.columns) == ["transcript_ID"] + engine_obj.schema.columns
+    assert_counts(memory_df, reference)
+
+    store_path = corpus["tmp_path"] + "/stream"
+    assert engine_obj.threading(2, store_path = store_path, batch_size = 5) == store_path
+    stream_df = read_results(store_path).set_index("transcript_ID", drop = False).loc[memory_df["transcript_ID"]]
+    pd.testing.assert_frame_equal(stream_df.reset_index(drop = True), memory_df)
+
+    # 36 transcripts in batches of 5 fit in one part of the sink
+    parts = [file_name for file_name in os.listdir(store_path) if file_name.endswith(".parquet")]
+    assert len(parts) == 1
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+Shard-and-merge: two local workers give the rows of a single-process run,
+and a missing shard file fails the merge.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import pandas as pd
+import pytest
+from confcall.cal_wsf import WordSentFreq
+from confcall.shards import plan_shards, run_local, merge_shards, CoverageError
+from reference import assert_counts
+
+@pytest.fixture(scope = "module")
+def sharded(corpus):
+    manifest_path = corpus["tmp_path"] + "/manifest.json"
+    shard_path = corpus["tmp_path"] + "/shards"
+    manifest = plan_shards(manifest_path, "wsf", corpus["panel_data_path"], corpus["processed_all_year_path"],
+                           corpus["moral_dict_path"], shard_size = 5)
+    return manifest, manifest_path, shard_path, run_local(manifest_path, shard_path, num_workers = 2)
+
+def test_run_local_matches_single_process(corpus, reference, sharded):
+    manifest, _, _, merged_df = sharded
+    assert len(manifest["shards"]) > 2
+    single_df = WordSentFreq(corpus["panel_data_path"], corpus["processed_all_year_path"],
+                             corpus["moral_dict_path"]).threading(1)
+    single_df = single_df.iloc[single_df["transcript_ID"].astype('int64').argsort(kind = 'stable')].reset_index(drop = True)
+    pd.testing.assert_frame_equal(merged_df, single_df)
+    assert_counts(merged_df.set_index(merged_df["transcript_ID"]).loc[list(reference.index)], reference)
+
+def test_missing_shard(sharded):
+    manifest, manifest_path, shard_path, _ = sharded
+    shard_id = manifest["shards"][1]["shard_id"]
+    os.remove(shard_path + '/' + shard_id + '.parquet')
+    with pytest.raises(CoverageError) as error:
+        merge_shards(manifest_path, shard_path)
+    assert error.value.missing_shards == [shard_id]
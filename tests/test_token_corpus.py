@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The pre-tokenized corpus: its scores equal the wf counts of the original
+code (see reference), in one chunk and in many.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import pandas as pd
+from confcall.token_corpus import tokenize_corpus, TokenCorpus
+from reference import assert_counts
+
+def test_token_corpus(corpus, reference):
+    token_path = corpus["tmp_path"] + "/tokens"
+    tokenize_corpus(corpus["processed_all_year_path"], token_path)
+    trans_ids = set(pd.read_csv(corpus["panel_data_path"])["transcript_ID"])
+    for chunk_rows in [1000000, 7]:
+        scores_df = TokenCorpus(token_path).score(corpus["moral_dict_path"], trans_ids, chunk_rows = chunk_rows)
+        assert_counts(scores_df.loc[reference.index], reference)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+TranscriptCatalog.refresh: an added, removed or re-exported transcript is
+picked up by scanning its year folder only; a talk file rewritten in
+place needs a deep refresh.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import os
+import shutil
+import pytest
+from confcall.transcript_catalog import TranscriptCatalog
+
+ADDED_ROW = 'speaker 1,Added row.,\n'
+
+@pytest.fixture
+def corpus_copy(corpus, tmp_path):
+    processed_path = str(tmp_path / "processed")
+    shutil.copytree(corpus["processed_all_year_path"], processed_path,
+                    ignore = shutil.ignore_patterns("transcript_catalog.parquet"))
+    return processed_path
+
+def _refresh(processed_path: str, deep: bool = False):
+    # a fresh catalog object, as in a new run, that records the year folders it scans
+    catalog = TranscriptCatalog(processed_path)
+    scanned = []
+    scan_year = catalog.scan_year
+    def spy(year, year_mtime_ns):
+        scanned.append(year)
+        return scan_year(year, year_mtime_ns)
+    catalog.scan_year = spy
+    return catalog.refresh(deep = deep), scanned
+
+def test_refresh_is_incremental(corpus_copy):
+    catalog, scanned = _refresh(corpus_copy)
+    years = sorted(set(catalog.catalog_df["year"]))
+    assert len(years) > 1 and sorted(scanned) == years
+    num_transcripts = len(catalog.catalog_df)
+    catalog, scanned = _refresh(corpus_copy)
+    assert scanned == [] and len(catalog.catalog_df) == num_transcripts
+
+    # add a transcript: a copy of the first one under a new ID
+    first = catalog.catalog_df.iloc[0]
+    new_folder = first["folder"].replace(str(first["transcript_ID"]), "99999999")
+    shutil.copytree(first["path"], corpus_copy + '/' + first["year"] + '/' + new_folder)
+    catalog, scanned = _refresh(corpus_copy)
+    assert scanned == [first["year"]]
+    assert len(catalog.catalog_df) == num_transcripts + 1
+    assert catalog.paths({99999999}) == [corpus_copy + '/' + first["year"] + '/' + new_folder]
+
+    # remove a transcript of another year
+    last = catalog.catalog_df.iloc[-1]
+    assert last["year"] != first["year"]
+    shutil.rmtree(last["path"])
+    catalog, scanned = _refresh(corpus_copy)
+    assert scanned == [last["year"]]
+    assert len(catalog.catalog_df) == num_transcripts
+    assert last["transcript_ID"] not in set(catalog.catalog_df["transcript_ID"])
+
+    # re-export a transcript: a new folder renamed over the old one
+    row = catalog.catalog_df.iloc[1]
+    new_path = row["path"] + '.new'
+    shutil.copytree(row["path"], new_path)
+    with open(new_path + '/ceo_talk.csv', 'a') as file:
+        file.write(ADDED_ROW)
+    shutil.rmtree(row["path"])
+    os.rename(new_path, row["path"])
+    catalog, scanned = _refresh(corpus_copy)
+    assert scanned == [row["year"]]
+    assert catalog.sizes({row["transcript_ID"]}) == [row["ceo_size"] + row["cfo_size"] + row["others_size"] + len(ADDED_ROW)]
+
+def test_in_place_edit_needs_deep(corpus_copy):
+    catalog, _ = _refresh(corpus_copy)
+    row = catalog.catalog_df.iloc[0]
+    with open(row["path"] + '/cfo_talk.csv', 'a') as file:
+        file.write(ADDED_ROW)
+    catalog, scanned = _refresh(corpus_copy)
+    assert scanned == [] and catalog.catalog_df.iloc[0]["cfo_size"] == row["cfo_size"]
+    catalog, scanned = _refresh(corpus_copy, deep = True)
+    assert len(scanned) > 1 and catalog.catalog_df.iloc[0]["cfo_size"] == row["cfo_size"] + len(ADDED_ROW)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+'''
+DESCRIPTION
+-----------
+The reader backends: pandas, csv and pyarrow give the talk rows of
+talk_slices.read_talk_rows, on the synthetic corpus and on talk files
+with NA cells and numbers-only talk_content.
+
+VERSION
+-------
+Last update: R8/10/18(Kin)
+
+'''
+import pytest
+from confcall.cal_wf import WordFreq
+from confcall.talk_slices import read_talk_rows
+from confcall.transcript_reader import TranscriptReader, BACKENDS
+
+# ceo: NA cells of several spellings; cfo: numbers only; others: quoted commas and newlines
+TALK_FILES = {"ceo_talk.csv": 'speaker,talk_content,question\n'
+                              'a,Good morning.,\n'
+                              'a,,\n'
+                              'a,NA,Q1\n'
+                              'a,n/a,\n'
+                              'a,Revenue grew.,Q2\n',
+              "cfo_talk.csv": 'speaker,talk_content,question\n'
+                              'b,1,\n'
+                              'b,2.5,Q1\n'
+                              'b,NaN,\n'
+                              'b,-3e2,Q2\n',
+              "others_talk.csv": 'speaker,talk_content,question\n'
+                                 'c,"Thanks, operator.",\n'
+                                 'c,"Two\nlines",Q\n'
+                                 'c,42 apples,\n'}
+
+@pytest.fixture(scope = "module")
+def trans_paths(corpus, tmp_path_factory):
+    engine_obj = WordFreq(corpus["panel_data_path"], corpus["processed_all_year_path"], corpus["moral_dict_path"], None)
+    edge_path = tmp_path_factory.mktemp("edge")
+    for file_name, text in TALK_FILES.items():
+        (edge_path / file_name).write_text(text)
+    return engine_obj.catalog.paths(engine_obj.trans_id_set) + [str(edge_path)]
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_backends_match_read_talk_rows(trans_paths, backend):
+    reader = TranscriptReader(backend)
+    for trans_path in trans_paths:
+        assert reader(trans_path) == read_talk_rows(trans_path)
+
+def test_edge_rows(trans_paths):
+    talk_rows = TranscriptReader("csv")(trans_paths[-1])
+    assert talk_rows == [("ceo", False, "Good morning."), ("ceo", True, "Revenue grew."),
+                         ("cfo", False, 1.0), ("cfo", True, 2.5), ("cfo", True, -300.0),
+                         ("others", False, "Thanks, operator."), ("others", True, "Two\nlines"),
+                         ("others", False, "42 apples")]